@@ -0,0 +1,462 @@
+'''
+How fast is the app at the things people do all the time?
+
+Runs the real widgets against a fake Soup session, which answers every
+request from memory with listings, threads and an inbox made out of the
+fixtures in redditisgtk/tests-data.  So the network is not measured, only
+the app.  It times:
+
+    cold_start    starting the app (imports included) until the first
+                  listing is painted in the window
+    open_thread   opening a 1000 comment thread, until it is painted and
+                  until every comment is in the list
+    scroll_thread pressing j (then k) through that thread, until each
+                  press is painted
+    page_all      pressing j through /r/all until the 6th page (so 5
+                  pages were loaded)
+    inbox         opening the inbox, until it is painted
+
+The results are printed as JSON, so they can be saved and compared
+between commits.  Cold start is only measured once, as only the first
+run in a process is cold; run the script a few times to compare it.
+
+Needs the app to be built first (see README.md), as it loads the
+resources from the build prefix, and a display (eg. xvfb-run).  The data
+dir and settings are swapped for temporary ones, so the user's read
+posts, cache and settings are not used or changed.
+
+Usage (from the top of the repo):
+
+    python3 benchmarks/bench_app.py [--runs N] [--virtual] [--latency MS]
+                                    [--output results.json]
+'''
+
+# Cold start is timed from here, so this goes before the other imports
+import time
+START = time.perf_counter()
+
+import os
+import re
+import sys
+import json
+import copy
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# Before GLib reads them
+DATA_HOME = tempfile.mkdtemp(prefix='bench-app-')
+os.environ['XDG_DATA_HOME'] = DATA_HOME
+os.environ['GSETTINGS_BACKEND'] = 'memory'
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gi.repository import Gtk
+from gi.repository import Gdk
+from gi.repository import GLib
+from gi.repository import Soup
+
+# The same modules that reddit-is-gtk imports
+from redditisgtk import main as app_main
+IMPORTED = time.perf_counter()
+
+from redditisgtk import sublistrows
+from redditisgtk.api import RedditAPI, APIFactory, AnonymousTokenManager
+from redditisgtk.comments import CommentsView, NormalCommentRow
+from redditisgtk.identity import IdentityController
+from redditisgtk.settings import get_settings, get_collapse_rule
+from redditisgtk.sublist import SubList
+from redditisgtk.gtktestutil import (with_test_mainloop, wait_for,
+                                     find_widget, get_focused, fake_event)
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'redditisgtk',
+                        'tests-data')
+# Longest to wait for anything, in seconds
+TIMEOUT = 60
+POSTS_PER_PAGE = 25
+PAGES = 6
+THREAD_COMMENTS = 1000
+INBOX_MESSAGES = 100
+BIG_THREAD_ID = 'big1k'
+
+
+def load(name: str):
+    with open(os.path.join(DATA_DIR, name + '.json')) as f:
+        return json.load(f)
+
+
+def make_listing(page: int) -> dict:
+    '''
+    A page of posts; self posts and links (with thumbnails) in turn
+    '''
+    self_post = load('comments--thread')[0]['data']['children'][0]['data']
+    link_post = load('sublistrows--thumb-from-previews')['data']
+    children = []
+    for i in range(POSTS_PER_PAGE):
+        data = copy.deepcopy(link_post if i % 2 else self_post)
+        post_id = 'p{}n{:02}'.format(page, i)
+        data.update(
+            id=post_id, name='t3_' + post_id,
+            permalink='/r/{}/comments/{}/bench/'.format(
+                data['subreddit'], post_id),
+            title='{} ({})'.format(data['title'], post_id))
+        children.append({'kind': 't3', 'data': data})
+
+    after = children[-1]['data']['name'] if page < PAGES - 1 else None
+    return {'kind': 'Listing',
+            'data': {'children': children, 'after': after, 'before': None}}
+
+
+def _rename(children: list, suffix: str) -> int:
+    '''
+    Give the comments (and replies) new names, returns how many comments
+    there are
+    '''
+    n = 0
+    for child in children:
+        data = child['data']
+        data['id'] += suffix
+        data['name'] += suffix
+        if child['kind'] != 't1':
+            continue
+        n += 1
+        if data.get('replies'):
+            n += _rename(data['replies']['data']['children'], suffix)
+    return n
+
+
+def make_big_thread() -> list:
+    '''
+    The fixture thread, repeated until it has THREAD_COMMENTS comments (or
+    a few more)
+    '''
+    thread = load('comments--thread')
+    post = thread[0]['data']['children'][0]['data']
+    post['id'] = BIG_THREAD_ID
+    post['name'] = 't3_' + BIG_THREAD_ID
+    post['permalink'] = get_big_thread_permalink()
+
+    original = thread[1]['data']['children']
+    children = []
+    n = 0
+    while n < THREAD_COMMENTS:
+        copied = copy.deepcopy(original)
+        n += _rename(copied, 'x{}'.format(len(children)))
+        children.extend(copied)
+    thread[1]['data']['children'] = children
+    post['num_comments'] = n
+    return thread
+
+
+def get_big_thread_permalink() -> str:
+    return '/r/MaliciousCompliance/comments/{}/bench/'.format(BIG_THREAD_ID)
+
+
+def make_inbox() -> dict:
+    message = load('sublistrows--pm')
+    children = []
+    for i in range(INBOX_MESSAGES):
+        child = copy.deepcopy(message)
+        child['data']['id'] = 'm{}'.format(i)
+        child['data']['name'] = 't4_m{}'.format(i)
+        children.append(child)
+    return {'kind': 'Listing',
+            'data': {'children': children, 'after': None, 'before': None}}
+
+
+class FakeSession(Soup.Session):
+    '''
+    A Soup session that answers from memory, rather than the network.
+    Answers come after `latency` ms, from the main loop (like a real
+    session).  Anything it doesn't know about gets a 404.
+    '''
+
+    def __init__(self, latency: int = 0):
+        Soup.Session.__init__(self)
+        self._latency = latency
+        # msg -> (source id, callback, user_data)
+        self._pending = {}
+        self.n_requests = 0
+        self.unserved = set()
+
+        self._listings = [json.dumps(make_listing(page)).encode('utf8')
+                          for page in range(PAGES)]
+        self._big_thread = json.dumps(make_big_thread()).encode('utf8')
+        with open(os.path.join(DATA_DIR, 'comments--thread.json'),
+                  'rb') as f:
+            self._thread = f.read()
+        self._inbox = json.dumps(make_inbox()).encode('utf8')
+
+    def route(self, path: str, query: str) -> (int, bytes):
+        if path.startswith('/message/'):
+            return 200, self._inbox
+        if '/comments/{}/'.format(BIG_THREAD_ID) in path:
+            return 200, self._big_thread
+        if '/comments/' in path:
+            return 200, self._thread
+        if path == '/' or re.match(r'^/r/[^/]+/?$', path):
+            match = re.search(r'after=t3_p(\d+)n', query or '')
+            page = int(match.group(1)) + 1 if match else 0
+            if page < PAGES:
+                return 200, self._listings[page]
+
+        self.unserved.add(path)
+        return 404, b'{"error": 404}'
+
+    def queue_message(self, msg, callback, user_data=None):
+        self.n_requests += 1
+        uri = msg.get_uri()
+
+        def respond():
+            del self._pending[msg]
+            status, body = self.route(uri.get_path(), uri.get_query())
+            msg.set_status(status)
+            msg.set_response('application/json', Soup.MemoryUse.COPY, body)
+            callback(self, msg, user_data)
+            return False
+
+        source = GLib.timeout_add(self._latency, respond)
+        self._pending[msg] = (source, callback, user_data)
+
+    def cancel_message(self, msg, status):
+        if msg not in self._pending:
+            return
+        source, callback, user_data = self._pending.pop(msg)
+        GLib.source_remove(source)
+        msg.set_status(status)
+        callback(self, msg, user_data)
+
+
+def make_window(child: Gtk.Widget) -> Gtk.Window:
+    window = Gtk.Window()
+    window.set_default_size(600, 600)
+    window.add(child)
+    child.show()
+    window.show()
+    return window
+
+
+def wait_for_paint(widget: Gtk.Widget, cond=None, action=None) -> float:
+    '''
+    Runs `action` (if given), then the main loop until the widget is
+    painted while `cond()` is true.  Returns the time of that paint.
+    '''
+    painted = []
+
+    def draw_cb(widget, cr):
+        if not painted and (cond is None or cond()):
+            painted.append(time.perf_counter())
+
+    handler = widget.connect_after('draw', draw_cb)
+    try:
+        if action is not None:
+            action()
+        wait_for(lambda: painted, timeout=TIMEOUT)
+    finally:
+        widget.disconnect(handler)
+    return painted[0]
+
+
+def press(window: Gtk.Window, widget: Gtk.Widget, keyval: int) -> float:
+    '''
+    Press a key in the window; returns when it was painted
+    '''
+    def action():
+        Gtk.test_widget_send_key(window, keyval, 0)
+        widget.queue_draw()
+    return wait_for_paint(widget, action=action)
+
+
+def has_rows(widget: Gtk.Widget, kind) -> bool:
+    return bool(find_widget(widget, kind=kind, many=True))
+
+
+def get_focused_post(window: Gtk.Window) -> dict:
+    widget = get_focused(window)
+    while widget is not None and \
+            not isinstance(widget, sublistrows.LinkRow):
+        widget = widget.get_parent()
+    return widget.data if widget is not None else None
+
+
+def bench_cold_start(session: FakeSession) -> dict:
+    start = time.perf_counter()
+    window = app_main.RedditWindow(
+        IdentityController(session), APIFactory(session))
+    sublist = window.get_sublist()
+    painted = wait_for_paint(
+        window, cond=lambda: has_rows(sublist, sublistrows.LinkRow),
+        action=window.show)
+    window.destroy()
+    return {
+        'import_ms': (IMPORTED - START) * 1000,
+        'first_paint_ms': (painted - START) * 1000,
+        'window_first_paint_ms': (painted - start) * 1000,
+    }
+
+
+def bench_thread(api: RedditAPI, keys: int) -> (dict, dict):
+    '''
+    Open the big thread, then scroll through it
+    '''
+    start = time.perf_counter()
+    cv = CommentsView(api, permalink=get_big_thread_permalink(),
+                      collapse=get_collapse_rule())
+    window = make_window(cv)
+    painted = wait_for_paint(
+        cv, cond=lambda: has_rows(cv, NormalCommentRow))
+    progress = find_widget(cv, kind=Gtk.ProgressBar)
+    wait_for(lambda: not progress.get_visible(), timeout=TIMEOUT)
+    opened = {
+        'first_paint_ms': (painted - start) * 1000,
+        'all_comments_ms': (time.perf_counter() - start) * 1000,
+    }
+
+    # The same as the tests do; the comments view handles the keys
+    # itself, where ever the focus is
+    cv.focus()
+    scrolled = {}
+    for key in 'jk':
+        times = []
+        for _ in range(keys):
+            start = time.perf_counter()
+            painted = wait_for_paint(
+                cv, action=lambda: (cv.do_event(fake_event(key)),
+                                    cv.queue_draw()))
+            times.append((painted - start) * 1000)
+        scrolled['{}_mean_ms'.format(key)] = statistics.mean(times)
+        scrolled['{}_max_ms'.format(key)] = max(times)
+
+    window.destroy()
+    return opened, scrolled
+
+
+def bench_page_all(api: RedditAPI, virtual: bool) -> dict:
+    sublist = SubList(api, '/r/all', virtual=virtual,
+                      collapse=get_collapse_rule())
+    window = make_window(sublist)
+    wait_for_paint(
+        sublist, cond=lambda: has_rows(sublist, sublistrows.LinkRow))
+    sublist.focus()
+
+    # Only the 1st post of the last page has a name ending like this
+    last_page = 't3_p{}n00'.format(PAGES - 1)
+    start = time.perf_counter()
+    keys = 0
+    while True:
+        post = get_focused_post(window)
+        if post is not None and post['name'] == last_page:
+            break
+        if time.perf_counter() - start > TIMEOUT:
+            raise AssertionError('Timeout expired')
+        # The sublist listens for keys on its list, so they have to go
+        # through the window to get there
+        press(window, sublist, Gdk.KEY_j)
+        keys += 1
+
+    total = time.perf_counter() - start
+    window.destroy()
+    return {
+        'total_ms': total * 1000,
+        'per_page_ms': total * 1000 / (PAGES - 1),
+        'keys': keys,
+    }
+
+
+def bench_inbox(api: RedditAPI, virtual: bool) -> dict:
+    start = time.perf_counter()
+    sublist = SubList(api, '/message/inbox', virtual=virtual)
+    window = make_window(sublist)
+    painted = wait_for_paint(
+        sublist, cond=lambda: has_rows(sublist, sublistrows.MessageRow))
+    window.destroy()
+    return {'first_paint_ms': (painted - start) * 1000}
+
+
+def summarize(runs: list) -> dict:
+    '''
+    Turns a list of results (of the same keys) in to the median and best
+    of each
+    '''
+    summary = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs]
+        if key.endswith('_ms'):
+            summary[key] = {'median': statistics.median(values),
+                            'min': min(values)}
+        else:
+            summary[key] = statistics.median(values)
+    return summary
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@with_test_mainloop
+def run(args) -> dict:
+    session = FakeSession(latency=args.latency)
+    get_settings()['virtual-sublist'] = args.virtual
+    results = {'cold_start': bench_cold_start(session)}
+
+    def make_api():
+        # A new one each time, so nothing is in its response cache
+        return RedditAPI(session, AnonymousTokenManager())
+
+    runs = {'open_thread': [], 'scroll_thread': [], 'page_all': [],
+            'inbox': []}
+    for _ in range(args.runs):
+        opened, scrolled = bench_thread(make_api(), args.keys)
+        runs['open_thread'].append(opened)
+        runs['scroll_thread'].append(scrolled)
+        runs['page_all'].append(bench_page_all(make_api(), args.virtual))
+        runs['inbox'].append(bench_inbox(make_api(), args.virtual))
+    for name, values in runs.items():
+        results[name] = summarize(values)
+
+    return {
+        'commit': get_commit(),
+        'runs': args.runs,
+        'virtual': args.virtual,
+        'latency_ms': args.latency,
+        'requests': session.n_requests,
+        # Eg. thumbnails; they get a 404, so nobody waits for them
+        'unserved': sorted(session.unserved),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--keys', type=int, default=100,
+                        help='times to press j (and k) in the thread')
+    parser.add_argument('--virtual', action='store_true',
+                        help='use the virtual sublist')
+    parser.add_argument('--latency', type=int, default=0,
+                        help='ms before the fake session answers')
+    parser.add_argument('--output', help='also write the results here')
+    args = parser.parse_args()
+
+    try:
+        results = run(args)
+    finally:
+        shutil.rmtree(DATA_HOME, ignore_errors=True)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+'''
+How long does decoding a big comment thread block the main loop for?
+
+Runs a 1ms heartbeat on a GLib main loop, and measures the longest gap
+between beats while the thread is decoded, either inline (how
+RedditAPI used to do it) or with `workers.decode_json_async`.
+
+Usage (from the top of the repo):
+
+    python3 benchmarks/bench_decode.py [--copies N]
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gi.repository import GLib
+
+from redditisgtk import workers
+
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'redditisgtk',
+                       'tests-data', 'comments--thread.json')
+
+
+def load_fixture(copies: int) -> bytes:
+    with open(FIXTURE) as f:
+        thread = json.load(f)
+    # Repeat the thread to get to the size of a big (500+ comment) thread
+    return bytes(json.dumps([thread] * copies), 'utf8')
+
+
+def measure(data: bytes, decode) -> dict:
+    '''
+    Returns the longest main loop stall and the total time for the
+    decoded json to reach the callback, in milliseconds
+    '''
+    loop = GLib.MainLoop()
+    beats = []
+    result = {}
+
+    def beat_cb():
+        beats.append(time.perf_counter())
+        return True
+
+    def done_cb(j):
+        result['total'] = time.perf_counter() - start
+        loop.quit()
+
+    def start_cb():
+        nonlocal start
+        start = time.perf_counter()
+        beats.append(start)
+        decode(data, done_cb)
+        return False
+
+    start = None
+    beat_id = GLib.timeout_add(1, beat_cb)
+    GLib.timeout_add(50, start_cb)
+    loop.run()
+    GLib.source_remove(beat_id)
+
+    beats.append(time.perf_counter())
+    beats = [b for b in beats if b >= start]
+    gaps = [b - a for a, b in zip(beats, beats[1:])]
+    return {
+        'max_stall_ms': max(gaps) * 1000,
+        'total_ms': result['total'] * 1000,
+    }
+
+
+def decode_inline(data, callback):
+    callback(json.loads(str(data, 'utf8')))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--copies', type=int, default=20,
+                        help='times to repeat the fixture thread')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    data = load_fixture(args.copies)
+    print('Decoding {:.1f} MB of json'.format(len(data) / 1024 / 1024))
+    for name, decode in [('inline', decode_inline),
+                         ('worker', workers.decode_json_async)]:
+        runs = [measure(data, decode) for _ in range(args.runs)]
+        print('{:>8}: max main loop stall {:7.1f}ms, total {:7.1f}ms'.format(
+            name,
+            max(r['max_stall_ms'] for r in runs),
+            min(r['total_ms'] for r in runs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+'''
+How much does the plain text fast path in newmarkdown save?
+
+Turns every comment in the fixture thread in to widgets, with and
+without the fast path, and counts the widgets that were made.  The
+cache is not used, so every run parses the html.
+
+Usage (from the top of the repo):
+
+    python3 benchmarks/bench_markdown.py [--runs N] [--file comments.json]
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gi.repository import Gtk
+
+from redditisgtk import newmarkdown
+
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'redditisgtk',
+                       'tests-data', 'comments--thread.json')
+
+
+def load_bodies(path: str) -> list:
+    with open(path) as f:
+        thread = json.load(f)
+
+    bodies = []
+    def walk(children):
+        for child in children:
+            if child['kind'] != 't1':
+                continue
+            bodies.append(child['data']['body_html'])
+            replies = child['data'].get('replies')
+            if replies:
+                walk(replies['data']['children'])
+    walk(thread[1]['data']['children'])
+    return bodies
+
+
+def count_widgets(block: newmarkdown.Block) -> int:
+    return 1 + sum(count_widgets(child) for child in block.children)
+
+
+def measure(bodies: list, fast_path: bool, runs: int) -> dict:
+    best_parse = best_build = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        blocks = [newmarkdown.parse_html(body, fast_path=fast_path)
+                  for body in bodies]
+        parsed = time.perf_counter()
+        widgets = [newmarkdown.build_widget(block) for block in blocks]
+        built = time.perf_counter()
+        for widget in widgets:
+            widget.destroy()
+
+        parse, build = parsed - start, built - parsed
+        best_parse = parse if best_parse is None else min(best_parse, parse)
+        best_build = build if best_build is None else min(best_build, build)
+
+    return {
+        'parse_ms': best_parse * 1000,
+        'build_ms': best_build * 1000,
+        'widgets': sum(count_widgets(block) for block in blocks),
+        'fast': sum(block.kind == 'markup' for block in blocks),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--file', default=FIXTURE,
+                        help='comments page json, like the fixture')
+    args = parser.parse_args()
+
+    bodies = load_bodies(args.file)
+    print('{} comments'.format(len(bodies)))
+    results = {}
+    for name, fast_path in [('slow', False), ('fast', True)]:
+        r = results[name] = measure(bodies, fast_path, args.runs)
+        print('{:>6}: parse {:7.1f}ms, build {:7.1f}ms, '
+              '{:5} widgets, {:4} one label comments'.format(
+                  name, r['parse_ms'], r['build_ms'], r['widgets'],
+                  r['fast']))
+
+    slow, fast = results['slow'], results['fast']
+    print('speedup: parse {:.1f}x, build {:.1f}x, {} fewer widgets'.format(
+        slow['parse_ms'] / fast['parse_ms'],
+        slow['build_ms'] / fast['build_ms'],
+        slow['widgets'] - fast['widgets']))
+
+
+if __name__ == '__main__':
+    main()
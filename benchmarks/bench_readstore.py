@@ -0,0 +1,120 @@
+'''
+How long does it take to load the read posts, and how much memory do they
+use?
+
+Writes a journal with lots of reads (1M by default) to a temporary file,
+then loads it in to a `ReadController`, and in to a python set of the
+names (how the read posts used to be kept) to compare.
+
+Usage (from the top of the repo):
+
+    python3 benchmarks/bench_readstore.py [--entries N] [--appended 0.2]
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from redditisgtk import readcontroller
+
+
+def base36(n: int) -> str:
+    digits = []
+    while True:
+        n, digit = divmod(n, 36)
+        digits.append('0123456789abcdefghijklmnopqrstuvwxyz'[digit])
+        if n == 0:
+            return ''.join(reversed(digits))
+
+
+def write_journal(path: str, entries: int, appended: float,
+                  now: int) -> list:
+    '''
+    Reads from the last year, of posts with 7 digit ids like today's.
+
+    Like a real journal, most of it was written by the last compaction
+    (so is sorted), and the rest was appended since.
+    '''
+    rand = random.Random(1)
+    items = [('t3_' + base36(rand.randrange(36 ** 6, 36 ** 7)),
+              now - rand.randrange(365 * 86400))
+             for _ in range(entries)]
+    n_compacted = int(entries * (1 - appended))
+
+    compacted = readcontroller.ReadSet()
+    compacted.update(items[:n_compacted])
+    os.replace(readcontroller._write_journal(path, compacted), path)
+    with open(path, 'a') as f:
+        f.write(''.join(readcontroller._format_line(*item)
+                        for item in items[n_compacted:]))
+    return [name for name, _ in items]
+
+
+def measure(name: str, load):
+    # tracemalloc slows down allocating a lot, so time it on its own
+    start = time.perf_counter()
+    load()
+    total = time.perf_counter() - start
+
+    tracemalloc.start()
+    result = load()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{:>14}: load {:7.0f}ms, {:6.1f} MB kept, {:6.1f} MB peak'.format(
+        name, total * 1000, current / 1024 / 1024, peak / 1024 / 1024))
+    return result
+
+
+def load_set(path: str) -> set:
+    with open(path) as f:
+        return set(line.split(' ', 1)[0] for line in f)
+
+
+def time_lookups(name: str, is_read, names: list):
+    start = time.perf_counter()
+    for n in names:
+        is_read(n)
+    total = time.perf_counter() - start
+    print('{:>14}: {:.2f}us a lookup'.format(
+        name, total * 1000 * 1000 / len(names)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=1000 * 1000)
+    parser.add_argument('--appended', type=float, default=0.2,
+                        help='fraction of the journal since the compaction')
+    args = parser.parse_args()
+
+    now = int(time.time())
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'read')
+        names = write_journal(path, args.entries, args.appended, now)
+        print('{} reads, {:.1f} MB journal'.format(
+            args.entries, os.path.getsize(path) / 1024 / 1024))
+
+        def load_controller(max_age):
+            return readcontroller.ReadController(
+                data_path=path, max_age=max_age, timeout_add=MagicMock(),
+                run_in_thread=MagicMock())
+
+        names_set = measure('set', lambda: load_set(path))
+        ctrl = measure('ReadSet', lambda: load_controller(0))
+        expired = measure('ReadSet 180d', lambda: load_controller(
+            readcontroller.DEFAULT_MAX_AGE))
+
+        sample = random.Random(2).sample(names, min(len(names), 100000))
+        time_lookups('set', names_set.__contains__, sample)
+        time_lookups('ReadSet', ctrl.is_read, sample)
+        time_lookups('ReadSet 180d', expired.is_read, sample)
+
+
+if __name__ == '__main__':
+    main()
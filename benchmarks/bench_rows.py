@@ -0,0 +1,81 @@
+'''
+How long does it take to make rows?
+
+Makes 1000 of each kind of row (LinkRow, MessageRow and PostTopBar), and
+also times just building the .ui file with Gtk.Builder vs the UIFactory.
+
+Needs the app to be built first (see README.md), as it loads the
+resources from the build prefix.
+
+Usage (from the top of the repo):
+
+    python3 benchmarks/bench_rows.py [--rows N]
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gi.repository import Gtk
+from gi.repository import Gio
+
+from redditisgtk import sublistrows
+from redditisgtk import posttopbar
+from redditisgtk.uifactory import get_factory
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'redditisgtk',
+                        'tests-data')
+RESOURCES = os.path.join(os.path.dirname(__file__), '..', '__build_prefix',
+                         'share', 'something-for-reddit',
+                         'reddit-is-gtk.gresource')
+
+
+def load(name: str) -> dict:
+    with open(os.path.join(DATA_DIR, name + '.json')) as f:
+        return json.load(f)
+
+
+def timeit(name: str, func, n: int):
+    start = time.perf_counter()
+    for _ in range(n):
+        widget = func()
+        if isinstance(widget, Gtk.Widget):
+            widget.destroy()
+    total = time.perf_counter() - start
+    print('{:>28}: {:8.1f}ms total, {:6.3f}ms each'.format(
+        name, total * 1000, total * 1000 / n))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    Gio.Resource._register(Gio.resource_load(RESOURCES))
+    api = MagicMock()
+    link = load('sublistrows--thumb-from-previews')
+    message = load('sublistrows--pm')
+    post = load('posttopbar--post')
+
+    for ui in ['row-link', 'row-comment', 'post-top-bar']:
+        path = '/today/sam/reddit-is-gtk/{}.ui'.format(ui)
+        timeit('{} Gtk.Builder'.format(ui),
+               lambda: Gtk.Builder.new_from_resource(path), args.rows)
+        timeit('{} UIFactory'.format(ui),
+               lambda: get_factory(path).build(), args.rows)
+
+    timeit('LinkRow', lambda: sublistrows.LinkRow(api, link), args.rows)
+    timeit('MessageRow', lambda: sublistrows.MessageRow(api, message),
+           args.rows)
+    timeit('PostTopBar',
+           lambda: posttopbar.PostTopBar(api, post, MagicMock()), args.rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -26,12 +26,18 @@ import typing
 from gi.repository import Soup
 from gi.repository import GLib
 from gi.repository import GObject
-from gi.repository import GdkPixbuf
+
+from redditisgtk import httpcache
+from redditisgtk import workers
+from redditisgtk.imagecache import ImageCache, ImageTicket
+from redditisgtk.scheduler import RequestScheduler
 
 # VERSION:
 USER_AGENT = 'GNU:something-for-reddit:v0.2.2 (by /u/samtoday)'
 PREPEND_SUBS = ['/', '/r/all', '/message/inbox']
 DEFAULT_SUBS = ['/r/gnome', '/r/gnu+linux']
+# Refresh OAuth tokens this long before reddit says they expire, in seconds
+TOKEN_REFRESH_MARGIN = 60
 SPECIAL_SUBS = [
     '/message/inbox', '/message/unread', '/message/sent',
     '/user/USER/overview', '/user/USER/submitted', '/user/USER/commented',
@@ -42,6 +48,10 @@ SORTING_TIMES = [
     'hour', 'day', 'week', 'month', 'year', 'all'
 ]
 DEBUG = 'REDDIT_IS_GTK_DEBUG' in os.environ
+# Listings that change when you (un)subscribe from things
+FRONTPAGE_PATHS = [
+    '', '/best', '/hot', '/new', '/rising', '/controversial', '/top'
+]
 
 
 # macro from
@@ -80,16 +90,28 @@ class TokenManager(GObject.GObject):
     value_changed = GObject.Signal('value-changed')
     user_name = None
     is_anonymous = False
+    # Stays the same for the life of the account, unlike the user name
+    # (which is unknown until whoami returns)
+    cache_id = None
 
     def __init__(self):
         super().__init__()
 
-    def refresh(self, done_callback: typing.Callable[[], typing.Any]):
+    def refresh(self, done_callback: typing.Callable[[], typing.Any],
+                failed_callback: typing.Callable[[], typing.Any] = None):
         '''
-        Request a refresh of the token, if applicable to this type of account
+        Request a refresh of the token, if applicable to this type of account.
+        If it fails, failed_callback is called instead of done_callback
         '''
         raise NotImplementedError()
 
+    def needs_refresh(self) -> bool:
+        '''
+        Returns True if the token has expired (or is just about to), so it
+        should be refreshed before it is used for a request
+        '''
+        return False
+
     def wrap_path(self, path: str) -> str:
         '''
         Take a path and put the domain part in front of it
@@ -110,8 +132,9 @@ class TokenManager(GObject.GObject):
 class AnonymousTokenManager(TokenManager):
     user_name = 'Anonymous'
     is_anonymous = True
+    cache_id = 'anonymous'
 
-    def refresh(self, done_callback):
+    def refresh(self, done_callback, failed_callback=None):
         done_callback()
 
     def wrap_path(self, path: str) -> str:
@@ -122,14 +145,30 @@ class AnonymousTokenManager(TokenManager):
 
 
 class OAuthTokenManager(TokenManager):
+    '''
+    Token for a logged in account.  The token is refreshed a little before
+    it expires, and only one refresh is ever in flight; anybody who asks
+    for a refresh while it is happening is called back when it is done.
+    '''
 
     def __init__(
             self, session: Soup.Session,
             token: dict = None, code: str = None,
-            ready_callback: typing.Callable[[], typing.Any] = None):
+            ready_callback: typing.Callable[[], typing.Any] = None,
+            time_func: typing.Callable[[], float] = time.time,
+            timeout_add_seconds=GLib.timeout_add_seconds,
+            account_id: str = None):
         super().__init__()
         self._token = token or {}
+        self._account_id = account_id
         self._session = session
+        self._time = time_func
+        self._timeout_add_seconds = timeout_add_seconds
+        # (done, failed) callbacks waiting for the refresh in flight, None if
+        # there isn't one
+        self._refresh_callbacks = None
+        # Bumped every time the timer is scheduled, so old timers do nothing
+        self._timer_generation = 0
         if code is not None:
             self._call_access_token(dict(
                 code=code,
@@ -164,12 +203,19 @@ class OAuthTokenManager(TokenManager):
             print(data,
                   msg.props.status_code,
                   describe_soup_transport_error(msg.props.status_code, msg))
+            # Everybody waiting gives up; the next request will try again
+            waiting = self._refresh_callbacks or []
+            self._refresh_callbacks = None
+            for _, failed_callback in waiting:
+                if failed_callback is not None:
+                    failed_callback()
             return
 
         # We must keep some things we only get the 1st time, eg.
         # the refresh token
         self._token.update(json.loads(data))
-        self._token['time'] = time.time()
+        self._token['time'] = self._time()
+        self._schedule_refresh()
 
         self.value_changed.emit()
 
@@ -184,13 +230,58 @@ class OAuthTokenManager(TokenManager):
     def user_name(self):
         return self._token.get('username', '**loading username**')
 
-    def refresh(self, done_callback):
+    @property
+    def cache_id(self):
+        if self._account_id is not None:
+            return self._account_id
+        return 'token-{}'.format(id(self))
+
+    def refresh(self, done_callback, failed_callback=None):
+        if self._refresh_callbacks is not None:
+            self._refresh_callbacks.append((done_callback, failed_callback))
+            return
+
+        self._refresh_callbacks = [(done_callback, failed_callback)]
         self._call_access_token(
             dict(
                 grant_type='refresh_token',
                 refresh_token=self._token['refresh_token'],
             ),
-            callback=done_callback)
+            callback=self.__refreshed_cb)
+
+    def __refreshed_cb(self):
+        callbacks = self._refresh_callbacks or []
+        self._refresh_callbacks = None
+        for callback, _ in callbacks:
+            if callback is not None:
+                callback()
+
+    def _expires_at(self) -> typing.Optional[float]:
+        if 'time' not in self._token or 'expires_in' not in self._token:
+            return None
+        return self._token['time'] + self._token['expires_in']
+
+    def needs_refresh(self):
+        expires_at = self._expires_at()
+        if expires_at is None or 'refresh_token' not in self._token:
+            return False
+        return self._time() >= expires_at - TOKEN_REFRESH_MARGIN
+
+    def _schedule_refresh(self):
+        expires_at = self._expires_at()
+        if expires_at is None or 'refresh_token' not in self._token:
+            return
+
+        self._timer_generation += 1
+        delay = expires_at - TOKEN_REFRESH_MARGIN - self._time()
+        self._timeout_add_seconds(
+            max(1, int(delay)), self.__refresh_timer_cb,
+            self._timer_generation)
+
+    def __refresh_timer_cb(self, generation):
+        if generation == self._timer_generation:
+            self.refresh(None)
+        return False
 
     def wrap_path(self, path: str) -> str:
         return 'https://oauth.reddit.com' + path
@@ -205,6 +296,53 @@ class OAuthTokenManager(TokenManager):
         return self._token
 
 
+class RequestTicket():
+    '''
+    Represents a single call to `RedditAPI.send_request`.  Many tickets can
+    share the same message on the wire.
+    '''
+
+    def __init__(self, args: tuple):
+        # The arguments to send_request, can be passed to resend_message
+        self.args = args
+        # The body the callback was given from the cache, if any
+        self.stale_body = None
+        self.flight = None
+        self.cancelled = False
+        self.got_response = False
+        # Don't tell the user when it fails, see `send_request`
+        self.background = False
+        # Bytes in the body the callback was last given, eg. to decide
+        # whether the json is worth keeping around
+        self.body_size = None
+
+
+class _InFlightRequest():
+    '''
+    A message that is on the wire, and the tickets waiting for it
+    '''
+
+    def __init__(self, key: tuple):
+        # None until it is sent, eg. while waiting for a token refresh
+        self.msg = None
+        self.key = key
+        self.tickets = []
+        # The 1st prepare function that a ticket asked for
+        self.prepare = None
+        # The tickets that were waiting when the response arrived
+        self.tickets_done = []
+
+    def join(self, ticket: RequestTicket, prepare=None):
+        ticket.flight = self
+        self.tickets.append(ticket)
+        if self.prepare is None:
+            self.prepare = prepare
+
+    def leave(self, ticket: RequestTicket):
+        ticket.flight = None
+        self.tickets.remove(ticket)
+
+
 class RedditAPI(GObject.GObject):
 
     subs_changed = GObject.Signal('subs-changed')
@@ -223,17 +361,28 @@ class RedditAPI(GObject.GObject):
     '''
     request_failed = GObject.Signal('request-failed', arg_types=[object, str])
 
-    def __init__(self, session: Soup.Session, token: TokenManager):
+    def __init__(self, session: Soup.Session, token: TokenManager,
+                 disk_cache: httpcache.DiskCache = None,
+                 image_cache: ImageCache = None):
         '''
         Args:
             session (Soup.Session): dependency
             token (TokenManager): token to use
+            disk_cache (httpcache.DiskCache): where to keep responses
+                across restarts, optional
+            image_cache (ImageCache): where to get thumbnails from, so it
+                can be shared between accounts; optional
         '''
         GObject.GObject.__init__(self)
         self._token = token
+        self._cache = httpcache.ResponseCache(disk=disk_cache)
+        self._images = image_cache or ImageCache(session)
+        # (method, url, handle_errors) -> _InFlightRequest, for GETs
+        self._in_flight = {}
 
         self.session = session
         self.session.props.user_agent = USER_AGENT
+        self._scheduler = RequestScheduler(self.session)
 
         if self._token.is_anonymous:
             self.user_changed.emit()
@@ -285,7 +434,10 @@ class RedditAPI(GObject.GObject):
         self.send_request(*message)
 
     def send_request(self, method, path, callback, post_data=None,
-                     handle_errors=True, user_data=None):
+                     handle_errors=True, user_data=None, cache=True,
+                     revalidate=False,
+                     priority=Soup.MessagePriority.NORMAL, prepare=None,
+                     background=False):
         '''
         Send a request to the reddit api
 
@@ -300,12 +452,120 @@ class RedditAPI(GObject.GObject):
             handle_errors (bool):  if True, reddit api errors will be processed
                 automatically rather than going to the callback
             user_data (object):  user data to pass to the callback (optional)
+            cache (bool):  if False, a GET will always go to the network,
+                rather than using a fresh cached response
+            revalidate (bool):  if True, a stale cached response will be
+                given to the callback straight away.  The callback will be
+                called a 2nd time if the network returns something different.
+                Only use this if your callback can handle that!
+            priority (Soup.MessagePriority):  how soon this should be sent
+                compared to other requests, when we are being rate limited
+            prepare (function):  called with the response json on a worker
+                thread, as soon as it is decoded (see
+                `workers.decode_json_async`).  Use it to get ready to show
+                the response; it must not change the json.  It is not kept
+                when the message is resent
+            background (bool):  if True, this is a request that the user
+                didn't ask for (eg. a prefetch), so request-failed is not
+                emitted when it fails.  It is not kept when resent either
+
+        Returns a `RequestTicket` that can be passed to `cancel`.  If an
+        identical GET is already in flight, the callback will share that
+        response rather than sending another request.
+
+        The callback is always called on the main thread, but big
+        responses are decoded on a worker thread first.
         '''
         if DEBUG:
             print(method, path)
         using_oauth = self._token is not None
-        my_args = (method, path, callback, post_data, handle_errors, user_data)
+        my_args = (method, path, callback, post_data, handle_errors, user_data,
+                   cache, revalidate, priority)
+
+        url = self._get_url(path)
+        ticket = RequestTicket(my_args)
+        ticket.background = background
+        if method == 'GET' and cache:
+            entry = self._cache.lookup(self._cache_key(method, url))
+            if entry is not None and self._cache.is_fresh(entry):
+                if DEBUG:
+                    print('> CACHED', method, path)
+                ticket.body_size = len(entry.body)
+                workers.decode_json_async(
+                    entry.body, self.__cached_decoded_cb, ticket,
+                    prepare=prepare)
+                return ticket
+            if entry is not None and revalidate:
+                if DEBUG:
+                    print('> STALE', method, path)
+                ticket.stale_body = entry.body
+                ticket.body_size = len(entry.body)
+                workers.decode_json_async(
+                    entry.body, self.__cached_decoded_cb, ticket,
+                    prepare=prepare)
+
+        flight_key = (method, url, handle_errors)
+        if method == 'GET' and flight_key in self._in_flight:
+            # Somebody already asked for this, so just wait for their
+            # response rather than sending it again
+            if DEBUG:
+                print('> JOINED', method, path)
+            flight = self._in_flight[flight_key]
+            flight.join(ticket, prepare)
+            if flight.msg is not None:
+                # Eg. the user opened a post that was being prefetched, so
+                # it shouldn't wait behind the other prefetches any more
+                self._scheduler.raise_priority(flight.msg, priority)
+            return ticket
+
+        flight = _InFlightRequest(flight_key)
+        flight.join(ticket, prepare)
+        if method == 'GET':
+            self._in_flight[flight_key] = flight
+        if self._token.needs_refresh():
+            # Rather than sending it off to get a 401, hold it until the
+            # new token arrives
+            if DEBUG:
+                print('> HOLD', method, path)
+            self._token.refresh(
+                lambda: self._send_flight(flight, post_data, priority),
+                failed_callback=lambda: self._fail_flight(
+                    flight, 'Could not refresh the login token'))
+        else:
+            self._send_flight(flight, post_data, priority)
+        return ticket
+
+    def _send_flight(self, flight, post_data, priority):
+        if not flight.tickets:
+            # Everybody cancelled while it was held
+            return
 
+        method, url, _ = flight.key
+        msg = Soup.Message.new(method, url)
+        if post_data is not None:
+            msg.set_request(
+                'application/x-www-form-urlencoded',
+                Soup.MemoryUse.COPY,
+                bytes(urllib.parse.urlencode(post_data), 'utf8'))
+        self._token.add_message_headers(msg)
+
+        flight.msg = msg
+        self._scheduler.queue(msg, self.__message_done_cb, flight,
+                              priority=priority)
+
+    def _fail_flight(self, flight: _InFlightRequest, issue: str):
+        '''
+        Give up on a flight that was never sent
+        '''
+        if self._in_flight.get(flight.key) is flight:
+            del self._in_flight[flight.key]
+        tickets = list(flight.tickets)
+        for ticket in tickets:
+            ticket.flight = None
+        flight.tickets = []
+        self._report_failure(tickets, issue)
+
+    def _get_url(self, path: str) -> str:
         if path[0] != '/':
             path = '/' + path
 
@@ -313,54 +573,115 @@ class RedditAPI(GObject.GObject):
             path = path + '&raw_json=1'
         else:
             path = path + '?raw_json=1'
+        return self._token.wrap_path(path)
 
-        msg = Soup.Message.new(method, self._token.wrap_path(path))
-        if post_data is not None:
-            msg.set_request(
-                'application/x-www-form-urlencoded',
-                Soup.MemoryUse.COPY,
-                bytes(urllib.parse.urlencode(post_data), 'utf8'))
-        self._token.add_message_headers(msg)
-        self.session.queue_message(msg, self.__message_done_cb, my_args)
-        return msg
+    def _cache_key(self, method, url):
+        return (self._token.cache_id, method, url)
+
+    def get_cached_body(self, path: str) -> typing.Optional[bytes]:
+        '''
+        Returns the cached response body for a GET of the path, if there
+        is one; eg. to keep it with the session
+        '''
+        entry = self._cache.lookup(self._cache_key('GET', self._get_url(path)))
+        return entry.body if entry is not None else None
+
+    def restore_cached_body(self, path: str, body: bytes):
+        '''
+        Put a body from `get_cached_body` back in the cache.  It is shown
+        by the next GET of the path (with revalidate), however old it is
+        '''
+        self._cache.restore(
+            self._cache_key('GET', self._get_url(path)), path, body)
+
+    def __cached_decoded_cb(self, j, ticket):
+        if ticket.cancelled or ticket.got_response:
+            # Don't replace the network response with an older version
+            return
+        _, _, callback, _, _, user_data, _, _, _ = ticket.args
+        self._deliver(j, callback, user_data)
+
+    def _deliver(self, j, callback, user_data):
+        if callback is not None:
+            if user_data is not None:
+                callback(j, user_data)
+            else:
+                callback(j)
 
-    def __message_done_cb(self, session, msg, my_args):
-        method, path, callback, post_data, handle_errors, user_data = my_args
+    def __message_done_cb(self, session, msg, flight):
+        if self._in_flight.get(flight.key) is flight:
+            del self._in_flight[flight.key]
+
+        method, url, handle_errors = flight.key
+        tickets = list(flight.tickets)
+        for ticket in tickets:
+            ticket.flight = None
+        flight.tickets_done = tickets
         if DEBUG:
-            print('> DONE', method, path)
+            print('> DONE', method, url, len(tickets),
+                  self._scheduler.get_stats())
         if msg.props.status_code == Soup.Status.CANCELLED:
             return
         if SOUP_STATUS_IS_TRANSPORT_ERROR(msg.props.status_code):
-            self.request_failed.emit(
-                my_args, describe_soup_transport_error(msg.props.status_code,
-                                                       msg))
+            self._report_failure(
+                tickets,
+                describe_soup_transport_error(msg.props.status_code, msg))
             return
 
         data = msg.props.response_body.flatten().get_data()
         if not data:
-            self.request_failed.emit(
-                my_args,
+            self._report_failure(
+                tickets,
                 'No response body, status {}'.format(msg.props.status_code))
+            return
+
+        # Big responses (eg. comment threads) are decoded on a thread
+        workers.decode_json_async(data, self.__decoded_cb, flight, data,
+                                  prepare=flight.prepare)
 
-        j = json.loads(str(data, 'utf8'))
+    def __decoded_cb(self, j, flight, data):
+        method, url, handle_errors = flight.key
+        tickets = [t for t in flight.tickets_done if not t.cancelled]
         if ('error' in j) and handle_errors:
             if DEBUG:
                 print(j)
             if j['error'] == 401:
                 def callback():
-                    self.resend_message(my_args)
-                self._token.refresh(callback)
+                    for ticket in tickets:
+                        self.resend_message(ticket.args)
+                self._token.refresh(
+                    callback, failed_callback=lambda: self._report_failure(
+                        tickets, 'Could not refresh the login token'))
                 return
 
-            self.request_failed.emit(
-                my_args, 'Reddit Error: {}'.format(j['error']))
+            self._report_failure(
+                tickets, 'Reddit Error: {}'.format(j['error']))
             return
 
-        if callback is not None:
-            if user_data is not None:
-                callback(j, user_data)
-            else:
-                callback(j)
+        if method == 'GET' and 'error' not in j:
+            path = flight.tickets_done[0].args[1]
+            self._cache.store(self._cache_key(method, url), path, data)
+
+        first = True
+        for ticket in tickets:
+            ticket.got_response = True
+            if ticket.cancelled or ticket.stale_body == data:
+                # Either it was cancelled by an earlier callback, or the
+                # callback already has this exact data
+                continue
+            if not first:
+                # Everybody gets their own copy, as the views mutate it
+                j = json.loads(str(data, 'utf8'))
+            first = False
+            ticket.body_size = len(data)
+            _, _, callback, _, _, user_data, _, _, _ = ticket.args
+            self._deliver(j, callback, user_data)
+
+    def _report_failure(self, tickets: typing.List[RequestTicket],
+                        issue: str):
+        for ticket in tickets:
+            if not ticket.background:
+                self.request_failed.emit(ticket.args, issue)
 
     def get_subreddit_info(self, subreddit_name, callback):
         '''
@@ -381,7 +702,9 @@ class RedditAPI(GObject.GObject):
         return self.send_request(
             'GET', '/user/{}/about'.format(name), callback)
 
-    def get_list(self, sub, callback):
+    def get_list(self, sub, callback, revalidate=False,
+                 priority=Soup.MessagePriority.HIGH, prepare=None,
+                 background=False):
         '''
         Get a list of posts from a subreddit, formatted like:
 
@@ -389,10 +712,16 @@ class RedditAPI(GObject.GObject):
             /r/all
             /r/frontpage
             /r/funny  (note the implicit boolean NOT operator)
+
+        If revalidate is True, the callback may be called twice; see
+        `send_request` (which also explains prepare and background)
         '''
-        return self.send_request('GET', sub, callback)
+        return self.send_request('GET', sub, callback, revalidate=revalidate,
+                                 priority=priority, prepare=prepare,
+                                 background=background)
 
     def vote(self, thing_id, direction):
+        self._cache.invalidate_containing(thing_id)
         return self.send_request('POST', '/api/vote', None,
                                  post_data={'id': thing_id, 'dir': direction})
 
@@ -405,11 +734,20 @@ class RedditAPI(GObject.GObject):
             callback (def(json_decoded_data))
         '''
         action = 'sub' if subscribed else 'unsub'
+        about_path = '/r/{}/about'.format(subreddit_name.lower())
+
+        def affected(path):
+            path = path.split('?')[0].rstrip('/').lower()
+            return (path.startswith('/subreddits/mine')
+                    or path == about_path
+                    or path in FRONTPAGE_PATHS)
+        self._cache.invalidate_paths(affected)
         return self.send_request(
             'POST', '/api/subscribe', callback,
             post_data={'sr_name': subreddit_name, 'action': action})
 
     def reply(self, thing_id, text, callback):
+        self._cache.invalidate_containing(thing_id)
         return self.send_request('POST', '/api/comment', callback,
                                  post_data={'thing_id': thing_id,
                                             'text': text,
@@ -417,6 +755,8 @@ class RedditAPI(GObject.GObject):
 
     def set_saved(self, thing_id, new_value, callback):
         uri = '/api/save' if new_value else '/api/unsave'
+        self._cache.invalidate_containing(thing_id)
+        self._cache.invalidate_paths(lambda path: '/saved' in path)
         return self.send_request('POST', uri, callback,
                                  post_data={'id': thing_id})
 
@@ -425,8 +765,32 @@ class RedditAPI(GObject.GObject):
         return self.send_request('POST', '/api/submit', callback,
                                  post_data=data, handle_errors=False)
 
-    def cancel(self, message):
-        self.session.cancel_message(message, Soup.Status.CANCELLED)
+    def cancel(self, ticket: typing.Union['RequestTicket', ImageTicket]):
+        '''
+        Stop the callback for a request from being called.  The request is
+        only cancelled on the network once nobody else is waiting for it.
+        '''
+        if isinstance(ticket, ImageTicket):
+            self._images.cancel(ticket)
+            return
+
+        ticket.cancelled = True
+        flight = ticket.flight
+        if flight is None:
+            return
+        flight.leave(ticket)
+        if not flight.tickets:
+            if self._in_flight.get(flight.key) is flight:
+                del self._in_flight[flight.key]
+            if flight.msg is not None:
+                self._scheduler.cancel(flight.msg)
+
+    def get_scheduler_stats(self) -> dict:
+        '''
+        Returns the queue depth, wait times and rate limit budget of
+        the request scheduler, for debugging
+        '''
+        return self._scheduler.get_stats()
 
     def read_message(self, name):
         return self.send_request('POST', '/api/read_message', None,
@@ -491,25 +855,22 @@ class RedditAPI(GObject.GObject):
                     # print('Popping stack')
         callback(new_comments)
 
-    def download_thumb(self, url, callback):
+    def download_thumb(self, url, callback, max_width=None, max_height=None):
         '''
         Args:
             url (str)
             callback (function) - takes Gtk.Pixbuf
+
+        Kwargs:
+            max_width, max_height (int):  size to scale the image down to,
+                if it is bigger
+
+        Returns a ticket that can be passed to `cancel`
         '''
-        msg = Soup.Message.new('GET', url)
-        msg.props.priority = Soup.MessagePriority.LOW
-        return self.session.queue_message(msg, self.__dl_thumb_cb, callback)
+        return self._images.get(url, callback, max_width, max_height)
 
-    def __dl_thumb_cb(self, session, msg, callback):
-        pbl = GdkPixbuf.PixbufLoader()
-        try:
-            pbl.write(msg.props.response_body.flatten().get_data())
-        except GLib.Error as e:
-            print(e)
-            pass
-        pbl.close()
-        callback(pbl.get_pixbuf())
+    def get_image_cache_stats(self) -> dict:
+        return self._images.get_stats()
 
 
 class APIFactory(GObject.GObject):
@@ -519,12 +880,18 @@ class APIFactory(GObject.GObject):
     Given the same token, the api will be the same
     '''
 
-    def __init__(self, session: Soup.Session):
+    def __init__(self, session: Soup.Session,
+                 disk_cache: httpcache.DiskCache = None,
+                 image_cache: ImageCache = None):
         super().__init__()
         self._session = session
+        self._disk_cache = disk_cache
+        self._image_cache = image_cache or ImageCache(session)
         self._apis = {}
 
     def get_for_token(self, token: TokenManager) -> RedditAPI:
         if token not in self._apis:
-            self._apis[token] = RedditAPI(self._session, token)
+            self._apis[token] = RedditAPI(
+                self._session, token, disk_cache=self._disk_cache,
+                image_cache=self._image_cache)
         return self._apis[token]
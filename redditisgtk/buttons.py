@@ -15,7 +15,6 @@
 # You should have received a copy of the GNU General Public License
 # along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
 
-import arrow
 from gi.repository import Gtk
 from gi.repository import Pango
 
@@ -43,8 +42,14 @@ class ScoreButtonBehaviour():
     def __init__(self, api: RedditAPI, button, data):
         self._api = api
         self._button = button
-        self._data = data
         self._p = connect_palette(button, self._make_score_palette)
+        self.bind(data)
+
+    def bind(self, data):
+        '''
+        Show the score of a different thing, eg. when a row is recycled
+        '''
+        self._data = data
         self._update_score_button()
 
     def _make_score_palette(self):
@@ -136,12 +141,23 @@ class AuthorButtonBehaviour():
 
     def __init__(self, button, data, original_poster=None,
                  show_flair=False):
-        button.props.label = data['author']
+        self._button = button
+        self._original_poster = original_poster
+        self._show_flair = show_flair
         button.connect('clicked', self.__name_clicked_cb)
+        self.bind(data)
+
+    def bind(self, data):
+        '''
+        Show the author of a different thing, eg. when a row is recycled
+        '''
+        button = self._button
+        # Setting the label replaces any box we added last time
+        button.props.label = data['author']
 
         disti = data['distinguished']
-        is_op = data['author'] == original_poster
-        flair = data['author_flair_text'] if show_flair else None
+        is_op = data['author'] == self._original_poster
+        flair = data['author_flair_text'] if self._show_flair else None
         make_label_shrinkable(button.get_child())
         if disti is not None or is_op or flair is not None:
             label = button.get_child()
@@ -183,9 +199,13 @@ class AuthorButtonBehaviour():
 class SubButtonBehaviour():
 
     def __init__(self, button, data):
-        button.props.label = data['subreddit']
+        self._button = button
         button.connect('clicked', self.__sub_clicked_cb)
-        make_label_shrinkable(button.get_child())
+        self.bind(data)
+
+    def bind(self, data):
+        self._button.props.label = data['subreddit']
+        make_label_shrinkable(self._button.get_child())
 
     def __sub_clicked_cb(self, button):
         window = button.get_toplevel()
@@ -195,12 +215,18 @@ class SubButtonBehaviour():
 class TimeButtonBehaviour():
 
     def __init__(self, button, data):
-        self.data = data
-        time = arrow.get(self.data['created_utc'])
-        button.props.label = time.humanize()
+        self._button = button
         self._p = connect_palette(button, self._make_time_palette,
                                   modalify=True)
-        make_label_shrinkable(button.get_child())
+        self.bind(data)
+
+    def bind(self, data):
+        self.data = data
+        # arrow is slow to import, so it waits until the 1st post is shown
+        import arrow
+        time = arrow.get(self.data['created_utc'])
+        self._button.props.label = time.humanize()
+        make_label_shrinkable(self._button.get_child())
 
     def _make_time_palette(self):
         t = _TimePalette(self.data)
@@ -216,6 +242,7 @@ class _TimePalette(Gtk.Popover):
         self.add(box)
         box.show()
 
+        import arrow
         created = arrow.get(data['created_utc'])
         lines = ['Created {} ({})'.format(
             created.format('hh:mm a, MMM YY'), created.humanize())]
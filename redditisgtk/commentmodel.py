@@ -0,0 +1,313 @@
+# Copyright 2018 Sam Parkinson <sam@sam.today>
+#
+# This file is part of Something for Reddit.
+#
+# Something for Reddit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Something for Reddit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The comments of a thread, as a flat list rather than a tree of widgets
+'''
+
+import typing
+
+
+class CommentNode():
+    '''
+    One comment (or "load more comments" stub) in a `CommentTree`
+    '''
+
+    __slots__ = ('data', 'kind', 'depth', 'parent', 'size', 'collapsed',
+                 'lazy', 'index', 'prev', 'prev_sibling')
+
+    def __init__(self, data: dict, kind: str, depth: int, parent: int,
+                 index: int):
+        # The comment's 'data' dict from reddit
+        self.data = data
+        # 't1' for a comment, 'more' for a load more stub
+        self.kind = kind
+        self.depth = depth
+        # Index of the parent comment, or -1 for top level comments
+        self.parent = parent
+        # Number of replies, replies to replies, etc.
+        self.size = 0
+        self.collapsed = False
+        # The raw replies of a comment that started off collapsed.  They
+        # are only added to the tree when it is expanded
+        self.lazy = None
+
+        # Navigation links, kept up to date by the CommentTree.  Indexes,
+        # or -1 if there is no such comment
+        self.index = index
+        # The comment shown before this one, if this one is shown
+        self.prev = -1
+        self.prev_sibling = -1
+
+    @property
+    def has_replies(self) -> bool:
+        return self.size > 0 or bool(self.lazy)
+
+
+class CollapseRule():
+    '''
+    Decides which comments start off collapsed.  Their replies are not
+    added to the `CommentTree` until they are expanded, so big threads
+    don't pay for the parts that nobody reads.
+
+    Comments that reddit marks as collapsed are always collapsed.
+
+    Args:
+        depth (int):  hide replies that are this deep, or deeper.  So 1
+            collapses every top level comment.  0 for no limit
+        score (int):  collapse comments scored below this, None for no
+            limit
+    '''
+
+    def __init__(self, depth: int = 0, score: int = None):
+        self.depth = depth
+        self.score = score
+
+    def __call__(self, data: dict, depth: int) -> bool:
+        if data.get('collapsed'):
+            return True
+        if self.depth and depth + 1 >= self.depth:
+            return True
+        score = data.get('score')
+        return self.score is not None and score is not None \
+            and score < self.score
+
+
+class CommentTree():
+    '''
+    The comments are stored in pre-order; every comment is followed by all
+    of its replies.  So a comment and its replies are always the contiguous
+    range `[index, index + node.size]`, and collapsing a comment just means
+    skipping over that range.
+
+    The methods take and return indexes into the list.  Each node also
+    links to the comments around it, so moving around the tree doesn't
+    need to search it.
+
+    Args:
+        children (list):  the listing's children, eg. `j[1]['data']['children']`
+            for a comments page
+        collapse (callable):  called with the data and depth of each
+            comment that has replies; returns True to start it off
+            collapsed, see `CollapseRule`
+    '''
+
+    def __init__(self, children: list,
+                 collapse: typing.Callable[[dict, int], bool] = None):
+        self._collapse = collapse
+        self._nodes = []
+        self._flatten(children, 0, -1, self._nodes)
+        self._link(0, len(self._nodes))
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __getitem__(self, index: int) -> CommentNode:
+        return self._nodes[index]
+
+    def _flatten(self, children: list, depth: int, parent: int,
+                 into: list, base: int = 0) -> int:
+        '''
+        Add the children (and their replies) to the end of the list.  The
+        list will be spliced in to the tree at the base index.
+
+        Returns the number of nodes added
+        '''
+        added = 0
+        for child in children:
+            data = child['data']
+            index = len(into)
+            node = CommentNode(data, child['kind'], depth, parent,
+                               base + index)
+            into.append(node)
+            replies = data.get('replies')
+            if replies:
+                replies = replies['data']['children']
+            if replies and self._collapse is not None \
+                    and self._collapse(data, depth):
+                node.collapsed = True
+                node.lazy = replies
+            elif replies:
+                node.size = self._flatten(
+                    replies, depth + 1, base + index, into, base)
+            added += 1 + node.size
+        return added
+
+    def get_shown(self, index: int) -> int:
+        '''
+        Returns the index of the comment that is shown in place of this one;
+        itself, unless a parent is collapsed
+        '''
+        shown = index
+        parent = self._nodes[index].parent
+        while parent != -1:
+            if self._nodes[parent].collapsed:
+                shown = parent
+            parent = self._nodes[parent].parent
+        return shown
+
+    def get_next(self, index: int) -> typing.Optional[int]:
+        '''
+        Returns the next visible comment after a visible comment
+        '''
+        node = self._nodes[index]
+        next = index + 1 + (node.size if node.collapsed else 0)
+        return next if next < len(self._nodes) else None
+
+    def get_prev(self, index: int) -> typing.Optional[int]:
+        '''
+        Returns the visible comment before a visible comment
+        '''
+        prev = self._nodes[index].prev
+        return prev if prev != -1 else None
+
+    def index(self, node: CommentNode) -> int:
+        if self._nodes[node.index] is not node:
+            raise ValueError('{} is not in the tree'.format(node))
+        return node.index
+
+    def get_parent(self, index: int) -> typing.Optional[int]:
+        parent = self._nodes[index].parent
+        return parent if parent != -1 else None
+
+    def get_next_sibling(self, index: int) -> typing.Optional[int]:
+        next = index + 1 + self._nodes[index].size
+        if next < len(self._nodes) \
+                and self._nodes[next].parent == self._nodes[index].parent:
+            return next
+        return None
+
+    def get_prev_sibling(self, index: int) -> typing.Optional[int]:
+        prev = self._nodes[index].prev_sibling
+        return prev if prev != -1 else None
+
+    def get_root(self, index: int) -> int:
+        '''
+        Returns the top level comment that this is a reply to (or itself)
+        '''
+        while self._nodes[index].parent != -1:
+            index = self._nodes[index].parent
+        return index
+
+    def set_collapsed(self, index: int, collapsed: bool) -> int:
+        '''
+        Hide or show the replies to a comment.  Expanding a comment that
+        started off collapsed adds its replies to the tree, right after it.
+
+        Returns the number of nodes added
+        '''
+        node = self._nodes[index]
+        if not collapsed and node.lazy:
+            lazy = node.lazy
+            node.lazy = None
+            node.collapsed = False
+            return self._splice(index + 1, 0, lazy, node.depth + 1, index)
+
+        node.collapsed = collapsed
+        # Only the comment after the replies is shown after something else
+        after = index + 1 + node.size
+        if after < len(self._nodes):
+            self._nodes[after].prev = self._find_prev(after)
+        return 0
+
+    def replace(self, index: int, children: list) -> int:
+        '''
+        Replace a load more stub with the comments that it loaded.  The
+        comments are siblings of the stub, in the same format as `children`
+        in the constructor.
+
+        The indexes of everything after the stub change, so returns the
+        number of nodes added (which can be -1 if there were no comments).
+        '''
+        stub = self._nodes[index]
+        return self._splice(index, 1, children, stub.depth, stub.parent)
+
+    def _splice(self, start: int, remove: int, children: list, depth: int,
+                parent: int) -> int:
+        '''
+        Replace `remove` nodes from the start index with the children, which
+        are replies to the parent.  Returns the number of nodes added (minus
+        the number removed)
+        '''
+        new_nodes = []
+        self._flatten(children, depth, parent, new_nodes, start)
+        delta = len(new_nodes) - remove
+
+        self._nodes[start:start + remove] = new_nodes
+        end = start + len(new_nodes)
+        moved = start + remove
+        for node in self._nodes[end:]:
+            node.index += delta
+            if node.parent >= moved:
+                node.parent += delta
+            if node.prev >= moved:
+                node.prev += delta
+            if node.prev_sibling >= moved:
+                node.prev_sibling += delta
+        while parent != -1:
+            self._nodes[parent].size += delta
+            parent = self._nodes[parent].parent
+
+        # The new comments, and the one after them (which used to come
+        # after the removed ones) need new links
+        self._link(start, min(end + 1, len(self._nodes)))
+        return delta
+
+    def _link(self, start: int, end: int):
+        '''
+        Work out the links for the nodes in the range
+        '''
+        for index in range(start, end):
+            node = self._nodes[index]
+            node.prev = self._find_prev(index)
+            node.prev_sibling = self._find_prev_sibling(index)
+
+    def _find_prev(self, index: int) -> int:
+        '''
+        Search for the comment that is shown before this one (if it is
+        shown)
+        '''
+        prev = index - 1
+        if prev < 0:
+            return -1
+        # prev is either our parent, or the last reply (of a reply...) to
+        # the comment before us.  The latter could be inside a collapsed one
+        stop = self._nodes[index].parent
+        if prev == stop:
+            return prev
+        parent = self._nodes[prev].parent
+        while parent != stop:
+            if self._nodes[parent].collapsed:
+                prev = parent
+            parent = self._nodes[parent].parent
+        return prev
+
+    def _find_prev_sibling(self, index: int) -> int:
+        if index == 0:
+            return -1
+        prev = index - 1
+        parent = self._nodes[index].parent
+        # Walk up from the last reply of the comment before us
+        while prev != parent and self._nodes[prev].parent != parent:
+            prev = self._nodes[prev].parent
+        return prev if prev != parent else -1
+
+    def iter_visible(self) -> typing.Iterator[int]:
+        index = 0 if self._nodes else None
+        while index is not None:
+            yield index
+            index = self.get_next(index)
@@ -19,42 +19,104 @@ import os
 import time
 import cProfile
 
+import typing
+
 from gi.repository import GObject
 from gi.repository import Gtk
 from gi.repository import Gdk
+from gi.repository import Gio
 from gi.repository import GLib
+from gi.repository import Soup
 
 from redditisgtk import newmarkdown
-from redditisgtk.palettebutton import connect_palette
 from redditisgtk.api import RedditAPI
-from redditisgtk.buttons import (ScoreButtonBehaviour, AuthorButtonBehaviour,
-                                 TimeButtonBehaviour, SubButtonBehaviour)
+from redditisgtk.commentmodel import CommentTree, CommentNode, CollapseRule
 from redditisgtk.gtkutil import process_shortcuts
+from redditisgtk.virtuallist import VirtualList, ListItem, ListOrder
+from redditisgtk.workers import SlicedJob
 from redditisgtk import emptyview
 from redditisgtk import posttopbar
 
 
 ENABLE_PROFILE = 'COMMENTS_PROFILE' in os.environ
 
+# Number of comments to show with the post; the rest are added in slices,
+# so a big thread doesn't freeze the window while it is added
+COMMENTS_FIRST = 30
+COMMENTS_PER_STEP = 20
+
 if ENABLE_PROFILE:  # pragma: no cover
     profile = cProfile.Profile()
     profile.done = True
     profile.start = 0
 
 
-class CommentsView(Gtk.ScrolledWindow):
-    '''Downloads comments, shows selftext'''
+def prepare_thread(j):
+    '''
+    Parse the body of every comment in a comments page, so the rows only
+    need to make their widgets.  Runs on a worker thread, as soon as the
+    json is decoded; see `RedditAPI.send_request`.
+    '''
+    if not isinstance(j, list) or len(j) < 2:
+        # An error, not a thread
+        return
+
+    bodies = []
+    def walk(children):
+        for child in children:
+            data = child['data']
+            if 'body_html' in data:
+                bodies.append(data['body_html'])
+            replies = data.get('replies')
+            if replies:
+                walk(replies['data']['children'])
+    # In the same order as the rows, so the 1st screen is ready 1st
+    walk(j[1]['data']['children'])
+    newmarkdown.prepare_html(bodies)
+
+
+class CommentsView(Gtk.Box):
+    '''
+    Downloads comments, shows selftext
+
+    The post and the comments are all in one `VirtualList`, so only the
+    rows on the screen are made, however big the thread is.  The comments
+    are kept in a flat `CommentTree`, and collapsing a comment just hides
+    its replies from the list.
+
+    The 1st screenful of comments is shown straight away, and the rest
+    are added to the list by a `SlicedJob`, with a progress bar.  The
+    replies to comments that start off collapsed (see `CollapseRule`) are
+    only added when they are expanded.
+    '''
 
     got_post_data = GObject.Signal('got-post-data', arg_types=[object])
 
-    def __init__(self, api: RedditAPI, post=None, comments=None, permalink=None):
-        Gtk.ScrolledWindow.__init__(self)
+    def __init__(self, api: RedditAPI, post=None, comments=None, permalink=None,
+                 collapse: CollapseRule = None):
+        Gtk.Box.__init__(self, orientation=Gtk.Orientation.VERTICAL)
         self.add_events(Gdk.EventMask.KEY_PRESS_MASK)
         self.get_style_context().add_class('root-comments-view')
-        self.props.hscrollbar_policy = Gtk.PolicyType.NEVER
         self._api = api
         self._post = post
+        self._collapse = collapse
+        # The thread's ticket; kept until the next load, as the callback is
+        # called again when the network revalidates the cached version
         self._msg = None
+        # True if the thread on screen came from the cache, and the network
+        # might still send a new version
+        self._stale_shown = False
+        self._tree = None
+        # Number of comments in the tree that are in the model
+        self._n_built = 0
+        self._job = None
+        self._post_row = None
+        self._load_full = None
+        # CommentNodes for the load more stubs that are loading
+        self._loading_more = set()
+        # Index to scroll to once the comments are loaded, see
+        # `scroll_to_position`
+        self._scroll_to = None
 
         self._permalink = permalink
         if post is not None and permalink is None:
@@ -62,110 +124,202 @@ class CommentsView(Gtk.ScrolledWindow):
         if self._permalink is None:
             raise Exception('We have no link for a post!')
 
-        self._box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-        self.add(self._box)
-        self._box.show()
+        self._model = Gio.ListStore.new(ListItem)
+        self._order = _ThreadOrder(self._model)
+        self._virtual = VirtualList(
+            self._model, self.__create_row_cb, self.__bind_row_cb,
+            order=self._order, build_ahead=True)
+        self._virtual.listbox.get_style_context().add_class('comments-list')
+        self._virtual.listbox.connect('event', self.__listbox_event_cb)
+        self._virtual.connect('row-selected', self.__row_selected_cb)
+        self._model.connect('items-changed', self.__items_changed_cb)
+
+        self._progress = Gtk.ProgressBar()
+        self._progress.get_style_context().add_class('osd')
+        self.pack_start(self._progress, False, False, 0)
+        self.pack_start(self._virtual, True, True, 0)
+        self._virtual.show()
+
+        if ENABLE_PROFILE:  # pragma: no cover
+            self._virtual.listbox.connect_after('draw', self.__draw_cb)
 
         self._spinner = Gtk.Spinner()
-        self._box.pack_end(self._spinner, True, True, 0)
-        self._spinner.show()
+        self.pack_end(self._spinner, False, False, 0)
 
         if self._post is not None:
             self._init_post(self._post)
 
         if comments is not None:
-            self.__message_done_cb(comments)
+            self.__message_done_cb(comments, self._permalink)
+            # Nothing else is coming
+            self._stale_shown = False
         else:
-            self.refresh()
+            self._load()
 
     def _init_post(self, post):
         self.got_post_data.emit(post)
-
-        self._top = posttopbar.PostTopBar(
-            self._api, post, self, hideable=False,
-            refreshable=True, show_subreddit=True)
-        self._top.get_style_context().add_class('root-comments-bar')
-        self._box.add(self._top)
-        self._top.show()
-
-        body = '# ' + post['title']
-        if post.get('selftext'):
-            body = body + '\n\n' + post['selftext']
-
-        selfpost_label = newmarkdown.make_markdown_widget(body)
-        selfpost_label.get_style_context().add_class('root-comments-label')
-        self._box.add(selfpost_label)
-        selfpost_label.show()
-
-        self._comments = None
-        self._load_full = None
-        self._selected = self._top
+        self._post_row = _PostRow(self._api, post, self)
+        self._model.splice(0, 0, [ListItem(post, 'post')])
 
     def focus(self):
-        self._selected.grab_focus()
+        self._virtual.focus_row()
 
     def get_link_name(self):
         return self._post['name']
 
-    def get_header_height(self):
-        return self._comments.get_allocation().y
+    def get_permalink(self) -> str:
+        return self._permalink
+
+    def get_position(self) -> int:
+        '''
+        Index of the row at the top of the screen
+        '''
+        return self._virtual.get_first_index()
+
+    def scroll_to_position(self, index: int):
+        '''
+        Scroll to a position from `get_position`, once there are that many
+        comments loaded
+        '''
+        self._scroll_to = index
+        self.__items_changed_cb(self._model, 0, 0, 0)
+
+    def __items_changed_cb(self, model, position, removed, added):
+        if self._scroll_to is not None \
+                and model.get_n_items() > self._scroll_to:
+            self._virtual.scroll_to(self._scroll_to)
+            self._scroll_to = None
 
     def refresh(self, caller=None):
+        # The user asked for the latest comments, so skip the cache
+        self._load(cache=False)
+
+    def _load(self, cache=True):
+        if self._msg is not None:
+            self._api.cancel(self._msg)
+            self._msg = None
+        self._stale_shown = False
+        self._spinner.show()
         self._spinner.start()
+        # If we have the thread cached (even from the last time the app
+        # was open), show it now and swap in the new version when it loads
+        permalink = self._permalink
         self._msg = self._api.send_request(
-            'GET', self._permalink, self.__message_done_cb)
+            'GET', permalink,
+            lambda j: self.__message_done_cb(j, permalink), cache=cache,
+            revalidate=cache, priority=Soup.MessagePriority.HIGH,
+            prepare=prepare_thread)
 
     def do_unrealize(self):
         if self._msg is not None:
             self._api.cancel(self._msg)
+        if self._job is not None:
+            self._job.cancel()
+
+    def __message_done_cb(self, j, permalink):
+        if permalink != self._permalink:
+            return
+        if self._stale_shown and (self.get_position() > 0
+                                  or self._loading_more):
+            # This is the network's version of the cached thread on the
+            # screen; swapping it in would lose the user's place
+            return
 
-    def __message_done_cb(self, j):
         self._spinner.stop()
+        self._spinner.hide()
         if self._post is None:
             self._post = j[0]['data']['children'][0]['data']
             self._init_post(self._post)
 
-        self._msg = None
-        self._selected = self._top
-
-        if self._load_full is not None:
-            self._load_full.hide()
-            self._load_full.destroy()
-            self._load_full = None
-
+        # Small cached bodies are given to us before send_request returns
+        # the ticket.  Either way, it is the cached version if the network
+        # hasn't replied, and the network's version might still come
+        self._stale_shown = self._msg is None or not self._msg.got_response
+        self._loading_more = set()
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+
+        if ENABLE_PROFILE:  # pragma: no cover
+            print('[COMMENTS PROFILE] Start')
+            profile.enable()
+            profile.done = False
+            profile.start = time.time()
+
+        items = [ListItem(self._post, 'post')]
         permalink_segments = len(self._permalink.rstrip('/').split('/'))
         # More than /r/rct/comments/4ns96b/new_to_rct_lovely_community_3/
         if permalink_segments > 6:
-            self._load_full = LoadFullCommentsRow()
-            self._load_full.load_full.connect(self.__load_full_cb)
-            self._box.add(self._load_full)
-            self._load_full.show()
-
-        if self._comments is not None:
-            self._box.remove(self._comments)
-            self._comments.destroy()
-
-        if len(j[1]['data']['children']) == 0:
-            self._comments = emptyview.EmptyView(
-                'No Comments', action='Add a comment')
-            self._comments.action.connect(self.__add_comment_clicked_cb)
+            items.append(ListItem(None, 'load-full'))
+
+        # The 0th one is just the self post
+        self._tree = CommentTree(j[1]['data']['children'], self._collapse)
+        self._n_built = min(len(self._tree), COMMENTS_FIRST)
+        n_header = len(items)
+        if len(self._tree) == 0:
+            items.append(ListItem(None, 'empty'))
         else:
-            if ENABLE_PROFILE:  # pragma: no cover
-                print('[COMMENTS PROFILE] Start')
-                profile.enable()
-                profile.done = False
-                profile.start = time.time()
+            items.extend(self._make_items(0, self._n_built))
+        self._order.set_tree(self._tree, n_header)
+        self._model.splice(0, self._model.get_n_items(), items)
+
+        if self._n_built < len(self._tree):
+            self._progress.props.fraction = \
+                self._n_built / len(self._tree)
+            self._progress.show()
+            self._job = SlicedJob(
+                self._add_comments_steps(), self.__progress_cb)
+
+    def _make_items(self, start: int, end: int) -> typing.List[ListItem]:
+        return [ListItem(self._tree[i], self._tree[i].kind)
+                for i in range(start, end)]
+
+    def _add_comments_steps(self) -> typing.Iterator[float]:
+        '''
+        Add the rest of the comments to the model, a few per step
+        '''
+        while self._n_built < len(self._tree):
+            end = min(self._n_built + COMMENTS_PER_STEP, len(self._tree))
+            self._model.splice(
+                self._model.get_n_items(), 0,
+                self._make_items(self._n_built, end))
+            self._n_built = end
+            yield self._n_built / len(self._tree)
+
+    def __progress_cb(self, fraction):
+        self._progress.props.fraction = fraction
+        if fraction >= 1:
+            self._progress.hide()
 
-            # The 0th one is just the self post
-            self._comments = _CommentsView(
-                    self._api, j[1]['data']['children'],
-                    self, first=True)
+    def __draw_cb(self, widget, cr):
+        if not profile.done:
+            profile.done = True
+            profile.disable()
+            profile.print_stats(sort='tottime')
+            print('[COMMENTS PROFILE] Done', time.time() - profile.start)
 
-        self._box.add(self._comments)
-        self._comments.show()
+    def __create_row_cb(self, item):
+        if item.kind == 'post':
+            return self._post_row
+        elif item.kind == 'load-full':
+            if self._load_full is None:
+                self._load_full = LoadFullCommentsRow()
+                self._load_full.load_full.connect(self.__load_full_cb)
+            return self._load_full
+        elif item.kind == 'empty':
+            return _EmptyRow(self)
+        elif item.kind == 'more':
+            return LoadMoreCommentsRow(self._api, item.data, self)
+        else:
+            return NormalCommentRow(self._api, item.data, self)
 
-    def __add_comment_clicked_cb(self, view):
-        self._top.show_reply()
+    def __bind_row_cb(self, row, item):
+        # There is only 1 post, load full and empty row
+        if isinstance(row, CommentRow):
+            row.bind(item.data)
+
+    def add_comment(self):
+        self._post_row.top.show_reply()
 
     def __load_full_cb(self, row):
         # First 6 = /r/rct/comments/4ns96b/new_to_rct_lovely_community_3/
@@ -182,224 +336,224 @@ class CommentsView(Gtk.ScrolledWindow):
     def get_original_poster(self):
         return self._post['author']
 
-    def get_next_row(self, relative_to):
-        if relative_to == self._top:
-            return self._load_full or self._comments.get_children()[0]
-        if relative_to == self._load_full:
-            return self._comments.get_children()[0]
-
-        row = relative_to
-        # 1st, try to see if I have a child to descend into
-        if isinstance(row, CommentRow) and row.get_sub() is not None:
-            children  = row.get_sub().get_children()
-            if len(children) >= 1 and children[0].get_mapped():
-                return children[0]
-
-        # 2nd, try siblings and parents iteratively
-        while isinstance(row, CommentRow):
-            parent_listview = row.get_parent()
-            kids = parent_listview.get_children()
-            i = kids.index(row)
-            if i+1 < len(kids) and kids[i+1].get_mapped():
-                return kids[i+1]
-            else:
-                # Walk up to next CommentRow
-                row = row.get_parent()
-                while not isinstance(row, CommentRow):
-                    row = row.get_parent()
-        return None
-
-    def _get_last_child_of(self, row):
-        if row.get_sub() is not None:
-            children = row.get_sub().get_children()
-            if len(children) >= 1 and children[-1].get_mapped():
-                return self._get_last_child_of(children[-1])
-        return row
-
-    def get_prev_row(self, row):
-        if self._load_full is not None and row == self._load_full:
-            return self._top
-
-        if row == self._top:
-            return None
-
-        assert isinstance(row, CommentRow)
-        # Find the row before me
-        if isinstance(row, CommentRow):
-            parent_listview = row.get_parent()
-            kids = parent_listview.get_children()
-            i = kids.index(row)
-            if i == 0:
-                # Return parent is there is no row before us
-                if row.depth == 0:
-                    return self._load_full or self._top
-
-                # Walk up to next CommentRow
-                row = row.get_parent()
-                while not isinstance(row, CommentRow):
-                    row = row.get_parent()
-                return row
-            else:
-                return self._get_last_child_of(kids[i-1])
-        return None
-
-    def do_event(self, event):
-        def move(direction, jump):
-            if jump:
-                row = self._selected
-                while isinstance(row, CommentRow) and row.depth > 0:
-                    # Walk up to next CommentRow
-                    row = row.get_parent()
-                    while not isinstance(row, CommentRow):
-                        row = row.get_parent()
-                kids = [self._top] + self._comments.get_children()
-                i = kids.index(row)
-                if 0 <= i + direction < len(kids):
-                    row = kids[i + direction]
-            else:
-                f = self.get_next_row if direction > 0 else self.get_prev_row
-                while True:
-                    row = f(self._selected)
-                    if row is None or row.get_mapped():
-                        break
+    def set_collapsed(self, row: 'CommentRow', collapsed: bool):
+        '''
+        Hide (or show) the replies to the comment in the row
+        '''
+        index = self._order.to_tree(row.virtual_index)
+        if self._tree[index].collapsed == collapsed:
+            return
+        added = self._tree.set_collapsed(index, collapsed)
+        if added:
+            # The replies were not in the tree yet; the row is in the
+            # model, so they go in to the model right after it
+            self._n_built += added
+            self._model.splice(
+                self._order.from_tree(index + 1), 0,
+                self._make_items(index + 1, index + 1 + added))
+        self._virtual.order_changed()
+
+    def is_loading_more(self, node: CommentNode) -> bool:
+        return node in self._loading_more
+
+    def load_more(self, node: CommentNode):
+        '''
+        Load the comments for a load more stub, and put them in its place
+        '''
+        if node in self._loading_more:
+            return
+        self._loading_more.add(node)
+        tree = self._tree
+        self._api.load_more(
+            self.get_link_name(), node.data,
+            lambda comments: self.__got_more_comments_cb(
+                tree, node, comments))
+
+    def __got_more_comments_cb(self, tree, node, more_comments):
+        if tree is not self._tree:
+            # The thread was refreshed while loading
+            return
+        self._loading_more.discard(node)
+
+        index = self._tree.index(node)
+        added = self._tree.replace(index, more_comments) + 1
+        self._n_built += added - 1
+        position = self._order.from_tree(index)
+        self._model.splice(position, 1, self._make_items(index, index + added))
+
+        if added == 0:
+            # If no comments were added, just select the previous row
+            position = self._order.get_prev(position)
+        if position is not None:
+            self._virtual.select_index(position)
+
+    def _move(self, direction: int, jump: bool):
+        selected = self._virtual.get_selected_index()
+        if jump:
+            target = self._get_root_sibling(selected or 0, direction)
+            ok = target is not None and self._virtual.select_index(target)
+        else:
+            ok = self._virtual.move(direction)
 
+        if not ok and selected is not None:
+            # We went too far!
+            self.error_bell()
+            row = self._virtual.get_row_at_index(selected)
             if row is not None:
-                self.select_row(row)
-            else:
-                # We went too far!
-                self.error_bell()
-                self._selected.get_style_context().remove_class('angry')
-                self._selected.get_style_context().add_class('angry')
+                row.get_style_context().remove_class('angry')
+                row.get_style_context().add_class('angry')
                 GLib.timeout_add(
                     500,
-                    self._selected.get_style_context().remove_class,
+                    row.get_style_context().remove_class,
                     'angry')
 
+    def _get_root_sibling(self, index: int,
+                          direction: int) -> typing.Optional[int]:
+        '''
+        Returns the top level comment before or after the one that the
+        index is in
+        '''
+        tree_index = self._order.to_tree(index)
+        if tree_index is None:
+            # We are on the post or load full row
+            if direction > 0 and self._tree:
+                return self._order.from_tree(0)
+            return 0 if index != 0 and direction < 0 else None
+
+        root = self._tree.get_root(tree_index)
+        if direction > 0:
+            sibling = self._tree.get_next_sibling(root)
+        else:
+            sibling = self._tree.get_prev_sibling(root)
+            if sibling is None:
+                return 0
+        return self._order.from_tree(sibling) if sibling is not None else None
+
+    def __listbox_event_cb(self, listbox, event):
+        # The listbox would move the focus with the arrow keys itself, but
+        # it only has the rows that are on the screen
+        return self.do_event(event)
+
+    def do_event(self, event):
         def load_full():
             if self._load_full is not None:
                 self.__load_full_cb(None)
 
         shortcuts = {
-            'k': (move, [-1, False]),
-            'j': (move, [+1, False]),
-            'Up': (move, [-1, False]),
-            'Down': (move, [+1, False]),
-            'h': (move, [-1, True]),
-            'l': (move, [+1, True]),
-            'Left': (move, [-1, True]),
-            'Right': (move, [+1, True]),
+            'k': (self._move, [-1, False]),
+            'j': (self._move, [+1, False]),
+            'Up': (self._move, [-1, False]),
+            'Down': (self._move, [+1, False]),
+            'h': (self._move, [-1, True]),
+            'l': (self._move, [+1, True]),
+            'Left': (self._move, [-1, True]),
+            'Right': (self._move, [+1, True]),
             '<ctrl>f': (load_full, []),
             '<ctrl>r': (self.refresh, []),
         }
         return process_shortcuts(shortcuts, event)
 
-    def select_row(self, row):
-        row.grab_focus()
-        self._selected = row
+    def __row_selected_cb(self, virtual, row):
+        if isinstance(row, NormalCommentRow):
+            # Scroll to the top of the collapsed row
+            self._virtual.scroll_to(row.virtual_index)
+            row.toggle_collapsed()
 
 
-class _CommentsView(Gtk.ListBox):
+class _ThreadOrder(ListOrder):
+    '''
+    The rows of a `CommentsView`; a few rows for the post, then the
+    comments that are not hidden by a collapsed parent
     '''
-    Actually holds the comments
 
-    This is recursive, eg, like:
+    def __init__(self, model: Gio.ListStore):
+        super().__init__(model)
+        self._tree = None
+        self._n_header = 0
 
-    _CommentsView
-        | CommentRow
-        |   | _CommentsView
-        |   |   | CommentRow
-        | CommentRow
-    '''
+    def set_tree(self, tree: CommentTree, n_header: int):
+        self._tree = tree
+        self._n_header = n_header
 
-    def __init__(self, api: RedditAPI, data, toplevel_cv, first=False, depth=0):
-        Gtk.ListBox.__init__(self)
-        self._api = api
-        self._first_row = None
-        self._is_first = first
-        self._depth = depth
-        self._toplevel_cv = toplevel_cv
+    def to_tree(self, index: int) -> typing.Optional[int]:
+        '''
+        Returns the tree index of the comment at the index in the model, or
+        None if it is not a comment (eg. the empty row after the post)
+        '''
+        if self._tree is None or index < self._n_header \
+                or index >= self._n_header + len(self._tree):
+            return None
+        return index - self._n_header
+
+    def from_tree(self, tree_index: int) -> int:
+        return tree_index + self._n_header
+
+    def get_next(self, index):
+        tree_index = self.to_tree(index)
+        if tree_index is None:
+            return super().get_next(index)
+        next = self._tree.get_next(tree_index)
+        if next is None or self.from_tree(next) >= self._model.get_n_items():
+            # Not added to the model yet
+            return None
+        return self.from_tree(next)
 
-        ctx = self.get_style_context()
-        ctx.add_class('comments-view')
-        if self._is_first:
-            ctx.add_class('first')
-        ctx.add_class('depth-{}'.format(depth % 5))
-        self._add_comments(data)
+    def get_prev(self, index):
+        tree_index = self.to_tree(index)
+        if tree_index is None or tree_index == 0:
+            return super().get_prev(index)
+        return self.from_tree(self._tree.get_prev(tree_index))
 
-        if first and ENABLE_PROFILE:  # pragma: no cover
-            self.connect_after('draw', self.__draw_cb)
+    def get_shown(self, index):
+        tree_index = self.to_tree(index)
+        if tree_index is None:
+            return index
+        return self.from_tree(self._tree.get_shown(tree_index))
 
-    def __draw_cb(self, widget, cr):
-        if not profile.done:
-            profile.done = True
-            profile.disable()
-            profile.print_stats(sort='tottime')
-            print('[COMMENTS PROFILE] Done', time.time() - profile.start)
 
-    def _add_comments(self, data):
-        '''
-        Add comments from the given data list
+class _PostRow(Gtk.ListBoxRow):
+    '''
+    The post's top bar and selftext, above the comments
+    '''
 
-        Returns the widget for the first comment added
-        '''
-        index = 0
-        def do_add_comment():
-            nonlocal index
-
-            if index >= len(data):
-                return
-
-            comment_data = data[index]['data']
-            if 'body' in comment_data:
-                row = NormalCommentRow(self._api, comment_data, self._depth, self._toplevel_cv)
-            else:
-                row = LoadMoreCommentsRow(self._api, comment_data, self._depth, self._toplevel_cv)
-                row.got_more_comments.connect(self.__got_more_comments_cb)
-            row.recurse()
-            self.insert(row, -1)
-            row.show()
-
-            if self._first_row is None:
-                self._first_row = row
-
-            index += 1
-            if index < len(data):
-                GLib.idle_add(do_add_comment)
-
-            return row
-
-        return do_add_comment()
-
-    def do_row_activated(self, row):
-        if self._is_first:
-            viewport = self.get_parent().get_parent()
-            comments_view = viewport.get_parent()
-            # Stop the kinetic scroll, otherwise it will override our
-            # scrolling adjustment
-            comments_view.props.kinetic_scrolling = False
+    def __init__(self, api: RedditAPI, post: dict, toplevel_cv):
+        Gtk.ListBoxRow.__init__(self, selectable=False, activatable=False)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self.add(box)
+        box.show()
 
-            # Scroll to the top of the collapsed row
-            r = row.get_allocation()
-            header = comments_view.get_header_height()
-            adj = viewport.get_vadjustment()
-            adj.props.value = r.y + header
+        self.top = posttopbar.PostTopBar(
+            api, post, toplevel_cv, hideable=False,
+            refreshable=True, show_subreddit=True)
+        self.top.get_style_context().add_class('root-comments-bar')
+        box.add(self.top)
+        self.top.show()
 
-            comments_view.props.kinetic_scrolling = True
+        body = '# ' + post['title']
+        if post.get('selftext'):
+            body = body + '\n\n' + post['selftext']
 
-            row.do_activated()
+        selfpost_label = newmarkdown.make_markdown_widget(body)
+        selfpost_label.get_style_context().add_class('root-comments-label')
+        box.add(selfpost_label)
+        selfpost_label.show()
 
-    def __got_more_comments_cb(self, caller_row, more_comments):
-        row = self._add_comments(more_comments)
-        if row is None:
-            # If no comments were added, just select the previous row
-            row = self._toplevel_cv.get_prev_row(caller_row)
+    def do_focus_in_event(self, event):
+        self.top.grab_focus()
 
-        if row is not None:
-            self._toplevel_cv.select_row(row)
 
-        caller_row.hide()
-        self.remove(caller_row)
-        caller_row.destroy()
+class _EmptyRow(Gtk.ListBoxRow):
+
+    def __init__(self, toplevel_cv):
+        Gtk.ListBoxRow.__init__(self, selectable=False, activatable=False)
+        self._toplevel_cv = toplevel_cv
+        view = emptyview.EmptyView('No Comments', action='Add a comment')
+        view.action.connect(self.__add_comment_clicked_cb)
+        self.add(view)
+        view.show()
+
+    def __add_comment_clicked_cb(self, view):
+        self._toplevel_cv.add_comment()
 
 
 class LoadFullCommentsRow(Gtk.ListBoxRow):
@@ -429,99 +583,146 @@ class LoadFullCommentsRow(Gtk.ListBoxRow):
 
 
 class CommentRow(Gtk.ListBoxRow):
-    def __init__(self, data, depth):
+    '''
+    Base for the rows that show a `CommentNode`.  The row is indented by a
+    gutter for each level of depth, so the nesting can be seen without
+    nesting the widgets.
+    '''
+
+    def __init__(self, node: CommentNode):
         Gtk.ListBoxRow.__init__(self, selectable=False)
         self.add_events(Gdk.EventMask.KEY_PRESS_MASK)
+        self.get_style_context().add_class('comment-row')
 
-        self.data = data
-        self.depth = depth
+        self._box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        self.add(self._box)
+        self._box.show()
+        self._gutter_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        self._box.pack_start(self._gutter_box, False, False, 0)
+        self._gutter_box.show()
+        self._gutters = []
 
-    def get_sub(self):
-        return None
+        self.node = None
+        self._content = None
+        self.bind(node)
 
+    @property
+    def data(self):
+        return self.node.data
 
-class NormalCommentRow(CommentRow):
+    @property
+    def depth(self):
+        return self.node.depth
+
+    def bind(self, node: CommentNode):
+        '''
+        Show a different comment in this row
+        '''
+        ctx = self.get_style_context()
+        if self.node is not None:
+            ctx.remove_class('depth-{}'.format(self.node.depth % 5))
+        ctx.add_class('depth-{}'.format(node.depth % 5))
+        self.node = node
+
+        while len(self._gutters) < node.depth:
+            gutter = Gtk.Box()
+            gutter.get_style_context().add_class('comment-gutter')
+            gutter.get_style_context().add_class(
+                'depth-{}'.format(len(self._gutters) % 5))
+            self._gutter_box.add(gutter)
+            self._gutters.append(gutter)
+        for i, gutter in enumerate(self._gutters):
+            gutter.props.visible = i < node.depth
+
+        if self._content is None:
+            self._content = self.make_content()
+            self._box.pack_start(self._content, True, True, 0)
+            self._content.show()
+        self.update_content()
+
+    def make_content(self) -> Gtk.Widget:
+        '''
+        Make the widgets for the comment; only once for each row
+        '''
+        raise NotImplementedError()
+
+    def update_content(self):
+        '''
+        Show `self.node` in the widgets from `make_content`
+        '''
+        raise NotImplementedError()
 
-    refresh = GObject.Signal('refresh')
 
-    def __init__(self, api: RedditAPI, data, depth, toplevel_cv):
-        super().__init__(data, depth)
+class NormalCommentRow(CommentRow):
+
+    def __init__(self, api: RedditAPI, node: CommentNode, toplevel_cv):
         self._api = api
         self._toplevel_cv = toplevel_cv
         self._top = None
-        self._sub = None
-
-        self._box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-        self.add(self._box)
-        self._box.show()
-
-    def get_sub(self):
-        return self._sub
+        self._body = None
+        # True while showing a new node, so it isn't collapsed by it
+        self._binding = False
+        super().__init__(node)
 
     def do_event(self, event):
         if self._top is not None:
             return self._top.do_event(event)
 
-    def recurse(self):
+    def make_content(self):
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+
         self._top = posttopbar.PostTopBar(
             self._api, self.data, self._toplevel_cv)
         self._top.hide_toggled.connect(self.__hide_toggled_cb)
-        self._box.add(self._top)
+        box.add(self._top)
         self._top.show()
-
-        self._label = newmarkdown.make_html_widget(self.data['body_html'])
-        self._box.add(self._label)
-        self._label.show()
-
-        self._sub = None
-        self._revealer = None
-        if self.data.get('replies'):
-            self._revealer = Gtk.Revealer(
-                transition_type=Gtk.RevealerTransitionType.SLIDE_DOWN,
-                reveal_child=True
-            )
-            self._box.add(self._revealer)
-            self._revealer.show()
-
-            self._sub = _CommentsView(
-                self._api,
-                self.data['replies']['data']['children'],
-                self._toplevel_cv,
-                depth=self.depth + 1)
-            self._revealer.add(self._sub)
-            self._sub.show()
-        else:
-            self._top.expand.hide()
-
-    def __hide_toggled_cb(self, top, hidden):
-        if self._revealer is not None:
-            self._revealer.props.reveal_child = hidden
-
-    def do_activated(self):
-        if self._revealer is not None:
-            rc = not self._revealer.props.reveal_child
-            self._revealer.props.reveal_child = rc
-            self._top.expand.props.active = not rc
+        return box
+
+    def update_content(self):
+        self._binding = True
+        if self._top.data is not self.data:
+            self._top.bind(self.data)
+        self._top.expand.props.active = self.node.collapsed
+        self._binding = False
+        self._top.expand.props.visible = self.node.has_replies
+
+        # The body is the only part that is made again
+        if self._body is not None:
+            self._body.destroy()
+        self._body = newmarkdown.make_html_widget(self.data['body_html'])
+        self._content.add(self._body)
+        self._body.show()
+
+    def __hide_toggled_cb(self, top, revealed):
+        if self._binding:
+            return
+        self._toplevel_cv.set_collapsed(self, not revealed)
+
+    def toggle_collapsed(self):
+        if self.node.has_replies:
+            expand = self._top.expand
+            expand.props.active = not expand.props.active
 
 
 class LoadMoreCommentsRow(CommentRow):
 
-    got_more_comments = GObject.Signal('got-more-comments', arg_types=[object])
-
-    def __init__(self, api: RedditAPI, data, depth, toplevel_cv):
-        super().__init__(data, depth)
-
+    def __init__(self, api: RedditAPI, node: CommentNode, toplevel_cv):
         self._api = api
         self._toplevel_cv = toplevel_cv
         self._more_button = None
+        super().__init__(node)
 
-    def recurse(self):
-        self._more_button = Gtk.Button.new_with_label(
-            'Show {} more comments...'.format(self.data['count']))
+    def make_content(self):
+        self._more_button = Gtk.Button()
         self._more_button.connect('clicked', self.__load_more_cb)
         self._more_button.get_style_context().add_class('load-more')
-        self.add(self._more_button)
-        self._more_button.show()
+        return self._more_button
+
+    def update_content(self):
+        self._more_button.props.label = \
+            'Show {} more comments...'.format(self.data['count'])
+        self._more_button.props.sensitive = \
+            not self._toplevel_cv.is_loading_more(self.node)
 
     def do_focus_in_event(self, event):
         if self._more_button is not None:
@@ -529,9 +730,4 @@ class LoadMoreCommentsRow(CommentRow):
 
     def __load_more_cb(self, button):
         button.props.sensitive = False
-        self._api.load_more(
-            self._toplevel_cv.get_link_name(),
-            self.data, self.__loaded_more_cb)
-
-    def __loaded_more_cb(self, comments):
-        self.got_more_comments.emit(comments)
+        self._toplevel_cv.load_more(self.node)
@@ -15,10 +15,19 @@
 # You should have received a copy of the GNU General Public License
 # along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
 
+import subprocess
+
 from gi.repository import Gtk
 from gi.repository import Gdk
 
 
+def open_uri_external(uri: str):
+    '''
+    Open the given uri in an external browser
+    '''
+    subprocess.call(['xdg-open', uri])
+
+
 def process_shortcuts(shortcuts, event: Gdk.Event):
     '''
     Shortcuts is a dict of:
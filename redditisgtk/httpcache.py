@@ -0,0 +1,474 @@
+# Copyright 2018 Sam Parkinson <sam@sam.today>
+#
+# This file is part of Something for Reddit.
+#
+# Something for Reddit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Something for Reddit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Caches for responses from the reddit api, in memory and on disk.
+
+These do not know anything about Soup or GTK, they just store the raw
+response bodies.  We keep the raw bytes rather than the decoded json, as
+the views happily mutate the json they are given (eg. when voting).
+'''
+
+import os
+import json
+import time
+import typing
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class LRUCache():
+    '''
+    A mapping that evicts the least recently used items once the total
+    size of the values goes over `max_bytes`.
+
+    Args:
+        max_bytes (int):  maximum total size of the values
+        sizeof (function):  returns the size of a value, in bytes
+    '''
+
+    def __init__(self, max_bytes: int,
+                 sizeof: typing.Callable[[typing.Any], int] = len):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._sizeof = sizeof
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def keys(self):
+        return list(self._items.keys())
+
+    def items(self):
+        '''
+        List of (key, value) pairs, without changing how recently used
+        they are
+        '''
+        return [(k, v) for k, (v, _) in self._items.items()]
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key][0]
+
+    def put(self, key, value):
+        self.pop(key)
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            # It would just evict everything, including itself
+            return
+
+        self._items[key] = (value, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._items.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def pop(self, key, default=None):
+        if key not in self._items:
+            return default
+        value, size = self._items.pop(key)
+        self.total_bytes -= size
+        return value
+
+    def clear(self):
+        self._items.clear()
+        self.total_bytes = 0
+
+
+class DiskCache():
+    '''
+    Stores response bodies on disk, so that they survive restarting the app.
+
+    Each body is stored in its own file, and an index file stores the
+    request path, time and size of each body.  Once the total size goes
+    over `max_bytes`, the least recently used bodies are removed.
+
+    The files are written by `run_in_background`, one at a time and in
+    order.  Until a body is written, `get` returns it from memory.  If the
+    index changes again before it is written, only the latest version is.
+
+    Keys must be tuples of strings.
+
+    Args:
+        directory (str):  where to store the files, created if missing
+        max_bytes (int):  maximum total size of the bodies
+        autosave (bool):  if False, the index is only written when you call
+            `save_index`; good for caches that get lots of small writes
+        run_in_background (function):  called with a function that writes
+            the files, eg. `workers.run_in_background`.  By default they
+            are written straight away
+    '''
+
+    INDEX_NAME = 'index.json'
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024,
+                 autosave: bool = True,
+                 run_in_background: typing.Callable = None):
+        self._dir = directory
+        self.max_bytes = max_bytes
+        self._autosave = autosave
+        self._run_in_background = run_in_background or (lambda func: func())
+        self.total_bytes = 0
+        # name -> (path, time, size), least recently used first
+        self._index = OrderedDict()
+        # [(needle, time)], see `remove_containing`
+        self._invalidated = []
+        self._dirty = False
+
+        # File name -> bytes to write, or None to remove it; waiting for
+        # the writer.  Shared with the writer's thread, under the lock
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._writing = False
+
+        if not os.path.isdir(self._dir):
+            os.makedirs(self._dir)
+        self._load_index()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self._dir, name)
+
+    def _name(self, key) -> str:
+        key_string = '\n'.join(str(part) for part in key)
+        return hashlib.sha1(bytes(key_string, 'utf8')).hexdigest()
+
+    def _load_index(self):
+        try:
+            with open(self._file(self.INDEX_NAME)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = []
+        if isinstance(index, list):
+            # From before remove_containing
+            index = {'items': index, 'invalidated': []}
+
+        for name, path, stored_time, size in index['items']:
+            if os.path.isfile(self._file(name)):
+                self._index[name] = (path, stored_time, size)
+                self.total_bytes += size
+
+        # Only bodies stored before the needle matter
+        oldest = min((t for _, t, _ in self._index.values()), default=None)
+        self._invalidated = [
+            (bytes(needle, 'utf8'), t) for needle, t in index['invalidated']
+            if oldest is not None and t >= oldest]
+
+        # Files that never made it into the index (eg. if we crashed before
+        # saving it) would otherwise take up space forever
+        for name in os.listdir(self._dir):
+            if name != self.INDEX_NAME and name not in self._index:
+                try:
+                    os.remove(self._file(name))
+                except OSError:
+                    pass
+        self._evict()
+
+    def save_index(self):
+        '''
+        Write the index to disk, if it has changed
+        '''
+        if not self._dirty:
+            return
+        # Copied now, as it changes on this thread; turned in to json by
+        # the writer
+        items = [(name, path, stored_time, size)
+                 for name, (path, stored_time, size) in self._index.items()]
+        invalidated = [(str(needle, 'utf8'), t)
+                       for needle, t in self._invalidated]
+        self._write(self.INDEX_NAME, (items, invalidated))
+        self._dirty = False
+
+    def _write(self, name: str, content):
+        with self._lock:
+            self._pending[name] = content
+            if self._writing:
+                return
+            self._writing = True
+        self._run_in_background(self._write_pending)
+
+    def _write_pending(self):
+        '''
+        Write (or remove) the files in `_pending` until there are none left;
+        runs on the writer's thread
+        '''
+        try:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        return
+                    name, content = next(iter(self._pending.items()))
+
+                try:
+                    self._write_file(name, content)
+                except OSError:
+                    # Like when the index isn't saved; it is tidied up when
+                    # the cache is next loaded
+                    pass
+                finally:
+                    with self._lock:
+                        # Unless it was changed again while we were writing
+                        if self._pending.get(name) is content:
+                            del self._pending[name]
+        finally:
+            with self._lock:
+                self._writing = False
+
+    def _write_file(self, name: str, content):
+        if content is None:
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+            return
+
+        if name == self.INDEX_NAME:
+            items, invalidated = content
+            content = bytes(json.dumps(
+                {'items': items, 'invalidated': invalidated}), 'utf8')
+        tmp_path = self._file(name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, self._file(name))
+
+    def get(self, key) -> typing.Optional[typing.Tuple[str, bytes, float]]:
+        '''
+        Returns a tuple of (path, body, time), or None if it is not stored
+        '''
+        name = self._name(key)
+        if name not in self._index:
+            return None
+
+        with self._lock:
+            body = self._pending.get(name)
+        if body is None:
+            try:
+                with open(self._file(name), 'rb') as f:
+                    body = f.read()
+            except OSError:
+                self._remove_name(name)
+                return None
+
+        path, stored_time, _ = self._index[name]
+        for needle, invalidated_time in self._invalidated:
+            if stored_time <= invalidated_time and needle in body:
+                self._remove_name(name)
+                return None
+
+        self._index.move_to_end(name)
+        self._dirty = True
+        return path, body, stored_time
+
+    def put(self, key, path: str, body: bytes, stored_time: float):
+        name = self._name(key)
+        self._remove_name(name)
+        if len(body) > self.max_bytes:
+            return
+
+        self._write(name, body)
+        self._index[name] = (path, stored_time, len(body))
+        self.total_bytes += len(body)
+        self._dirty = True
+        self._evict()
+        if self._autosave:
+            self.save_index()
+
+    def remove(self, key):
+        self._remove_name(self._name(key))
+
+    def remove_paths(self, predicate: typing.Callable[[str], bool]):
+        '''
+        Remove every body where the predicate returns True for its path
+        '''
+        for name, (path, _, _) in list(self._index.items()):
+            if predicate(path):
+                self._remove_name(name)
+
+    def remove_containing(self, needle: bytes, now: float):
+        '''
+        Remove every body stored before `now` that contains the needle.
+
+        Reading every body would be slow, so they are checked when they
+        are next read instead.
+        '''
+        self._invalidated.append((needle, now))
+        self._dirty = True
+        if self._autosave:
+            self.save_index()
+
+    def _remove_name(self, name: str):
+        if name not in self._index:
+            return
+        _, _, size = self._index.pop(name)
+        self.total_bytes -= size
+        self._dirty = True
+        self._write(name, None)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            name = next(iter(self._index))
+            self._remove_name(name)
+
+
+# How long each kind of response is considered fresh, in seconds
+TTLS = {
+    'listing': 60,
+    'comments': 30,
+    'about': 10 * 60,
+}
+# After a response is no longer fresh, it can still be shown while we
+# revalidate it with the network for this long, in seconds
+MAX_STALE = 24 * 60 * 60
+# Kinds of responses worth keeping across restarts
+DISK_KINDS = ['listing', 'comments']
+
+
+def classify_path(path: str) -> str:
+    '''
+    Get the kind of response a path returns; one of the keys of `TTLS`
+    '''
+    path = path.split('?')[0].rstrip('/')
+    if path.endswith('/about'):
+        return 'about'
+    if '/comments/' in path or path == '/api/morechildren':
+        return 'comments'
+    return 'listing'
+
+
+class CacheEntry():
+    __slots__ = ['path', 'body', 'time', 'ttl']
+
+    def __init__(self, path: str, body: bytes, time: float, ttl: float):
+        self.path = path
+        self.body = body
+        self.time = time
+        self.ttl = ttl
+
+    def is_fresh(self, now: float) -> bool:
+        return now - self.time < self.ttl
+
+    def is_usable(self, now: float) -> bool:
+        return now - self.time < self.ttl + MAX_STALE
+
+
+class ResponseCache():
+    '''
+    In memory cache of response bodies, keyed by (account, method, url)
+
+    If a `DiskCache` is given, listings and comments are also written
+    to the disk, and looked up from there when they are not in memory.
+
+    Args:
+        max_bytes (int):  total size of the bodies to keep in memory
+        ttls (dict):  override the default `TTLS`
+        time_func (function):  dependency, returns the current time
+        disk (DiskCache):  optional 2nd tier
+    '''
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024,
+                 ttls: dict = None,
+                 time_func: typing.Callable[[], float] = time.time,
+                 disk: DiskCache = None):
+        self._lru = LRUCache(max_bytes, sizeof=lambda e: len(e.body))
+        self._ttls = ttls or TTLS
+        self._time = time_func
+        self._disk = disk
+
+    def lookup(self, key) -> typing.Optional[CacheEntry]:
+        '''
+        Get the entry for a key, or None if there is no usable entry.  Use
+        `CacheEntry.is_fresh` to check if it needs revalidation.
+        '''
+        entry = self._lru.get(key)
+        if entry is None and self._disk is not None:
+            found = self._disk.get(key)
+            if found is not None:
+                path, body, stored_time = found
+                ttl = self._ttls[classify_path(path)]
+                entry = CacheEntry(path, body, stored_time, ttl)
+                self._lru.put(key, entry)
+
+        if entry is None:
+            return None
+        if not entry.is_usable(self._time()):
+            self._lru.pop(key)
+            if self._disk is not None:
+                self._disk.remove(key)
+            return None
+        return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return entry.is_fresh(self._time())
+
+    def store(self, key, path: str, body: bytes):
+        kind = classify_path(path)
+        now = self._time()
+        self._lru.put(key, CacheEntry(path, body, now, self._ttls[kind]))
+        if self._disk is not None and kind in DISK_KINDS:
+            self._disk.put(key, path, body, now)
+
+    def restore(self, key, path: str, body: bytes):
+        '''
+        Put back a body that was kept somewhere else (eg. with the session),
+        however old it is.  It is stale straight away, so it gets
+        revalidated, but is usable for another `MAX_STALE`
+        '''
+        ttl = self._ttls[classify_path(path)]
+        self._lru.put(key, CacheEntry(path, body, self._time() - ttl, ttl))
+
+    def invalidate(self, predicate: typing.Callable[[CacheEntry], bool]):
+        '''
+        Remove every in memory entry that the predicate returns True for.
+        They are also removed from the disk.
+        '''
+        for key, entry in self._lru.items():
+            if predicate(entry):
+                self._lru.pop(key)
+                if self._disk is not None:
+                    self._disk.remove(key)
+
+    def invalidate_paths(self, predicate: typing.Callable[[str], bool]):
+        '''
+        Remove every entry where the predicate returns True for its
+        request path, both in memory and on disk
+        '''
+        self.invalidate(lambda entry: predicate(entry.path))
+        if self._disk is not None:
+            self._disk.remove_paths(predicate)
+
+    def invalidate_containing(self, thing_id: str):
+        '''
+        Remove every entry that mentions the given thing, eg. 't3_9vzevr'
+        '''
+        needle = bytes(thing_id, 'utf8')
+        self.invalidate(lambda entry: needle in entry.body)
+        if self._disk is not None:
+            self._disk.remove_containing(needle, self._time())
+
+    def clear(self):
+        self._lru.clear()
+
+    def save(self):
+        '''
+        Flush anything that has not been written to the disk yet
+        '''
+        if self._disk is not None:
+            self._disk.save_index()
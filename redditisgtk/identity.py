@@ -18,7 +18,6 @@
 from gi.repository import Gtk
 from gi.repository import GLib
 from gi.repository import Soup
-from gi.repository import WebKit2
 from gi.repository import GObject
 
 import os
@@ -65,6 +64,7 @@ class IdentityController(GObject.GObject):
                     token  = api.OAuthTokenManager(
                             self._session,
                             token=data,
+                            account_id=id_,
                     )
                     token.value_changed.connect(self._token_value_changed_cb)
                     self._tokens[id_] = token
@@ -119,5 +119,6 @@ class IdentityController(GObject.GObject):
         self._tokens[id] = api.OAuthTokenManager(
                 self._session,
                 code=code,
-                ready_callback=done_cb)
+                ready_callback=done_cb,
+                account_id=id)
         self._tokens[id].value_changed.connect(self._token_value_changed_cb)
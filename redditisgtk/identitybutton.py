@@ -19,7 +19,6 @@ import urllib.parse
 from uuid import uuid4
 
 from gi.repository import Gtk
-from gi.repository import WebKit2
 
 from redditisgtk.identity import IdentityController
 
@@ -122,6 +121,8 @@ class SignInWindow(Gtk.Window):
         self._state = str(uuid4())
         self._ic = ic
 
+        # WebKit is slow to load, so only load it when it is needed
+        from gi.repository import WebKit2
         ctx = WebKit2.WebContext.get_default()
         ctx.register_uri_scheme('redditgtk', self.__uri_scheme_cb)
 
@@ -0,0 +1,246 @@
+# Copyright 2018 Sam Parkinson <sam@sam.today>
+#
+# This file is part of Something for Reddit.
+#
+# Something for Reddit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Something for Reddit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Cache for thumbnails and preview images, keyed by url
+'''
+
+import typing
+
+from gi.repository import Soup
+from gi.repository import GLib
+from gi.repository import GdkPixbuf
+
+from redditisgtk import workers
+from redditisgtk.httpcache import LRUCache, DiskCache
+from redditisgtk.scheduler import RequestScheduler
+
+
+def pixbuf_size(pixbuf: GdkPixbuf.Pixbuf) -> int:
+    '''
+    Roughly how many bytes of memory the pixbuf uses
+    '''
+    return pixbuf.props.rowstride * pixbuf.props.height
+
+
+def decode_pixbuf(data: bytes, max_width: int = None,
+                  max_height: int = None) -> typing.Optional[GdkPixbuf.Pixbuf]:
+    '''
+    Decode an image, scaling it down to fit in the box if it is bigger.
+    The image is decoded straight to that size, rather than being decoded
+    at full size and then scaled.  Safe to call from a worker thread.
+    '''
+    pbl = GdkPixbuf.PixbufLoader()
+
+    def size_prepared_cb(pbl, width, height):
+        scale = min(
+            (max_width or width) / width,
+            (max_height or height) / height)
+        if scale < 1:
+            pbl.set_size(max(1, int(width * scale)),
+                         max(1, int(height * scale)))
+    pbl.connect('size-prepared', size_prepared_cb)
+
+    try:
+        pbl.write(data)
+        pbl.close()
+    except GLib.Error as e:
+        print(e)
+        return None
+    return pbl.get_pixbuf()
+
+
+class ImageTicket():
+    '''
+    Represents a single call to `ImageCache.get`
+    '''
+
+    def __init__(self, key: tuple, callback):
+        # (url, max_width, max_height)
+        self.key = key
+        self.callback = callback
+        self.cancelled = False
+
+    @property
+    def url(self):
+        return self.key[0]
+
+
+class ImageCache():
+    '''
+    Two tier image cache.  Decoded pixbufs are kept in memory, and the
+    encoded images are kept on disk (if a `DiskCache` is given).  When many
+    people ask for the same url at once, it is only downloaded once.
+
+    Images are decoded on a worker thread, at the size they will be shown.
+
+    Images are not on the reddit api, so they don't count towards our
+    rate limit and are sent at a low priority.
+
+    Args:
+        session (Soup.Session):  dependency
+        disk (DiskCache):  optional 2nd tier
+        max_bytes (int):  total size of the pixbufs to keep in memory
+        run_in_thread:  dependency, see `workers.run_in_thread`
+    '''
+
+    def __init__(self, session: Soup.Session, disk: DiskCache = None,
+                 max_bytes: int = 32 * 1024 * 1024,
+                 run_in_thread=workers.run_in_thread):
+        self._scheduler = RequestScheduler(session)
+        self._disk = disk
+        self._run_in_thread = run_in_thread
+        # (url, max_width, max_height) -> pixbuf
+        self._memory = LRUCache(max_bytes, sizeof=pixbuf_size)
+        # (url, max_width, max_height) -> [ImageTicket], until it is decoded
+        self._pending = {}
+        # url -> Soup.Message
+        self._downloading = {}
+
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._joined = 0
+        self._misses = 0
+
+    def get(self, url: str,
+            callback: typing.Callable[[GdkPixbuf.Pixbuf], typing.Any],
+            max_width: int = None, max_height: int = None) -> ImageTicket:
+        '''
+        Get the image at the url, scaled down to fit in the max size if
+        given.  The callback is called on the main thread with the pixbuf,
+        or None if it could not be loaded.  Returns a ticket that can be
+        passed to `cancel`.
+        '''
+        key = (url, max_width, max_height)
+        ticket = ImageTicket(key, callback)
+        pixbuf = self._memory.get(key)
+        if pixbuf is not None:
+            self._memory_hits += 1
+            callback(pixbuf)
+            return ticket
+
+        if key in self._pending:
+            self._joined += 1
+            self._pending[key].append(ticket)
+            return ticket
+        self._pending[key] = [ticket]
+
+        if url in self._downloading:
+            # Somebody wants it at another size; we get decoded once
+            # the download is done
+            self._joined += 1
+            return ticket
+
+        if self._disk is not None:
+            found = self._disk.get((url,))
+            if found is not None:
+                _, data, _ = found
+                self._disk_hits += 1
+                self._decode(key, data, from_disk=True)
+                return ticket
+
+        self._misses += 1
+        msg = Soup.Message.new('GET', url)
+        self._downloading[url] = msg
+        self._scheduler.queue(msg, self.__message_done_cb, url,
+                              priority=Soup.MessagePriority.LOW,
+                              budgeted=False)
+        return ticket
+
+    def cancel(self, ticket: ImageTicket):
+        '''
+        Stop the callback from being called.  The download is cancelled
+        once nobody else wants the image.
+        '''
+        ticket.cancelled = True
+        url = ticket.url
+        if url not in self._downloading:
+            return
+
+        keys = self._pending_keys(url)
+        if all(t.cancelled for key in keys for t in self._pending[key]):
+            for key in keys:
+                del self._pending[key]
+            self._scheduler.cancel(self._downloading.pop(url))
+
+    def _pending_keys(self, url: str) -> typing.List[tuple]:
+        return [key for key in self._pending if key[0] == url]
+
+    def __message_done_cb(self, session, msg, url):
+        if self._downloading.get(url) is not msg:
+            return
+        del self._downloading[url]
+        keys = self._pending_keys(url)
+
+        data = msg.props.response_body.flatten().get_data()
+        if msg.props.status_code != 200 or not data:
+            for key in keys:
+                self.__decoded_cb(None, key, None, False)
+            return
+
+        for i, key in enumerate(keys):
+            # Only the first one needs to save it to the disk
+            self._decode(key, data, from_disk=False, store=(i == 0))
+
+    def _decode(self, key: tuple, data: bytes, from_disk: bool,
+                store: bool = False):
+        _, max_width, max_height = key
+        # If the decoder raises, everybody waiting still gets called back
+        self._run_in_thread(
+            decode_pixbuf, (data, max_width, max_height),
+            self.__decoded_cb, key, data, from_disk, store,
+            error_callback=lambda: self.__decoded_cb(
+                None, key, data, from_disk))
+
+    def __decoded_cb(self, pixbuf, key, data, from_disk, store=False):
+        url = key[0]
+        tickets = self._pending.pop(key, [])
+        if pixbuf is not None:
+            self._memory.put(key, pixbuf)
+            if store and self._disk is not None:
+                self._disk.put((url,), url, data, 0)
+        elif from_disk:
+            # It is broken, so don't load it from there again
+            self._disk.remove((url,))
+
+        for ticket in tickets:
+            if not ticket.cancelled:
+                ticket.callback(pixbuf)
+
+    def get_stats(self) -> dict:
+        '''
+        Hit counters, for debugging
+        '''
+        requests = (self._memory_hits + self._disk_hits + self._joined +
+                    self._misses)
+        hits = self._memory_hits + self._disk_hits
+        return {
+            'memory_hits': self._memory_hits,
+            'disk_hits': self._disk_hits,
+            'joined': self._joined,
+            'misses': self._misses,
+            'hit_rate': hits / requests if requests else 0,
+            'memory_bytes': self._memory.total_bytes,
+            'disk_bytes': self._disk.total_bytes if self._disk else 0,
+        }
+
+    def save(self):
+        '''
+        Write the disk index, call before exiting
+        '''
+        if self._disk is not None:
+            self._disk.save_index()
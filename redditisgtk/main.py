@@ -17,6 +17,7 @@
 
 import re
 import sys
+import typing
 from argparse import ArgumentParser
 
 from gi.repository import Gtk
@@ -28,14 +29,18 @@ from gi.repository import Soup
 from redditisgtk.sublist import SubList
 from redditisgtk.subentry import SubEntry
 from redditisgtk.api import RedditAPI, APIFactory
-from redditisgtk.webviews import (FullscreenableWebview, ProgressContainer,
-                                  WebviewToolbar)
-from redditisgtk.readcontroller import get_read_controller
+from redditisgtk.readcontroller import get_read_controller, get_data_file_path
+from redditisgtk.httpcache import DiskCache
+from redditisgtk.imagecache import ImageCache
 from redditisgtk.identity import IdentityController
 from redditisgtk.identitybutton import IdentityButton
 from redditisgtk.comments import CommentsView
-from redditisgtk.settings import get_settings, show_settings
-from redditisgtk import webviews
+from redditisgtk.settings import (get_settings, show_settings,
+                                  get_collapse_rule)
+from redditisgtk.session import Session, load_session, save_session
+from redditisgtk.gtkutil import open_uri_external
+from redditisgtk import startuptiming
+from redditisgtk import workers
 
 
 VIEW_WEB = 0
@@ -48,7 +53,13 @@ class RedditWindow(Gtk.Window):
             self,
             ic: IdentityController,
             api_factory: APIFactory,
-            start_sub: str = None):
+            start_sub: str = None,
+            session: Session = None):
+        '''
+        Args:
+            session (Session):  what to show first, from the last time the
+                app was closed; see `get_session`
+        '''
         Gtk.Window.__init__(self, title='Something For Reddit',
                             icon_name='today.sam.reddit-is-gtk')
         self.add_events(Gdk.EventMask.KEY_PRESS_MASK)
@@ -59,6 +70,7 @@ class RedditWindow(Gtk.Window):
         self._ic.token_changed.connect(self._token_changed_cb)
         self._api = None
         self._api_factory = api_factory
+        self._session = session
 
         settings = Gtk.Settings.get_default()
         screen = Gdk.Screen.get_default()
@@ -77,8 +89,10 @@ class RedditWindow(Gtk.Window):
         self.add(self._paned)
         self._paned.show()
 
-        self._webview = FullscreenableWebview()
-        self._webview_bin = ProgressContainer(self._webview)
+        # Made by _get_webview, the 1st time that a link is opened
+        self._webview = None
+        self._webview_bin = None
+        self._webview_toolbar = None
         self._comments = None
         self._stack = Gtk.Stack()
         self._stack.connect('notify::visible-child', self.__stack_child_cb)
@@ -111,6 +125,21 @@ class RedditWindow(Gtk.Window):
 
     def connect_api(self, api: RedditAPI):
         start_sub = None
+        # The session is only for the 1st api, and only if it is for the
+        # same account (eg. the frontpage is different for everybody)
+        session = self._session
+        self._session = None
+        if session is not None and session.user != api.user_name:
+            session = None
+        if session is not None:
+            start_sub = session.sub
+            # Before the views ask for them
+            if session.sub_body is not None:
+                api.restore_cached_body(
+                    session.sub, bytes(session.sub_body, 'utf8'))
+            if session.thread is not None and session.thread_body is not None:
+                api.restore_cached_body(
+                    session.thread, bytes(session.thread_body, 'utf8'))
         if start_sub is None:
             start_sub = get_settings()['default-sub']
 
@@ -126,7 +155,10 @@ class RedditWindow(Gtk.Window):
         self._api = api
         self._api.request_failed.connect(self.__request_failed_cb)
 
-        self._sublist = SubList(self._api, start_sub)
+        self._sublist = SubList(
+            self._api, start_sub,
+            virtual=get_settings()['virtual-sublist'],
+            collapse=get_collapse_rule())
         self._sublist.new_other_pane.connect(self.__new_other_pane_cb)
         self._sublist_bin.add(self._sublist)
         #self._paned.child_set_property(self._sublist, 'shrink', True)
@@ -138,6 +170,48 @@ class RedditWindow(Gtk.Window):
         self._left_header.props.custom_title = self._subentry
         self._subentry.show()
 
+        if session is not None:
+            self._restore_session(session)
+
+    def _restore_session(self, session: Session):
+        '''
+        Put things back where they were.  The listing and thread are shown
+        from the response cache (see `connect_api`) straight away, and
+        refreshed after
+        '''
+        self._sublist.scroll_to_position(session.sub_position)
+        if session.pane_position is not None:
+            self._paned.props.position = session.pane_position
+        if session.thread is not None:
+            cv = CommentsView(self._api, permalink=session.thread,
+                              collapse=get_collapse_rule())
+            cv.scroll_to_position(session.thread_position)
+            self.__new_other_pane_cb(None, session.link, cv,
+                                     session.link is not None)
+
+    def get_session(self) -> Session:
+        '''
+        Returns what is on the screen, to be restored next time
+        '''
+        session = Session(
+            user=self._api.user_name,
+            sub=self._sublist.get_uri(),
+            sub_position=self._sublist.get_position(),
+            pane_position=self._paned.props.position)
+        body = self._api.get_cached_body(session.sub)
+        if body is not None:
+            session.sub_body = str(body, 'utf8')
+        if self._comments is not None:
+            session.thread = self._comments.get_permalink()
+            session.thread_position = self._comments.get_position()
+            body = self._api.get_cached_body(session.thread)
+            if body is not None:
+                session.thread_body = str(body, 'utf8')
+        if self._webview is not None and \
+                self._stack.props.visible_child == self._webview_bin:
+            session.link = self._webview.get_uri()
+        return session
+
     def __request_failed_cb(self, api, msg, info):
         dialog = Gtk.Dialog(use_header_bar=True)
         label = Gtk.Label(label=info)
@@ -171,11 +245,13 @@ class RedditWindow(Gtk.Window):
             self._comments.focus()
             return True
         if event.keyval == Gdk.KEY_3:
+            self._add_web_tab()
             self._stack.set_visible_child(self._webview_bin)
             self._webview.grab_focus()
             return True
 
-        if event.state & Gdk.ModifierType.MOD1_MASK:
+        if event.state & Gdk.ModifierType.MOD1_MASK and \
+                self._webview is not None:
             if event.keyval == Gdk.KEY_Left:
                 self._webview.go_back()
                 return True
@@ -186,16 +262,17 @@ class RedditWindow(Gtk.Window):
     def __new_other_pane_cb(self, sublist, link, comments, link_first):
         if self._comments is not None:
             self._stack.remove(self._comments)
-        self._stack.remove(self._webview_bin)
+        if self._webview_bin is not None and \
+                self._webview_bin.get_parent() is not None:
+            self._stack.remove(self._webview_bin)
 
         self._comments = comments
         if self._comments is not None:
             self._stack.add_titled(self._comments, 'comments', 'Comments')
             self._comments.show()
 
-        self._stack.add_titled(self._webview_bin, 'web', 'Web')
-        self._webview_bin.show()
-        self._webview.show()
+        if link is not None or self._webview is not None:
+            self._add_web_tab()
         self._paned.position = 400  # TODO: constant
 
         if link_first and link:
@@ -206,6 +283,27 @@ class RedditWindow(Gtk.Window):
             if link is not None:
                 self._webview.load_when_visible(link)
 
+    def _get_webview(self):
+        '''
+        Returns the web view, making it the 1st time.  Importing WebKit
+        is slow, so it waits until a link is opened
+        '''
+        if self._webview is None:
+            from redditisgtk.webviews import (
+                FullscreenableWebview, ProgressContainer, WebviewToolbar)
+
+            self._webview = FullscreenableWebview()
+            self._webview_bin = ProgressContainer(self._webview)
+            self._webview_toolbar = WebviewToolbar(self._webview)
+            self._right_header.pack_end(self._webview_toolbar)
+        return self._webview
+
+    def _add_web_tab(self):
+        self._get_webview()
+        if self._webview_bin.get_parent() is None:
+            self._stack.add_titled(self._webview_bin, 'web', 'Web')
+            self._webview_bin.show()
+            self._webview.show()
 
     def load_uri_from_label(self, uri):
         is_relative = not uri.startswith('http')
@@ -214,6 +312,7 @@ class RedditWindow(Gtk.Window):
             self.goto_reddit_uri(uri)
             return
 
+        self._add_web_tab()
         self._stack.set_visible_child(self._webview_bin)
         self._webview.load_uri(uri)
 
@@ -248,10 +347,9 @@ class RedditWindow(Gtk.Window):
         self._right_header.pack_end(self._stack_switcher)
         self._stack_switcher.show()
 
-        self._webview_toolbar = WebviewToolbar(self._webview)
-        self._right_header.pack_end(self._webview_toolbar)
-
     def __stack_child_cb(self, stack, pspec):
+        if self._webview_toolbar is None:
+            return
         self._webview_toolbar.props.visible = \
             stack.props.visible_child == self._webview_bin
 
@@ -284,7 +382,8 @@ class RedditWindow(Gtk.Window):
             self.goto_sublist(uri)
         elif parts[2] == 'comments':
             self.goto_sublist('/r/{}/'.format(parts[1]))
-            cv = CommentsView(self._api, permalink=uri)
+            cv = CommentsView(self._api, permalink=uri,
+                              collapse=get_collapse_rule())
             cv.got_post_data.connect(self.__cv_got_post_data_cb)
             self.__new_other_pane_cb(None, None, cv, False)
 
@@ -302,7 +401,8 @@ class RedditWindow(Gtk.Window):
 
 class Application(Gtk.Application):
 
-    def __init__(self, ic: IdentityController, api_factory: APIFactory):
+    def __init__(self, ic: IdentityController, api_factory: APIFactory,
+                 session: Session = None):
         Gtk.Application.__init__(self,
                                  application_id='today.sam.reddit-is-gtk')
         self.connect('startup', self.__do_startup_cb)
@@ -312,11 +412,18 @@ class Application(Gtk.Application):
         self._queue_uri = None
         self._ic = ic
         self._api_factory = api_factory
+        # Given to the 1st window, then replaced with its session when it
+        # is closed
+        self._session = session
 
     def do_activate(self):
-        self._w = RedditWindow(self._ic, self._api_factory)
+        self._w = RedditWindow(self._ic, self._api_factory,
+                               session=self._session)
+        self._session = None
+        self._w.connect('delete-event', self.__window_delete_cb)
         self.add_window(self._w)
         self._w.show()
+        startuptiming.mark('window shown')
         if self._queue_uri is not None:
             self._w.goto_reddit_uri(self._queue_uri)
             self._queue_uri = None
@@ -361,10 +468,22 @@ class Application(Gtk.Application):
         about_dialog.present()
 
     def __issues_cb(self, action, param):
-        webviews.open_uri_external(
+        open_uri_external(
             'https://github.com/samdroid-apps/something-for-reddit/issues')
 
+    def __window_delete_cb(self, window, event):
+        self._session = window.get_session()
+        return False
+
+    def get_session(self) -> typing.Optional[Session]:
+        '''
+        The session of the window, from when it was closed
+        '''
+        return self._session
+
     def __quit_cb(self, action, param):
+        if self._w is not None:
+            self._session = self._w.get_session()
         self.quit()
 
     def __shortcuts_cb(self, action, param):
@@ -397,11 +516,27 @@ def run():
 
     session = Soup.Session()
     ic = IdentityController(session)
-    api_factory = APIFactory(session)
-
-    a = Application(ic, api_factory)
+    disk_cache = DiskCache(get_data_file_path('cache'),
+                           run_in_background=workers.run_in_background)
+    image_cache = ImageCache(session, disk=DiskCache(
+        get_data_file_path('thumbnails'), max_bytes=32 * 1024 * 1024,
+        autosave=False, run_in_background=workers.run_in_background))
+    api_factory = APIFactory(session, disk_cache=disk_cache,
+                             image_cache=image_cache)
+
+    # Opening a uri replaces the last session, rather than adding to it
+    session_path = get_data_file_path('session.json')
+    saved_session = None
+    if args.uri is None:
+        saved_session = load_session(session_path)
+
+    a = Application(ic, api_factory, session=saved_session)
     if args.uri is not None:
         a.goto_reddit_uri(args.uri)
     status = a.run()
     get_read_controller().save()
+    if a.get_session() is not None:
+        save_session(session_path, a.get_session())
+    disk_cache.save_index()
+    image_cache.save()
     sys.exit(status)
@@ -0,0 +1,88 @@
+# Copyright 2018 Sam Parkinson <sam@sam.today>
+#
+# This file is part of Something for Reddit.
+#
+# Something for Reddit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Something for Reddit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The markdown extension for reddit flavoured markdown.  This is in its own
+module so that the markdown module is only imported when it is needed,
+see `newmarkdown.markdown_to_html`
+'''
+
+from xml.etree import ElementTree
+from xml.etree.ElementTree import Element
+
+import markdown
+from markdown.extensions import Extension
+from markdown.inlinepatterns import Pattern, SimpleTagPattern
+
+
+_URI_RE = r'(https?://|/r/|/u/)([^ \r\t\n]+)'
+_STRIKE_RE = r'(~~)([^~]+)~~'
+_SUPER_RE = r'(\^)(\([^\^\)]+\)|[^\^ ]+)'
+
+
+class _URIPattern(Pattern):
+    def handleMatch(self, match):
+        uri = match.group(2) + match.group(3)
+        el = Element('a')
+        el.set('href', uri)
+        el.text = markdown.util.AtomicString(uri)
+        return el
+
+
+class _SuperPattern(Pattern):
+    def handleMatch(self, match):
+        text = match.group(3)
+        if text.startswith('(') and text.endswith(')'):
+            text = text[1:-1]
+
+        el = Element('sup')
+        el.text = text
+        return el
+
+
+class RedditExtension(Extension):
+    '''
+    Reddit's additions to markdown: bare links, ~~strike~~ and ^super
+    '''
+
+    def extendMarkdown(self, md, md_globals):
+        md.inlinePatterns['uriregex'] = _URIPattern(_URI_RE, md)
+
+        s_tag = SimpleTagPattern(_STRIKE_RE, 'strike')
+        md.inlinePatterns.add('s', s_tag, '>not_strong')
+
+        sup_tag = _SuperPattern(_SUPER_RE, md)
+        md.inlinePatterns.add('sup', sup_tag, '>not_strong')
+
+
+        html_pattern = md.inlinePatterns['html']
+        old = html_pattern.handleMatch
+        def handleMatch(match):
+            # Reddit allows interesting markdown, for example this should pass
+            # through fully: "Hello <name>!"
+            group_number = 2 if markdown.version_info[0] <= 2 else 1
+            raw_html = html_pattern.unescape(match.group(2))
+            try:
+                root = ElementTree.fromstring('<div>'+raw_html+'</div>')
+            except ElementTree.ParseError:
+                # This is not proper html, so pass it through rather than
+                # extracting it into an unchangeable stash
+                return raw_html
+            else:
+                # This is proper html, so pass it through
+                return old(match)
+        html_pattern.handleMatch = handleMatch
@@ -17,7 +17,6 @@
 
 from gi.repository import Gtk
 from gi.repository import Gdk
-from gi.repository import GdkPixbuf
 
 import subprocess
 from tempfile import mkstemp
@@ -25,7 +24,6 @@ import urllib.parse
 from html.parser import HTMLParser
 
 from redditisgtk.api import RedditAPI
-from redditisgtk.webviews import FullscreenableWebview
 
 
 def _unescape(s):
@@ -67,6 +65,8 @@ class WebViewPopover(Gtk.Popover):
             uri = 'https:' + uri
 
         Gtk.Popover.__init__(self, **kwargs)
+        # WebKit is slow to load, so only load it when it is needed
+        from redditisgtk.webviews import FullscreenableWebview
         self._wv = FullscreenableWebview()
         self._wv.load_uri(uri)
         self._wv.set_size_request(width, height)
@@ -111,8 +111,6 @@ class _RemoteImage(Gtk.Bin):
         # TODO: this really shouldn't need a reddit api.  Maybe just a soup
         # session?  This feels like a bad DI pattern right now
         Gtk.Bin.__init__(self)
-        self._max_w = max_w
-        self._max_h = max_h
 
         self._spinner = Gtk.Spinner()
         self.add(self._spinner)
@@ -120,22 +118,13 @@ class _RemoteImage(Gtk.Bin):
 
         self._image = Gtk.Image()
         self.add(self._image)
-        api.download_thumb(uri, self.__message_done_cb)
+        # GtkImage can not scale images internally, so we get the api to
+        # decode it at the right size
+        api.download_thumb(uri, self.__message_done_cb,
+                           max_width=int(max_w), max_height=int(max_h))
 
     def __message_done_cb(self, pixbuf):
         old_sr = self.get_size_request()
-
-        # GtkImage can not scale images internally, so we need to
-        # pre-process that
-        scale = min(
-            self._max_w / pixbuf.props.width,
-            self._max_h / pixbuf.props.height)
-        if scale < 1:
-            new_w = pixbuf.props.width * scale
-            new_h = pixbuf.props.height * scale
-            pixbuf = pixbuf.scale_simple(
-                new_w, new_h, GdkPixbuf.InterpType.BILINEAR)
-
         self._image.props.pixbuf = pixbuf
         self.remove(self.get_child())
         self.add(self._image)
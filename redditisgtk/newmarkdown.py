@@ -1,75 +1,46 @@
+import re
 import sys
+import typing
+import hashlib
+import threading
 from xml.etree import ElementTree
 from xml.etree.ElementTree import Element
 import html
 
-import markdown
-from markdown.extensions import Extension
-from markdown.inlinepatterns import Pattern, SimpleTagPattern
-from markdown.treeprocessors import Treeprocessor
-
 from gi.repository import Gtk
 from gi.repository import Gdk
 from gi.repository import Pango
 
+from redditisgtk.httpcache import LRUCache
 
-_URI_RE = r'(https?://|/r/|/u/)([^ \r\t\n]+)'
-_STRIKE_RE = r'(~~)([^~]+)~~'
-_SUPER_RE = r'(\^)(\([^\^\)]+\)|[^\^ ]+)'
-
-
-class _URIPattern(Pattern):
-    def handleMatch(self, match):
-        uri = match.group(2) + match.group(3)
-        el = Element('a')
-        el.set('href', uri)
-        el.text = markdown.util.AtomicString(uri)
-        return el
-
-
-class _SuperPattern(Pattern):
-    def handleMatch(self, match):
-        text = match.group(3)
-        print(text)
-        if text.startswith('(') and text.endswith(')'):
-            text = text[1:-1]
 
-        el = Element('sup')
-        el.text = text
-        return el
+# A Markdown keeps state from the last text it converted until it is
+# reset, and can't be used by 2 threads at once.  So each thread gets its
+# own, which is reset after every use
+_markdown_instances = threading.local()
 
 
-class _RedditExtension(Extension):
-    def extendMarkdown(self, md, md_globals):
-        md.inlinePatterns['uriregex'] = _URIPattern(_URI_RE, md)
+def _get_markdown() -> 'markdown.Markdown':
+    md = getattr(_markdown_instances, 'md', None)
+    if md is None:
+        # The markdown module is slow to import, and only needed once the
+        # 1st self post or comment is shown
+        import markdown
+        from redditisgtk.markdownext import RedditExtension
+        md = markdown.Markdown(extensions=[RedditExtension()])
+        _markdown_instances.md = md
+    return md
 
-        s_tag = SimpleTagPattern(_STRIKE_RE, 'strike')
-        md.inlinePatterns.add('s', s_tag, '>not_strong')
 
-        sup_tag = _SuperPattern(_SUPER_RE, md)
-        md.inlinePatterns.add('sup', sup_tag, '>not_strong')
-
-
-        html_pattern = md.inlinePatterns['html']
-        old = html_pattern.handleMatch
-        def handleMatch(match):
-            # Reddit allows interesting markdown, for example this should pass
-            # through fully: "Hello <name>!"
-            group_number = 2 if markdown.version_info[0] <= 2 else 1
-            raw_html = html_pattern.unescape(match.group(2))
-            try:
-                root = ElementTree.fromstring('<div>'+raw_html+'</div>')
-            except ElementTree.ParseError:
-                # This is not proper html, so pass it through rather than
-                # extracting it into an unchangeable stash
-                return raw_html
-            else:
-                # This is proper html, so pass it through
-                return old(data)
-        html_pattern.handleMatch = handleMatch
-
-
-MDX_CONTEXT = markdown.Markdown(extensions=[_RedditExtension()])
+def markdown_to_html(text: str) -> str:
+    '''
+    Convert reddit flavoured markdown to html; safe to call from any thread
+    '''
+    md = _get_markdown()
+    try:
+        return md.convert(text)
+    finally:
+        md.reset()
 
 
 class AlignedLabel(Gtk.Label):
@@ -82,6 +53,39 @@ class AlignedLabel(Gtk.Label):
             **kwargs)
 
 
+class Block():
+    '''
+    The parsed form of the text, one `Block` per widget.  Parsing the html
+    is slow, but turning blocks in to widgets is fast; so the blocks are
+    what gets cached.  They don't touch GTK, so can be made on any thread.
+
+    Kinds of block:
+
+    * markup:  label showing the pango markup in `text`
+    * label:  label showing the plain `text`
+    * box:  vertical box of the `children`
+    * separator
+    * placeholder:  for a tag we don't understand
+    '''
+
+    __slots__ = ('kind', 'text', 'classes', 'children')
+
+    def __init__(self, kind: str, text: str = None,
+                 classes: typing.Tuple[str, ...] = (),
+                 children: typing.List['Block'] = None):
+        self.kind = kind
+        self.text = text
+        self.classes = classes
+        self.children = children or []
+
+    def sizeof(self) -> int:
+        '''
+        Roughly how many bytes of memory the block (and children) uses
+        '''
+        return 100 + len(self.text or '') + sum(
+            child.sizeof() for child in self.children)
+
+
 HTML_TO_PANGO_INLINE_TAG = {
     'strong': ('<b>', '</b>'),
     'em': ('<i>', '</i>'),
@@ -107,7 +111,7 @@ def _html_inline_tag_to_pango(el: Element) -> (str, str):
         return '', ''
 
 
-def _make_inline_label(el: Element, initial_text: str = None) -> Gtk.Label:
+def _make_inline_block(el: Element, initial_text: str = None) -> Block:
     fragments = [initial_text]
 
     def extract_text(el, root=False):
@@ -131,15 +135,7 @@ def _make_inline_label(el: Element, initial_text: str = None) -> Gtk.Label:
             fragments.append(end)
 
     extract_text(el, True)
-
-    label = AlignedLabel()
-    label.connect('activate-link', __activate_link_cb)
-
-    markup = ''.join(x for x in fragments if x is not None)
-    label.set_markup(markup)
-
-    label.show()
-    return label
+    return Block('markup', ''.join(x for x in fragments if x is not None))
 
 
 def __activate_link_cb(label, uri):
@@ -152,68 +148,287 @@ BLOCK_TAGS = ['div', 'ol', 'ul', 'blockquote']
 HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
 
 
-def _make_li_widget(el: Element, parent: Element, index: int) -> Gtk.Widget:
+def _make_li_block(el: Element, parent: Element, index: int) -> Block:
     dot = '⚫ '
     if parent is not None and parent.tag == 'ol':
         dot = '{}. '.format(index+1)
-    return _make_inline_label(el, initial_text=dot)
-
+    return _make_inline_block(el, initial_text=dot)
 
-def _make_block_widget(el: Element) -> Gtk.Widget:
-    box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-    box.get_style_context().add_class('mdx-block')
-    box.get_style_context().add_class('mdx-block-'+el.tag)
 
+def _make_box_block(el: Element) -> Block:
     assert el.text is None or el.text.strip() == ''
+    children = []
     for i, inner in enumerate(el):
         assert inner.tail is None or inner.tail.strip() == ''
-        box.add(convert_tree_to_widgets(inner, parent=el, index=i))
+        children.append(convert_tree_to_blocks(inner, parent=el, index=i))
+    return Block('box', classes=('mdx-block', 'mdx-block-'+el.tag),
+                 children=children)
 
-    box.show()
-    return box
 
-def _make_heading_widget(el: Element) -> Gtk.Widget:
-    label = AlignedLabel()
-    label.props.label = el.text
-    label.get_style_context().add_class('mdx-heading')
-    label.get_style_context().add_class('mdx-heading-'+el.tag)
-    label.show()
-    return label
+def _make_heading_block(el: Element) -> Block:
+    return Block('label', el.text,
+                 classes=('mdx-heading', 'mdx-heading-'+el.tag))
 
 
-def _make_code_widget(el: Element) -> Gtk.Widget:
+def _make_code_block(el: Element) -> Block:
     assert len(list(el)) == 1
     child = list(el)[0]
     code = child.text
     assert code is not None
+    return Block('label', html.unescape(code), classes=('mdx-block-code',))
 
-    label = AlignedLabel()
-    label.props.label = html.unescape(code)
-    label.get_style_context().add_class('mdx-block-code')
-    label.show()
-    return label
 
-
-def convert_tree_to_widgets(el: Element, parent: Element = None,
-                            index: int = None) -> Gtk.Label:
+def convert_tree_to_blocks(el: Element, parent: Element = None,
+                           index: int = None) -> Block:
     if el.tag == 'p':
-        return _make_inline_label(el)
+        return _make_inline_block(el)
     elif el.tag == 'li':
-        return _make_li_widget(el, parent, index)
+        return _make_li_block(el, parent, index)
     elif el.tag in BLOCK_TAGS:
-        return _make_block_widget(el)
+        return _make_box_block(el)
     elif el.tag in HEADING_TAGS:
-        return _make_heading_widget(el)
+        return _make_heading_block(el)
     elif el.tag == 'pre':
-        return _make_code_widget(el)
+        return _make_code_block(el)
     elif el.tag == 'hr':
-        return Gtk.Separator(visible=True)
+        return Block('separator')
     else:  # pragma: no cover
         print('Unhandled tag', el)
-        placeholder = Gtk.Spinner()
-        placeholder.start()
-        placeholder.show()
-        return placeholder
+        return Block('placeholder')
+
+
+# The tags and entities that _simple_html_to_markup understands
+_SIMPLE_TOKEN_RE = re.compile(r'<(/?)([a-z]+)([^>]*)>|[^<]+')
+_HREF_RE = re.compile(r'\s+href="([^"]*)"')
+_UNKNOWN_ENTITY_RE = re.compile(
+    r'&(?!(?:amp|lt|gt|quot|apos|#[0-9]+|#x[0-9a-fA-F]+);)')
+_MD_DIV_START = '<div class="md">'
+
+
+def _simple_html_to_markup(text: str) -> typing.Optional[str]:
+    '''
+    Most comments are just a paragraph or two of text.  Their html gets
+    turned straight in to the markup for one label, in a single pass over
+    the tags.
+
+    Returns None if the html is not that simple; then it needs to be
+    parsed properly.  For the html that it does handle, the markup is the
+    same as the slow path makes for each paragraph.
+    '''
+    text = text.strip()
+    if text.startswith(_MD_DIV_START) and text.endswith('</div>'):
+        text = text[len(_MD_DIV_START):-len('</div>')]
+    if _UNKNOWN_ENTITY_RE.search(text):
+        # Let ElementTree complain about it
+        return None
+
+    fragments = []
+    # The tags that are open, the 1st is always the <p>
+    stack = []
+    for match in _SIMPLE_TOKEN_RE.finditer(text):
+        closing, tag, attributes = match.groups()
+        if tag is None:
+            if not stack:
+                if match.group().strip():
+                    return None
+                continue
+            raw = html.escape(html.unescape(match.group()))
+            fragments.append(raw if stack[-1] == 'code'
+                             else raw.replace('\n', ''))
+        elif closing:
+            if not stack or stack.pop() != tag:
+                return None
+            if tag == 'code':
+                fragments.append('</tt>')
+            elif tag == 'a':
+                fragments.append('</a>')
+            elif tag != 'p':
+                fragments.append(HTML_TO_PANGO_INLINE_TAG[tag][1])
+        elif tag == 'p':
+            if stack or attributes:
+                return None
+            if fragments:
+                fragments.append('\n\n')
+            stack.append(tag)
+        elif not stack or stack[-1] == 'code':
+            return None
+        elif tag == 'br' and attributes.strip() in ('', '/'):
+            fragments.append('\n')
+        elif tag == 'a':
+            href = _HREF_RE.match(attributes)
+            if href is None:
+                return None
+            fragments.append('<a href="{}">'.format(
+                html.escape(html.unescape(href.group(1)))))
+            stack.append(tag)
+        elif tag in HTML_TO_PANGO_INLINE_TAG and not attributes:
+            fragments.append(HTML_TO_PANGO_INLINE_TAG[tag][0])
+            stack.append(tag)
+        elif tag == 'code' and not attributes:
+            fragments.append('<tt>')
+            stack.append(tag)
+        else:
+            return None
+
+    if stack or not fragments:
+        return None
+    return ''.join(fragments)
+
+
+def parse_html(html: str, fast_path: bool = True) -> Block:
+    '''
+    Parse some html (eg. the `body_html` of a comment) in to blocks
+
+    Args:
+        fast_path (bool):  make a single label for simple html, see
+            `_simple_html_to_markup`
+    '''
+    if fast_path:
+        markup = _simple_html_to_markup(html)
+        if markup is not None:
+            return Block('markup', markup)
+
+    try:
+        root = ElementTree.fromstring('<div>'+html+'</div>')
+    except ElementTree.ParseError as e:
+        print('Error parsing html,', e, 'for html:')
+        print(html)
+        return Block('label', 'Error formatting text:\n\n{}'.format(html))
+    else:
+        return convert_tree_to_blocks(root)
+
+
+def parse_markdown(text: str) -> Block:
+    return parse_html(markdown_to_html(text))
+
+
+def build_widget(block: Block) -> Gtk.Widget:
+    '''
+    Make the widgets for some parsed blocks
+    '''
+    if block.kind == 'markup':
+        widget = AlignedLabel()
+        widget.connect('activate-link', __activate_link_cb)
+        widget.set_markup(block.text)
+    elif block.kind == 'label':
+        widget = AlignedLabel()
+        widget.props.label = block.text
+    elif block.kind == 'box':
+        widget = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        for child in block.children:
+            widget.add(build_widget(child))
+    elif block.kind == 'separator':
+        return Gtk.Separator(visible=True)
+    else:
+        widget = Gtk.Spinner()
+        widget.start()
+
+    ctx = widget.get_style_context()
+    for name in block.classes:
+        ctx.add_class(name)
+    widget.show()
+    return widget
+
+
+class BlockCache():
+    '''
+    Parsed blocks, keyed by a hash of the text they were parsed from.
+    Comments get shown again and again (refreshing, opening the same
+    thread), and this saves parsing them each time.
+
+    It can be used from any thread, so worker threads can parse text
+    before it is shown (see `prepare`).
+
+    Args:
+        max_bytes (int):  roughly how much memory to use, see `Block.sizeof`
+    '''
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024):
+        self._cache = LRUCache(max_bytes, sizeof=Block.sizeof)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._prepared = 0
+
+    @staticmethod
+    def _key(kind: str, text: str) -> tuple:
+        return kind, hashlib.sha1(bytes(text, 'utf8')).digest()
+
+    def get(self, kind: str, text: str,
+            parse: typing.Callable[[str], Block]) -> Block:
+        '''
+        Get the blocks for the text, calling parse if they are not cached.
+        The kind (eg. 'html' or 'markdown') is part of the key.
+        '''
+        key = self._key(kind, text)
+        with self._lock:
+            block = self._cache.get(key)
+            if block is not None:
+                self._hits += 1
+                return block
+            self._misses += 1
+
+        # Parse without the lock, so a worker doesn't block the main thread
+        block = parse(text)
+        with self._lock:
+            self._cache.put(key, block)
+        return block
+
+    def prepare(self, kind: str, texts: typing.Iterable[str],
+                parse: typing.Callable[[str], Block]):
+        '''
+        Parse the texts that are not cached yet, so that `get` is quick
+        when they are shown.  For worker threads.
+        '''
+        for text in texts:
+            key = self._key(kind, text)
+            with self._lock:
+                if key in self._cache:
+                    continue
+            block = parse(text)
+            with self._lock:
+                self._cache.put(key, block)
+                self._prepared += 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> dict:
+        '''
+        Hit counters, for debugging
+        '''
+        requests = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'prepared': self._prepared,
+            'hit_rate': self._hits / requests if requests else 0,
+            'entries': len(self._cache),
+            'bytes': self._cache.total_bytes,
+        }
+
+
+_cache = BlockCache()
+
+
+def get_cache_stats() -> dict:
+    return _cache.get_stats()
+
+
+def prepare_html(texts: typing.Iterable[str]):
+    '''
+    Parse html that is about to be shown; safe to call from a worker
+    thread.  Then `make_html_widget` only has to make the widgets.
+    '''
+    _cache.prepare('html', texts, parse_html)
+
+
+def prepare_markdown(texts: typing.Iterable[str]):
+    '''
+    Like `prepare_html`, but for markdown (see `make_markdown_widget`)
+    '''
+    _cache.prepare('markdown', texts, parse_markdown)
 
 
 def make_markdown_widget(text: str) -> Gtk.Widget:
@@ -225,24 +440,14 @@ def make_markdown_widget(text: str) -> Gtk.Widget:
 
         text - markdown text input
     '''
-    html = MDX_CONTEXT.convert(text)
-    return make_html_widget(html)
+    return build_widget(_cache.get('markdown', text, parse_markdown))
 
 
 def make_html_widget(html: str) -> Gtk.Widget:
     '''
     Make a widget given some html text.  Must have a single element as root.
     '''
-    try:
-        root = ElementTree.fromstring('<div>'+html+'</div>')
-    except ElementTree.ParseError as e:
-        print('Error parsing html,', e, 'for html:')
-        print(html)
-        label = AlignedLabel(label='Error formatting text:\n\n{}'.format(html))
-        label.show()
-        return label
-    else:
-        return convert_tree_to_widgets(root)
+    return build_widget(_cache.get('html', html, parse_html))
 
 
 if __name__ == '__main__':
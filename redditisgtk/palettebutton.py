@@ -61,6 +61,15 @@ class _PaletteButton(GObject.GObject):
             if not self._recycle:
                 self._palette = None
 
+    def reset(self):
+        '''
+        Close and forget the palette, so a new one is made next time; eg.
+        when the thing it is about has changed
+        '''
+        if self._palette is not None and self._button.props.active:
+            self._button.props.active = False
+        self._palette = None
+
     def __dialog_closed_cb(self, dialog, response):
         dialog.get_content_area().remove(self._pc)
         self._palette.add(self._pc)
@@ -24,6 +24,7 @@ from redditisgtk.api import RedditAPI
 from redditisgtk.buttons import (ScoreButtonBehaviour, AuthorButtonBehaviour,
                                  TimeButtonBehaviour, SubButtonBehaviour)
 from redditisgtk.gtkutil import process_shortcuts
+from redditisgtk.uifactory import get_factory
 
 
 class PostTopBar(Gtk.Bin):
@@ -40,11 +41,13 @@ class PostTopBar(Gtk.Bin):
         Gtk.Bin.__init__(self, can_focus=True)
         self.add_events(Gdk.EventMask.KEY_PRESS_MASK)
         self._api = api
-        self.data = data
         self._toplevel_cv = toplevel_cv
+        self._show_subreddit = show_subreddit
+        # True while showing new data, so the toggles don't save it
+        self._binding = False
 
-        self._b = Gtk.Builder.new_from_resource(
-            '/today/sam/reddit-is-gtk/post-top-bar.ui')
+        self._b = get_factory(
+            '/today/sam/reddit-is-gtk/post-top-bar.ui').build()
         self.add(self._b.get_object('box'))
         self.get_child().show()
 
@@ -53,37 +56,72 @@ class PostTopBar(Gtk.Bin):
         self._b.get_object('refresh').props.visible = refreshable
 
         self._favorite = self._b.get_object('favorite')
-        self._favorite.props.visible = 'saved' in self.data
-        self._favorite.props.active = self.data.get('saved')
-
         self._name_button = self._b.get_object('name')
-        self._abb = AuthorButtonBehaviour(
-            self._name_button, self.data,
-            self._toplevel_cv.get_original_poster(),
-            show_flair=True)
-
         self._score_button = self._b.get_object('score')
-        self._score_button.props.visible = 'score' in data
-        if 'score' in data:
-            self._sbb = ScoreButtonBehaviour(
-                self._api, self._score_button, self.data)
-
         self._time_button = self._b.get_object('time')
-        self._tbb = TimeButtonBehaviour(self._time_button, self.data)
-
         self._reply_button = self._b.get_object('reply')
         self._reply_pb = connect_palette(
             self._reply_button, self._make_reply_palette, recycle_palette=True)
-
         self._sub_button = self._b.get_object('sub')
         self._sub_button.props.visible = show_subreddit
-        if show_subreddit:
-            self._subbb = SubButtonBehaviour(self._sub_button, self.data)
-
-        self._b.connect_signals(self)
 
+        self._abb = None
+        self._sbb = None
+        self._tbb = None
+        self._subbb = None
         # We need to lazy allocate this list, otherwise we get bogus sizes
         self._hideables = None
+        self.bind(data)
+
+        self._b.connect_signals(self)
+
+    def bind(self, data: dict):
+        '''
+        Show a different post or comment, eg. when a row is recycled
+        '''
+        self.data = data
+        if self._hideables is not None:
+            # Show what was hidden to fit the last one, so it can all be
+            # measured again
+            for child, _ in self._hideables:
+                child.show()
+            self._hideables = None
+            self.queue_resize()
+        # The reply palette was for the last one
+        self._reply_pb.reset()
+
+        self._binding = True
+        self._favorite.props.visible = 'saved' in data
+        self._favorite.props.active = data.get('saved')
+        self._binding = False
+
+        # Keep a reference so the GC doesn't collect them
+        if self._abb is None:
+            self._abb = AuthorButtonBehaviour(
+                self._name_button, data,
+                self._toplevel_cv.get_original_poster(),
+                show_flair=True)
+        else:
+            self._abb.bind(data)
+
+        self._score_button.props.visible = 'score' in data
+        if 'score' in data:
+            if self._sbb is None:
+                self._sbb = ScoreButtonBehaviour(
+                    self._api, self._score_button, data)
+            else:
+                self._sbb.bind(data)
+
+        if self._tbb is None:
+            self._tbb = TimeButtonBehaviour(self._time_button, data)
+        else:
+            self._tbb.bind(data)
+
+        if self._show_subreddit:
+            if self._subbb is None:
+                self._subbb = SubButtonBehaviour(self._sub_button, data)
+            else:
+                self._subbb.bind(data)
 
     def do_get_request_mode(self):
         return Gtk.SizeRequestMode.HEIGHT_FOR_WIDTH
@@ -151,6 +189,8 @@ class PostTopBar(Gtk.Bin):
         self.hide_toggled.emit(not toggle.props.active)
 
     def favorite_toggled_cb(self, button):
+        if self._binding:
+            return
         self._api.set_saved(self.data['name'], button.props.active,
                                    None)
 
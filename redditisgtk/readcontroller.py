@@ -16,9 +16,19 @@
 # along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import re
+import time
+import typing
+import operator
+from array import array
+from bisect import bisect_left
+from itertools import chain, islice, repeat
 from gi.repository import GLib
 from gi.repository import GObject
 
+from redditisgtk import workers
+from redditisgtk.settings import get_settings
+
 
 def get_data_file_path(name):
     '''
@@ -37,38 +47,382 @@ def get_data_file_path(name):
     return os.path.join(d, name)
 
 
+# Names like t3_8xk2c are packed in to 64 bits.  The key is the base 36
+# number "3" + the id padded to 8 digits ("0008xk2c"), so it sorts by kind
+# then id.  That takes 46 bits, and the day it was read takes the other 16
+_NAME_RE = re.compile(r't[1-9]_[0-9a-z]{1,8}$')
+_KIND_BASE = 36 ** 8
+_DAY_BITS = 16
+_DAY_MASK = (1 << _DAY_BITS) - 1
+_BASE36 = '0123456789abcdefghijklmnopqrstuvwxyz'
+# Journal lines that can all be packed.  Times are limited to 10 digits
+# (starting with 0-4), so the day fits in 16 bits
+_PACKABLE_LINES_RE = re.compile(
+    r'(?:t[1-9]_[0-9a-z]{1,8} [0-4]?[0-9]{1,9}\n)*')
+# Reads are kept in a dict until there are this many, then sorted in
+MERGE_SIZE = 4096
+
+
+def _encode(name: str) -> typing.Optional[int]:
+    if _NAME_RE.match(name) is None:
+        return None
+    return int(name[1] + name[3:].rjust(8, '0'), 36)
+
+
+def _decode(key: int) -> str:
+    kind, id = divmod(key, _KIND_BASE)
+    digits = []
+    while True:
+        id, digit = divmod(id, 36)
+        digits.append(_BASE36[digit])
+        if id == 0:
+            break
+    return 't{}_{}'.format(kind, ''.join(reversed(digits)))
+
+
+def _to_day(when: int) -> int:
+    return min(max(int(when) // 86400, 0), _DAY_MASK)
+
+
+class ReadSet():
+    '''
+    A set of reddit names, and when each was read.  It is much smaller
+    than a python set of the names (8 bytes a name), as they are packed in
+    to a sorted array of ints, see `_encode`.  Lookups are a binary search.
+
+    Names that don't look like reddit names are kept in a normal set.
+    '''
+
+    def __init__(self):
+        # Sorted (key << _DAY_BITS | day)
+        self._packed = array('Q')
+        # key -> day, for the names added since the last merge
+        self._recent = {}
+        # name -> day, for names we can't pack
+        self._other = {}
+
+    def __len__(self):
+        return len(self._packed) + len(self._recent) + len(self._other)
+
+    def __contains__(self, name: str) -> bool:
+        key = _encode(name)
+        if key is None:
+            return name in self._other
+        if key in self._recent:
+            return True
+        i = bisect_left(self._packed, key << _DAY_BITS)
+        return i < len(self._packed) \
+            and self._packed[i] >> _DAY_BITS == key
+
+    def add(self, name: str, when: int):
+        '''
+        Add a name, read at the time (in seconds since the epoch)
+        '''
+        key = _encode(name)
+        if key is None:
+            self._other[name] = _to_day(when)
+            return
+        self._recent[key] = _to_day(when)
+        if len(self._recent) >= MERGE_SIZE:
+            self._merge()
+
+    def update(self, items: typing.Iterable[typing.Tuple[str, int]]):
+        '''
+        Add lots of (name, time) pairs at once
+        '''
+        values = []
+        for name, when in items:
+            key = _encode(name)
+            if key is None:
+                self._other[name] = _to_day(when)
+            else:
+                values.append(key << _DAY_BITS | _to_day(when))
+        self.update_packed(values)
+
+    def update_packed(self, values: typing.Iterable[int]):
+        '''
+        Add lots of names that are already packed, see `parse_journal`
+        '''
+        self._merge()
+        self._set_values(chain(self._packed, values))
+
+    def _merge(self):
+        if not self._recent:
+            return
+        recent = self._recent
+        self._recent = {}
+        self._set_values(chain(
+            self._packed,
+            (key << _DAY_BITS | day for key, day in recent.items())))
+
+    def _set_values(self, values: typing.Iterable[int]):
+        # The journal is mostly sorted already, as that is how compact
+        # writes it; which sort is quick at
+        values = sorted(values)
+        keys = map(operator.rshift, values, repeat(_DAY_BITS))
+        next_keys = map(operator.rshift, islice(values, 1, None),
+                        repeat(_DAY_BITS))
+        if any(map(operator.eq, keys, next_keys)):
+            # When a name is there twice, keep the last time it was read;
+            # the one that is sorted last
+            keys = list(map(operator.rshift, values, repeat(_DAY_BITS)))
+            keys.append(None)
+            values = [value for value, key, next_key
+                      in zip(values, keys, islice(keys, 1, None))
+                      if key != next_key]
+        self._packed = array('Q', values)
+
+    def expire(self, before: int):
+        '''
+        Forget the names that were read before the time
+        '''
+        self._merge()
+        day = _to_day(before)
+        self._packed = array('Q', [
+            v for v in self._packed if v & _DAY_MASK >= day])
+        self._other = dict((name, d) for name, d in self._other.items()
+                           if d >= day)
+
+    def copy(self) -> 'ReadSet':
+        self._merge()
+        copy = ReadSet()
+        copy._packed = array('Q', self._packed)
+        copy._other = dict(self._other)
+        return copy
+
+    def items(self) -> typing.Iterator[typing.Tuple[str, int]]:
+        '''
+        Iterate over the (name, time read) pairs
+        '''
+        self._merge()
+        for value in self._packed:
+            yield (_decode(value >> _DAY_BITS),
+                   (value & _DAY_MASK) * 86400)
+        for name, day in self._other.items():
+            yield name, day * 86400
+
+
+def _split_lines(text: str, size: int) -> typing.Iterator[str]:
+    '''
+    Split the text in to chunks of about the size, at the ends of lines
+    '''
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start + size) + 1 or len(text)
+        yield text[start:end]
+        start = end
+
+
+def parse_journal(text: str, now: int) -> typing.Tuple[
+        typing.Sequence[int], typing.List[typing.Tuple[str, int]], int]:
+    '''
+    Parse the lines of a journal, "name time" or just "name" in files from
+    before the times were kept (those are given the time now).
+
+    This is the slow part of starting up.  So the journal is parsed in
+    chunks, and when every line in a chunk is a name we can pack, they are
+    packed with as little python per line as possible.  Returns the packed
+    values for `ReadSet.update_packed`, a list of (name, time) for the
+    names that can't be packed, and how many lines had no time.
+    '''
+    values = array('Q')
+    other = []
+    untimed = 0
+    for chunk in _split_lines(text, 1 << 16):
+        if _PACKABLE_LINES_RE.fullmatch(chunk):
+            words = chunk.split()
+            keys = map(int, [name[1] + name[3:].rjust(8, '0')
+                             for name in words[0::2]], repeat(36))
+            values.extend([key << _DAY_BITS | when // 86400 for key, when
+                           in zip(keys, map(int, words[1::2]))])
+            continue
+
+        for line in chunk.splitlines():
+            name, _, when = line.strip().partition(' ')
+            if not name:
+                continue
+            if when.isdigit():
+                when = int(when)
+            else:
+                when = now
+                untimed += 1
+            key = _encode(name)
+            if key is None:
+                other.append((name, when))
+            else:
+                values.append(key << _DAY_BITS | _to_day(when))
+    return values, other, untimed
+
+
+# How long to batch up new reads before writing them, in ms
+FLUSH_DELAY = 2000
+# Compact the journal once it has this many lines...
+COMPACT_MIN_LINES = 1000
+# ...and is this many times bigger than it needs to be
+COMPACT_RATIO = 2
+# Posts this old don't show up in listings any more, in seconds
+DEFAULT_MAX_AGE = 180 * 86400
+
+
 class ReadController(GObject.GObject):
+    '''
+    Remembers which posts have been read, in a `ReadSet`.
+
+    The file is a journal, one "name time" per line.  Reading a post
+    appends a line, so the cost of a read doesn't grow with the file.  New
+    lines are batched and written (and synced) together.
+
+    Names read longer ago than the max age are forgotten when the file is
+    loaded.  Duplicate lines (eg. with 2 windows open) build up; so once
+    the journal gets too big, it is rewritten on a worker thread.  It is
+    also rewritten when it has forgotten lines, or lines without a time
+    (which would otherwise get a new time on every load, and never expire).
+
+    Args:
+        data_path (str):  where to keep the journal
+        max_age (int):  seconds to remember a read for, 0 for forever
+        timeout_add, run_in_thread, time_func:  dependencies, for testing
+    '''
 
-    def __init__(self, data_path: str = None):
+    def __init__(self, data_path: str = None,
+                 max_age: int = DEFAULT_MAX_AGE,
+                 timeout_add=GLib.timeout_add,
+                 run_in_thread=workers.run_in_thread,
+                 time_func: typing.Callable[[], float] = time.time):
         GObject.GObject.__init__(self)
+        self._max_age = max_age
+        self._timeout_add = timeout_add
+        self._run_in_thread = run_in_thread
+        self._time = time_func
 
-        self._set = set([])
+        self._read = ReadSet()
         self._data_path = data_path
         if self._data_path is None:
             self._data_path = get_data_file_path('read')
 
+        # (name, time) pairs that are not in the file yet
+        self._pending = []
+        self._flush_scheduled = False
+        # Lines in the file, including duplicates
+        self._journal_lines = 0
+        # The file doesn't end with a newline, so we can't just append
+        self._needs_newline = False
+        # Reads since the compaction started, None if not compacting
+        self._compacting = None
+
         self.load()
 
     def read(self, name):
-        self._set.add(name)
-        GLib.idle_add(self.save)
+        if name in self._read:
+            return
+        when = int(self._time())
+        self._read.add(name, when)
+        self._pending.append((name, when))
+        if self._compacting is not None:
+            self._compacting.append((name, when))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._timeout_add(FLUSH_DELAY, self.__flush_timeout_cb)
 
     def is_read(self, name):
-        return name in self._set
+        return name in self._read
+
+    def __flush_timeout_cb(self):
+        self._flush_scheduled = False
+        self.save()
+        return False
 
     def save(self):
-        with open(self._data_path, 'w') as f:
-            for i in self._set:
-                f.write(i)
+        '''
+        Write the new reads to the journal now, eg. before exiting
+        '''
+        if not self._pending:
+            return
+        self._append(self._data_path, self._pending)
+        self._journal_lines += len(self._pending)
+        self._pending = []
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._compacting is None \
+                and self._journal_lines >= COMPACT_MIN_LINES \
+                and self._journal_lines > COMPACT_RATIO * len(self._read):
+            self.compact()
+
+    def _append(self, path: str, items: list):
+        with open(path, 'a') as f:
+            if self._needs_newline:
                 f.write('\n')
+                self._needs_newline = False
+            f.write(''.join(_format_line(*item) for item in items))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self):
+        '''
+        Rewrite the journal with only what we remember, on a worker thread
+        '''
+        self._compacting = []
+        self._run_in_thread(_write_journal,
+                            (self._data_path, self._read.copy()),
+                            self.__compacted_cb,
+                            error_callback=self.__compact_failed_cb)
+
+    def __compact_failed_cb(self):
+        # The reads since it started were saved to the old journal, so we
+        # just carry on with that; and try again later
+        self._compacting = None
+
+    def __compacted_cb(self, tmp_path):
+        items = self._compacting
+        self._compacting = None
+        # Anything read while it was being written goes on the end, so
+        # the new file has everything
+        self._needs_newline = False
+        if items:
+            self._append(tmp_path, items)
+        os.replace(tmp_path, self._data_path)
+        self._pending = []
+        self._journal_lines = len(self._read)
 
     def load(self):
+        outdated = False
         if os.path.isfile(self._data_path):
+            now = int(self._time())
             with open(self._data_path) as f:
-                l = 0
-                for i in f:
-                    self._set.add(i.strip())
-                    l += 1
+                text = f.read()
+            values, other, untimed = parse_journal(text, now)
+            self._read.update_packed(values)
+            self._read.update(other)
+            if self._max_age:
+                loaded = len(self._read)
+                self._read.expire(now - self._max_age)
+                outdated = len(self._read) < loaded
+            outdated = outdated or untimed > 0
+            self._journal_lines = text.count('\n')
+            self._needs_newline = bool(text) and not text.endswith('\n')
+
+        if outdated:
+            self.compact()
+        else:
+            self._maybe_compact()
+
+
+def _format_line(name: str, when: int) -> str:
+    return '{} {}\n'.format(name, when)
+
+
+def _write_journal(path: str, read: ReadSet) -> str:
+    '''
+    Write a journal with everything in the set, next to the path; returns
+    its path
+    '''
+    tmp_path = str(path) + '.compact'
+    with open(tmp_path, 'w') as f:
+        f.write(''.join(_format_line(*item) for item in read.items()))
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
 
 
 _ctrl = None
@@ -77,5 +431,6 @@ _ctrl = None
 def get_read_controller():
     global _ctrl
     if _ctrl is None:
-        _ctrl = ReadController()
+        days = get_settings()['read-expiry-days']
+        _ctrl = ReadController(max_age=days * 86400)
     return _ctrl
@@ -0,0 +1,259 @@
+# Copyright 2018 Sam Parkinson <sam@sam.today>
+#
+# This file is part of Something for Reddit.
+#
+# Something for Reddit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Something for Reddit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import heapq
+import typing
+
+from gi.repository import Soup
+from gi.repository import GLib
+
+
+# Status code for "Too Many Requests"
+STATUS_TOO_MANY_REQUESTS = 429
+# How long to back off for after a 429 without a reset header, in seconds
+DEFAULT_BACKOFF = 2
+
+
+def _header_float(msg: Soup.Message, name: str) -> typing.Optional[float]:
+    value = msg.props.response_headers.get_one(name)
+    if not isinstance(value, str):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class _Job():
+    def __init__(self, msg, callback, user_data, priority, budgeted,
+                 queued_at, seq):
+        self.msg = msg
+        self.callback = callback
+        self.user_data = user_data
+        self.priority = priority
+        self.budgeted = budgeted
+        self.queued_at = queued_at
+        self.seq = seq
+        self.dropped = False
+
+    def __lt__(self, other):
+        # Higher priority first, then first in first out
+        return (-self.priority, self.seq) < (-other.priority, other.seq)
+
+
+class RequestScheduler():
+    '''
+    Sends messages to the soup session, highest priority first, without
+    going over the rate limit that reddit tells us about in the
+    X-Ratelimit-* headers.
+
+    While the budget is healthy, requests go out as fast as the session
+    will take them.  Once fewer than `burst` requests are left in the
+    window, they are spread out evenly until the window resets.
+
+    Args:
+        session (Soup.Session):  dependency
+        max_in_flight (int):  number of messages to have in the session at
+            once; everything else waits in our priority queue
+        burst (int):  see above
+        time_func, timeout_add:  dependencies, for testing
+    '''
+
+    def __init__(self, session: Soup.Session, max_in_flight: int = 6,
+                 burst: int = 30,
+                 time_func: typing.Callable[[], float] = time.time,
+                 timeout_add=GLib.timeout_add):
+        self._session = session
+        self._max_in_flight = max_in_flight
+        self._burst = burst
+        self._time = time_func
+        self._timeout_add = timeout_add
+
+        self._queue = []
+        self._seq = 0
+        self._jobs = {}  # msg -> _Job, for everything we know about
+        self._in_flight = 0
+        self._budgeted_in_flight = 0
+        self._timer = None
+
+        # Budget as reported by reddit, None until we hear about it
+        self._remaining = None
+        self._reset_at = 0
+        self._last_budgeted_send = 0
+
+        self._waits = 0
+        self._total_wait = 0
+        self._max_wait = 0
+
+    def queue(self, msg: Soup.Message, callback, user_data=None,
+              priority: Soup.MessagePriority = Soup.MessagePriority.NORMAL,
+              budgeted: bool = True):
+        '''
+        Queue a message to be sent.  The arguments are like
+        `Soup.Session.queue_message`.
+
+        Args:
+            priority (Soup.MessagePriority):  what should be sent first
+            budgeted (bool):  False if this does not count against reddit's
+                rate limit (eg. it is for a thumbnail on another host)
+        '''
+        msg.props.priority = priority
+        job = _Job(msg, callback, user_data, priority, budgeted,
+                   self._time(), self._seq)
+        self._seq += 1
+        self._jobs[msg] = job
+        heapq.heappush(self._queue, job)
+        self._pump()
+
+    def raise_priority(self, msg: Soup.Message,
+                       priority: Soup.MessagePriority):
+        '''
+        Move a queued message up to the priority, if it is lower.  Does
+        nothing once it has been sent.
+        '''
+        job = self._jobs.get(msg)
+        if job is None or job.priority >= priority or job not in self._queue:
+            return
+        # The heap can't be reordered in place, so queue a copy and drop
+        # the old one
+        job.dropped = True
+        new_job = _Job(msg, job.callback, job.user_data, priority,
+                       job.budgeted, job.queued_at, self._seq)
+        self._seq += 1
+        msg.props.priority = priority
+        self._jobs[msg] = new_job
+        heapq.heappush(self._queue, new_job)
+        self._pump()
+
+    def cancel(self, msg: Soup.Message):
+        job = self._jobs.pop(msg, None)
+        if job is None:
+            return
+        if job in self._queue:
+            # Not sent yet, so the session doesn't know about it
+            job.dropped = True
+        else:
+            self._session.cancel_message(msg, Soup.Status.CANCELLED)
+
+    def get_stats(self) -> dict:
+        '''
+        Numbers to help debug the scheduler
+        '''
+        now = self._time()
+        return {
+            'queue_depth': len([j for j in self._queue if not j.dropped]),
+            'in_flight': self._in_flight,
+            'remaining': self._remaining,
+            'reset_in': max(0, self._reset_at - now),
+            'mean_wait': self._total_wait / self._waits if self._waits else 0,
+            'max_wait': self._max_wait,
+            'oldest_wait': max(
+                (now - j.queued_at for j in self._queue if not j.dropped),
+                default=0),
+        }
+
+    def _budget_wait(self) -> float:
+        '''
+        Returns the seconds to wait before sending the next budgeted message
+        '''
+        if self._remaining is None:
+            return 0
+        now = self._time()
+        if now >= self._reset_at:
+            # New window, the next response will tell us the new budget
+            self._remaining = None
+            return 0
+
+        available = self._remaining - self._budgeted_in_flight
+        if available > self._burst:
+            return 0
+        if available < 1:
+            return self._reset_at - now
+        spacing = (self._reset_at - now) / available
+        return max(0, self._last_budgeted_send + spacing - now)
+
+    def _pump(self):
+        while self._queue and self._in_flight < self._max_in_flight:
+            job = self._queue[0]
+            if job.dropped:
+                heapq.heappop(self._queue)
+                continue
+
+            if job.budgeted:
+                wait = self._budget_wait()
+                if wait > 0:
+                    self._wait_for(wait)
+                    return
+
+            heapq.heappop(self._queue)
+            self._send(job)
+
+    def _send(self, job: _Job):
+        now = self._time()
+        wait = now - job.queued_at
+        self._waits += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+
+        self._in_flight += 1
+        if job.budgeted:
+            self._budgeted_in_flight += 1
+            self._last_budgeted_send = now
+        self._session.queue_message(job.msg, self.__message_done_cb, job)
+
+    def _wait_for(self, seconds: float):
+        if self._timer is not None:
+            return
+        self._timer = self._timeout_add(
+            int(seconds * 1000) + 1, self.__timer_cb)
+
+    def __timer_cb(self):
+        self._timer = None
+        self._pump()
+        return False
+
+    def __message_done_cb(self, session, msg, job):
+        self._in_flight -= 1
+        if job.budgeted:
+            self._budgeted_in_flight -= 1
+            self._update_budget(msg)
+
+        if (msg.props.status_code == STATUS_TOO_MANY_REQUESTS
+                and job.budgeted and self._jobs.get(msg) is job):
+            # Try again once the window resets
+            self._remaining = 0
+            retry_after = _header_float(msg, 'Retry-After')
+            if retry_after is not None:
+                self._reset_at = self._time() + retry_after
+            elif self._reset_at <= self._time():
+                self._reset_at = self._time() + DEFAULT_BACKOFF
+            heapq.heappush(self._queue, job)
+            self._pump()
+            return
+
+        self._jobs.pop(msg, None)
+        self._pump()
+        job.callback(session, msg, job.user_data)
+
+    def _update_budget(self, msg: Soup.Message):
+        remaining = _header_float(msg, 'X-Ratelimit-Remaining')
+        reset = _header_float(msg, 'X-Ratelimit-Reset')
+        if remaining is None or reset is None:
+            return
+        self._remaining = remaining
+        self._reset_at = self._time() + reset
@@ -0,0 +1,91 @@
+# Copyright 2018 Sam Parkinson <sam@sam.today>
+#
+# This file is part of Something for Reddit.
+#
+# Something for Reddit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Something for Reddit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+What was on the screen when the app was closed, so the next launch can
+start from there
+'''
+
+import os
+import json
+import typing
+
+
+VERSION = 1
+
+
+class Session():
+    '''
+    A snapshot of the window.  The listing and thread bodies are kept too.
+    They go back in to the response cache (which would have forgotten them
+    after a day), so the views show them straight away and then refresh.
+
+    Args:
+        user (str):  the account that was being used.  The listing (eg.
+            the frontpage) is different for other accounts
+        sub (str):  the uri of the listing
+        sub_position (int):  index of the first row on screen
+        thread (str):  permalink of the comments that were open, or None
+        thread_position (int):  index of the first comment on screen
+        link (str):  uri of the web view, if it was showing instead of
+            the comments; or None
+        pane_position (int):  width of the listing, in pixels
+        sub_body (str):  the response body of the listing, or None
+        thread_body (str):  the response body of the thread, or None
+    '''
+
+    def __init__(self, user: str = None, sub: str = None,
+                 sub_position: int = 0, thread: str = None,
+                 thread_position: int = 0, link: str = None,
+                 pane_position: int = None, sub_body: str = None,
+                 thread_body: str = None):
+        self.user = user
+        self.sub = sub
+        self.sub_position = sub_position
+        self.thread = thread
+        self.thread_position = thread_position
+        self.link = link
+        self.pane_position = pane_position
+        self.sub_body = sub_body
+        self.thread_body = thread_body
+
+    def serialize(self) -> dict:
+        return dict(vars(self), version=VERSION)
+
+
+def load_session(path: str) -> typing.Optional[Session]:
+    '''
+    Returns the saved session, or None if there isn't one that we can use
+    '''
+    try:
+        with open(path) as f:
+            j = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(j, dict) or j.pop('version', None) != VERSION:
+        return None
+    try:
+        return Session(**j)
+    except TypeError:
+        return None
+
+
+def save_session(path: str, session: Session):
+    tmp_path = str(path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(session.serialize(), f)
+    os.replace(tmp_path, path)
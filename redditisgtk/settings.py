@@ -18,6 +18,8 @@
 from gi.repository import Gtk
 from gi.repository import Gio
 
+from redditisgtk.commentmodel import CollapseRule
+
 
 _settings = None
 
@@ -32,6 +34,15 @@ def get_settings():
     return _settings
 
 
+def get_collapse_rule() -> CollapseRule:
+    '''
+    Returns which comments should start off collapsed, from the settings
+    '''
+    settings = get_settings()
+    return CollapseRule(depth=settings['comments-collapse-depth'],
+                        score=settings['comments-collapse-score'])
+
+
 _original_theme_value = None
 
 
@@ -58,3 +69,12 @@ def show_settings():
 
     get_settings().bind('default-sub', builder.get_object('default-sub'),
                         'text', Gio.SettingsBindFlags.DEFAULT)
+    get_settings().bind('virtual-sublist',
+                        builder.get_object('virtual-sublist'),
+                        'active', Gio.SettingsBindFlags.DEFAULT)
+    get_settings().bind('comments-collapse-depth',
+                        builder.get_object('comments-collapse-depth'),
+                        'value', Gio.SettingsBindFlags.DEFAULT)
+    get_settings().bind('comments-collapse-score',
+                        builder.get_object('comments-collapse-score'),
+                        'value', Gio.SettingsBindFlags.DEFAULT)
@@ -0,0 +1,144 @@
+# Copyright 2018 Sam Parkinson <sam@sam.today>
+#
+# This file is part of Something for Reddit.
+#
+# Something for Reddit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Something for Reddit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Where does the time go when the app starts?  Run it with the
+REDDIT_IS_GTK_STARTUP_TIMING environment variable set, eg:
+
+    REDDIT_IS_GTK_STARTUP_TIMING=1 reddit-is-gtk
+
+Once the first listing is painted, the slowest imports and the time to
+each step are printed to stderr.  Only imports on the main thread are
+counted.
+'''
+
+import os
+import sys
+import time
+import typing
+import builtins
+import threading
+
+
+ENABLED = bool(os.environ.get('REDDIT_IS_GTK_STARTUP_TIMING'))
+# How many of the slowest modules to print
+TOP_MODULES = 25
+
+_start = None
+_reported = False
+# module name -> [total seconds, self seconds]
+_imports = {}
+# [(step name, seconds since the start)]
+_marks = []
+# Seconds spent in nested imports, one for each import in progress
+_children = []
+
+
+def install():
+    '''
+    Start timing, from now.  Does nothing unless it is ENABLED
+    '''
+    global _start
+    if not ENABLED or _start is not None:
+        return
+    _start = time.perf_counter()
+
+    real_import = builtins.__import__
+    main_thread = threading.main_thread()
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0 or threading.current_thread() is not main_thread:
+            return real_import(name, globals, locals, fromlist, level)
+
+        # `from gi.repository import WebKit2` loads gi.repository.WebKit2,
+        # so the things in the fromlist might be modules too
+        names = [name] + ['{}.{}'.format(name, f) for f in fromlist or ()]
+        names = [n for n in names if n not in sys.modules]
+        if not names:
+            return real_import(name, globals, locals, fromlist, level)
+
+        _children.append(0.0)
+        start = time.perf_counter()
+        try:
+            return real_import(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - start
+            children = _children.pop()
+            if _children:
+                _children[-1] += total
+            loaded = [n for n in names if n in sys.modules]
+            if loaded:
+                _record(', '.join(loaded), total, total - children)
+
+    builtins.__import__ = timed_import
+
+
+def _record(module: str, total: float, self_time: float):
+    times = _imports.setdefault(module, [0.0, 0.0])
+    times[0] += total
+    times[1] += self_time
+
+
+def mark(name: str):
+    '''
+    Note that startup got to a step (eg. 'window shown')
+    '''
+    if _start is not None and not _reported:
+        _marks.append((name, time.perf_counter() - _start))
+
+
+def mark_when_drawn(widget, name: str, last: bool = False):
+    '''
+    Mark the step when the widget is next painted.  If it is the `last`
+    step, print the report then.
+    '''
+    if _start is None or _reported:
+        return
+
+    def draw_cb(widget, cr):
+        widget.disconnect(handler_id)
+        mark(name)
+        if last:
+            report()
+        return False
+    handler_id = widget.connect_after('draw', draw_cb)
+
+
+def format_report() -> typing.List[str]:
+    lines = ['Slowest imports (self ms, total ms):']
+    by_self = sorted(_imports.items(), key=lambda item: item[1][1],
+                     reverse=True)
+    for module, (total, self_time) in by_self[:TOP_MODULES]:
+        lines.append('  {:8.1f} {:8.1f}  {}'.format(
+            self_time * 1000, total * 1000, module))
+    lines.append('{} modules imported, in {:.1f}ms'.format(
+        len(_imports), sum(t[1] for t in _imports.values()) * 1000))
+    for name, at in _marks:
+        lines.append('{:8.1f}ms  {}'.format(at * 1000, name))
+    return lines
+
+
+def report():
+    '''
+    Print the timings to stderr.  Only the first call does anything; after
+    that, startup is over
+    '''
+    global _reported
+    if _start is None or _reported:
+        return
+    _reported = True
+    print('\n'.join(format_report()), file=sys.stderr)
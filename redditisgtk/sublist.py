@@ -17,20 +17,35 @@
 
 
 from gi.repository import Gtk
+from gi.repository import Gio
 from gi.repository import GLib
 from gi.repository import GObject
+from gi.repository import Soup
 
 from redditisgtk.comments import CommentsView
+from redditisgtk.commentmodel import CollapseRule
 from redditisgtk.gtkutil import process_shortcuts
 from redditisgtk.api import RedditAPI
 from redditisgtk.readcontroller import get_read_controller
+from redditisgtk.threadprefetch import ThreadPrefetcher
+from redditisgtk.virtuallist import VirtualList, ListItem
 from redditisgtk import aboutrow
 from redditisgtk import sublistrows
+from redditisgtk import startuptiming
+
+
+# Start fetching the next page when the user is this many rows from the end
+PREFETCH_ROWS = 10
 
 
 class SubList(Gtk.ScrolledWindow):
     '''
     Lists post in a subreddit, items in an inbox.  Whatever really.
+
+    When the user scrolls near the end of the list, the next page is
+    fetched in the background; so loading more doesn't have to wait for
+    the network.  Likewise, the comments of the unread posts on the screen
+    are fetched before they are opened.
     '''
 
     new_other_pane = GObject.Signal(
@@ -44,13 +59,49 @@ class SubList(Gtk.ScrolledWindow):
             the default view
     '''
 
-    def __init__(self, api: RedditAPI, sub: str = None):
+    def __init__(self, api: RedditAPI, sub: str = None,
+                 virtual: bool = False, collapse: CollapseRule = None):
+        '''
+        Args:
+            api (RedditAPI):  dependency
+            sub (str):  what to load first
+            virtual (bool):  only make rows for the posts on screen, see
+                `VirtualList`
+            collapse (CollapseRule):  which comments start off collapsed
+                in the comments views that are opened
+        '''
         Gtk.ScrolledWindow.__init__(self)
         self.props.hscrollbar_policy = Gtk.PolicyType.NEVER
         self._api = api
         self._sub = sub
+        # The listing itself; kept until the next goto, as the callback is
+        # called again when the network revalidates the cached version
+        self._list_msg = None
+        # Loading a page after the 1st
         self._msg = None
+        # The after of the listing when it was put on screen, or False if
+        # it hasn't been yet
+        self._shown_after = False
         self._first_load = True
+        self._use_virtual = virtual
+        self._collapse = collapse
+        self._listbox = None
+        # Only set in virtual mode, see `_setup_virtual_list`
+        self._virtual = None
+        self._model = None
+        self._after = None
+        # Row to scroll to once the listing is loaded, see
+        # `scroll_to_position`
+        self._scroll_to = None
+
+        # The next page, see `_prefetch_next`.  The after it is for, the
+        # ticket while it is loading, and the json once it is loaded
+        self._prefetch_after = None
+        self._prefetch_msg = None
+        self._prefetched = None
+        self.props.vadjustment.connect('value-changed', self.__scrolled_cb)
+        self.props.vadjustment.connect('changed', self.__scrolled_cb)
+        self._threads = ThreadPrefetcher(api)
 
         self._spinner = Gtk.Spinner()
         self.add(self._spinner)
@@ -67,9 +118,17 @@ class SubList(Gtk.ScrolledWindow):
         Sub could be '/r/gnu+linux' or '/r/rct/hot?t=month
         or even '/message/inbox'
         '''
+        if self._list_msg is not None:
+            self._api.cancel(self._list_msg)
         if self._msg is not None:
             self._api.cancel(self._msg)
+        self._msg = None
+        self._clear_prefetch()
+        self._threads.clear()
+        self._scroll_to = None
         self._sub = sub
+        self._after = None
+        self._shown_after = False
         width = self.get_allocated_width()
         self.remove(self.get_child())
 
@@ -78,12 +137,35 @@ class SubList(Gtk.ScrolledWindow):
         self._spinner.start()
         self.set_size_request(width, -1)
 
-        self._msg = self._api.get_list(sub, self.__got_list_cb)
+        # Show the cached listing straight away (if we have one), and then
+        # swap it out once the network gives us the new version
+        self._list_msg = self._api.get_list(
+            sub, lambda j: self.__got_list_cb(j, sub), revalidate=True,
+            prepare=sublistrows.prepare_listing)
+
+    def _has_moved(self) -> bool:
+        '''
+        Has the user scrolled the listing, or loaded more of it?
+        '''
+        return self._after != self._shown_after or self._msg is not None \
+            or self.get_position() > 0
+
+    def __got_list_cb(self, j, sub):
+        if sub != self._sub:
+            return
+        if self._shown_after is not False and self._has_moved():
+            # This is the network's version of the cached listing on the
+            # screen; swapping it in would lose the user's place
+            return
 
-    def __got_list_cb(self, j):
-        self._msg = None
         self.remove(self.get_child())
+        startuptiming.mark_when_drawn(self, 'first listing painted', last=True)
+        if self._use_virtual:
+            self._setup_virtual_list(j)
+            return
 
+        self._virtual = None
+        self.props.vscrollbar_policy = Gtk.PolicyType.AUTOMATIC
         self._listbox = Gtk.ListBox()
         self._listbox.connect('event', self.__listbox_event_cb)
         self._listbox.connect('row-selected', self.__row_selected_cb)
@@ -113,9 +195,207 @@ class SubList(Gtk.ScrolledWindow):
             self._first_row = row
 
         self.insert_data(j)
+        self._shown_after = self._after
+        self._apply_position()
         self.focus()
 
+    def _setup_virtual_list(self, j):
+        '''
+        Show the listing with a `VirtualList`, so only the rows on screen
+        are made.  The about row sits above the list, and more posts are
+        loaded when the user scrolls to the end.
+        '''
+        self._model = Gio.ListStore.new(ListItem)
+        self._virtual = VirtualList(
+            self._model, self.__create_virtual_row, self.__bind_virtual_row,
+            near_end=PREFETCH_ROWS)
+        self._virtual.connect('row-selected', self.__row_selected_cb)
+        self._virtual.connect('near-end', self.__near_end_cb)
+        self._virtual.connect('rows-changed', self.__rows_changed_cb)
+        self._virtual.connect('end-reached', self.__end_reached_cb)
+        self._listbox = self._virtual.listbox
+        self._listbox.connect('event', self.__listbox_event_cb)
+
+        # We scroll the list ourselves, not with the scrolled window
+        self.props.vscrollbar_policy = Gtk.PolicyType.NEVER
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self.add(box)
+        box.show()
+
+        self.set_size_request(-1, -1)
+        self._first_load = False
+
+        self._first_row = None
+        row = aboutrow.get_about_row(self._api, self._sub)
+        if row is not None:
+            row.get_style_context().add_class('about-row')
+            box.add(row)
+            row.show()
+        box.add(self._virtual)
+        self._virtual.show()
+
+        self.insert_data(j)
+        self._shown_after = self._after
+        self._apply_position()
+        self.focus()
+
+    def __create_virtual_row(self, item):
+        if item.kind == 't3':
+            row = sublistrows.LinkRow(self._api, item.data)
+            row.goto_comments.connect(self.__row_goto_comments_cb)
+        elif item.kind == 't1' or item.kind == 't4':
+            row = sublistrows.MessageRow(self._api, item.data)
+        else:
+            row = Gtk.ListBoxRow()
+            label = Gtk.Label(label=str(item.data), wrap=True)
+            row.add(label)
+            label.show()
+        return row
+
+    def __bind_virtual_row(self, row, item):
+        if hasattr(row, 'bind'):
+            row.bind(item.data)
+        else:
+            row.get_child().props.label = str(item.data)
+
+    def __near_end_cb(self, virtual):
+        self._prefetch_next()
+
+    def __rows_changed_cb(self, virtual):
+        self._prefetch_threads(virtual.get_rows())
+
+    def _prefetch_threads(self, rows: list):
+        '''
+        Get the comments of the unread posts in the rows ready, top first
+        '''
+        posts = [row.data for row in rows
+                 if isinstance(row, sublistrows.LinkRow)]
+        if posts:
+            read = get_read_controller()
+            posts = [post for post in posts if not read.is_read(post['name'])]
+        self._threads.want(posts)
+
+    def __end_reached_cb(self, virtual):
+        if self._after is None or self._msg is not None:
+            return
+
+        def got_data(data):
+            self._msg = None
+            self.insert_data(data)
+
+        self._get_page(self._after, got_data)
+
+    def __scrolled_cb(self, adjustment):
+        if self._virtual is not None or self._listbox is None \
+                or adjustment.props.page_size == 0:
+            # page_size is 0 until we are drawn
+            return
+        # The rows at the top and bottom of the screen; None past the end
+        # of the list
+        top = self._listbox.get_row_at_y(int(adjustment.props.value))
+        bottom = self._listbox.get_row_at_y(
+            int(adjustment.props.value + adjustment.props.page_size))
+        n_rows = len(self._listbox.get_children())
+        last = bottom.get_index() if bottom is not None else n_rows - 1
+
+        if last >= n_rows - 1 - PREFETCH_ROWS:
+            self._prefetch_next()
+        first = top.get_index() if top is not None else 0
+        self._prefetch_threads([self._listbox.get_row_at_index(i)
+                                for i in range(first, last + 1)])
+        self._apply_position()
+
+    def get_position(self) -> int:
+        '''
+        Index of the row at the top of the screen
+        '''
+        if self._virtual is not None:
+            return self._virtual.get_first_index()
+        if self._listbox is None:
+            return 0
+        row = self._listbox.get_row_at_y(
+            int(self.props.vadjustment.props.value))
+        return row.get_index() if row is not None else 0
+
+    def scroll_to_position(self, index: int):
+        '''
+        Scroll to a position from `get_position`, once the listing has
+        loaded (and been drawn)
+        '''
+        self._scroll_to = index
+        self._apply_position()
+
+    def _apply_position(self):
+        if self._scroll_to is None or self._listbox is None:
+            return
+        if self._virtual is not None:
+            self._virtual.scroll_to(self._scroll_to)
+            self._scroll_to = None
+            return
+
+        n_rows = len(self._listbox.get_children())
+        row = self._listbox.get_row_at_index(min(self._scroll_to, n_rows - 1))
+        adjustment = self.props.vadjustment
+        if row is None or adjustment.props.page_size == 0 \
+                or row.get_allocation().y < 0:
+            # Not drawn yet, so we don't know where it is
+            return
+        self._scroll_to = None
+        adjustment.props.value = row.get_allocation().y
+
+    def _prefetch_next(self):
+        '''
+        Start loading the page after the end of the list, at a low
+        priority, so that it is ready when the user wants it
+        '''
+        after = self._after
+        if after is None or after == self._prefetch_after \
+                or self._msg is not None:
+            return
+        self._clear_prefetch()
+        self._prefetch_after = after
+        self._prefetch_msg = self._api.get_list(
+            '{}?after={}'.format(self._sub, after), self.__prefetched_cb,
+            priority=Soup.MessagePriority.LOW,
+            prepare=sublistrows.prepare_listing, background=True)
+
+    def __prefetched_cb(self, j):
+        self._prefetch_msg = None
+        self._prefetched = j
+
+    def _clear_prefetch(self):
+        if self._prefetch_msg is not None:
+            self._api.cancel(self._prefetch_msg)
+        self._prefetch_after = None
+        self._prefetch_msg = None
+        self._prefetched = None
+
+    def _get_page(self, after: str, callback):
+        '''
+        Call the callback with the page of the listing after the name.  If
+        it was prefetched, that happens straight away.
+        '''
+        if after == self._prefetch_after and self._prefetched is not None:
+            j = self._prefetched
+            self._clear_prefetch()
+            callback(j)
+            return
+
+        # If it is still being prefetched, this joins that request and
+        # raises its priority, as the user is waiting for it now.  So the
+        # prefetch is cancelled after, or the request would be too
+        self._msg = self._api.get_list(
+            '{}?after={}'.format(self._sub, after), callback,
+            priority=Soup.MessagePriority.HIGH,
+            prepare=sublistrows.prepare_listing)
+        self._clear_prefetch()
+
     def _do_move(self, direction: int):
+        if self._virtual is not None:
+            if not self._virtual.move(direction):
+                self.error_bell()
+            return
+
         focused = self._listbox.get_toplevel().get_focus()
         if focused.get_parent() == self._listbox:
             selected_row = focused
@@ -146,11 +426,21 @@ class SubList(Gtk.ScrolledWindow):
             'j': (self._do_move, [+1]),
             'Up': (self._do_move, [-1]),
             'Down': (self._do_move, [+1]),
-            '0': (listbox.select_row, [self._first_row])
+            '0': (self._goto_first, []),
         }
         return process_shortcuts(shortcuts, event)
 
+    def _goto_first(self):
+        if self._virtual is not None:
+            self._virtual.select_index(0)
+        else:
+            self._listbox.select_row(self._first_row)
+
     def focus(self):
+        if self._virtual is not None:
+            self._virtual.focus_row()
+            return
+
         s = None
         if self._listbox is not None:
             s = self._listbox.get_selected_row()
@@ -164,6 +454,13 @@ class SubList(Gtk.ScrolledWindow):
         if 'data' not in j:
             return
 
+        self._after = j['data']['after']
+        if self._virtual is not None:
+            self._model.splice(
+                self._model.get_n_items(), 0,
+                [ListItem(post) for post in j['data']['children']])
+            return
+
         for post in j['data']['children']:
             if post['kind'] == 't3':
                 row = sublistrows.LinkRow(self._api, post)
@@ -198,6 +495,7 @@ class SubList(Gtk.ScrolledWindow):
         row.grab_focus()
 
         def got_data(data):
+            self._msg = None
             self._listbox.remove(row)
             row.hide()
             row.destroy()
@@ -207,12 +505,9 @@ class SubList(Gtk.ScrolledWindow):
                 # newly created widgets can not be focused until drawn
                 GLib.idle_add(added_row.grab_focus)
 
-        self._msg = self._api.get_list(
-            '{}?after={}'.format(self._sub, after),
-            got_data,
-        )
+        self._get_page(after, got_data)
 
-    def __row_selected_cb(self, listbox, row):
+    def __row_selected_cb(self, listbox_or_virtual, row):
         if row is None:
             return
         row.grab_focus()  # For keyboard shortcuts to work
@@ -245,7 +540,11 @@ class SubList(Gtk.ScrolledWindow):
             if not data.get('is_self') and 'url' in data:
                 link = data['url']
 
-        comments = CommentsView(self._api, data, permalink=permalink)
+        prefetched = None
+        if permalink is None and data is not None:
+            prefetched = self._threads.take(data['permalink'])
+        comments = CommentsView(self._api, data, comments=prefetched,
+                                permalink=permalink, collapse=self._collapse)
         self.new_other_pane.emit(link, comments, link_first)
 
     def __row_goto_comments_cb(self, row):
@@ -27,6 +27,24 @@ from redditisgtk import newmarkdown
 from redditisgtk.api import RedditAPI
 from redditisgtk.readcontroller import get_read_controller
 from redditisgtk.mediapreview import get_preview_palette
+from redditisgtk.uifactory import get_factory
+
+
+# Reddit's thumbnails are at most 140px square
+THUMBNAIL_SIZE = 140
+
+
+def prepare_listing(j):
+    '''
+    Convert the markdown of all the messages (and comments) in a listing
+    in one go, on a worker thread.  Then the `MessageRow`s only have to
+    make their widgets.  See `RedditAPI.send_request`.
+    '''
+    if not isinstance(j, dict) or 'data' not in j:
+        return
+    newmarkdown.prepare_markdown(
+        child['data']['body'] for child in j['data'].get('children', [])
+        if child['kind'] in ('t1', 't4') and 'body' in child['data'])
 
 
 class MoreItemsRow(Gtk.ListBoxRow):
@@ -101,18 +119,18 @@ class LinkRow(Gtk.ListBoxRow):
         Gtk.ListBoxRow.__init__(self)
         self.add_events(Gdk.EventMask.KEY_PRESS_MASK)
         self.get_style_context().add_class('link-row')
-        self.data = data['data']
         self._msg = None
         self._api = api
+        self.data = data['data']
 
-        self._builder = Gtk.Builder.new_from_resource(
-            '/today/sam/reddit-is-gtk/row-link.ui')
+        # The widgets are made once; binding just changes what they show
+        self._builder = get_factory(
+            '/today/sam/reddit-is-gtk/row-link.ui').build()
         self._g = self._builder.get_object
         self.add(self._g('box'))
-
-        read = get_read_controller().is_read(self.data['name'])
-        if read:
-            self.read()
+        self._g('comments').connect('clicked', self.__comments_clicked_cb)
+        self._g('preview-button').connect(
+            'clicked', self.__image_clicked_cb)
 
         # Keep a reference so the GC doesn't collect them
         self._sbb = ScoreButtonBehaviour(
@@ -120,6 +138,28 @@ class LinkRow(Gtk.ListBoxRow):
         self._abb = AuthorButtonBehaviour(self._g('author'), self.data)
         self._srbb = SubButtonBehaviour(self._g('subreddit'), self.data)
         self._tbb = TimeButtonBehaviour(self._g('time'), self.data)
+        self.bind(data)
+
+    def bind(self, data):
+        '''
+        Show a different post in this row, so that the row can be recycled
+        '''
+        if self._msg is not None:
+            self._api.cancel(self._msg)
+            self._msg = None
+        self.get_style_context().remove_class('read')
+        self.get_style_context().remove_class('sticky')
+        self.data = data['data']
+
+        read = get_read_controller().is_read(self.data['name'])
+        self._g('unread').props.visible = not read
+        if read:
+            self.read()
+
+        self._sbb.bind(self.data)
+        self._abb.bind(self.data)
+        self._srbb.bind(self.data)
+        self._tbb.bind(self.data)
 
         self._g('nsfw').props.visible = self.data.get('over_18')
         self._g('saved').props.visible = self.data.get('saved')
@@ -132,13 +172,13 @@ class LinkRow(Gtk.ListBoxRow):
                 '{}c'.format(self.data['num_comments'])
         else:
             self._g('comments').props.label = 'no c'
-        self._g('comments').connect('clicked', self.__comments_clicked_cb)
 
         self._g('title').props.label = self.data['title']
         self._g('domain').props.label = self.data['domain']
 
-        self._fetch_thumbnail()
+        self._g('preview-button').hide()
         self._preview_palette = None
+        self._fetch_thumbnail()
 
     def read(self):
         self.get_style_context().add_class('read')
@@ -164,7 +204,8 @@ class LinkRow(Gtk.ListBoxRow):
         url = get_thumbnail_url(self.data)
         if url is not None:
             self._msg = self._api.download_thumb(
-                url, self.__message_done_cb)
+                url, self.__message_done_cb,
+                max_width=THUMBNAIL_SIZE, max_height=THUMBNAIL_SIZE)
 
     def do_unrealize(self):
         if self._msg is not None:
@@ -174,7 +215,6 @@ class LinkRow(Gtk.ListBoxRow):
         self._msg = None
         self._g('preview').props.pixbuf = pixbuf
         self._g('preview-button').show()
-        self._g('preview-button').connect('clicked', self.__image_clicked_cb)
 
     def __image_clicked_cb(self, button):
         if self._preview_palette is None:
@@ -191,39 +231,55 @@ class MessageRow(Gtk.ListBoxRow):
         self.add_events(Gdk.EventMask.KEY_PRESS_MASK)
         self._api = api
         self.data = data['data']
+        self._content = None
 
-        is_comment_reply = self.data.get('subreddit') is not None
-
-        self._builder = Gtk.Builder.new_from_resource(
-            '/today/sam/reddit-is-gtk/row-comment.ui')
+        # The widgets are made once; binding just changes what they show
+        self._builder = get_factory(
+            '/today/sam/reddit-is-gtk/row-comment.ui').build()
         self._g = self._builder.get_object
         self.add(self._g('box'))
 
+        # Keep a reference so the GC doesn't collect them
+        self._abb = AuthorButtonBehaviour(self._g('author'), self.data)
+        self._tbb = TimeButtonBehaviour(self._g('time'), self.data)
+        # PMs don't have a subreddit
+        self._srbb = SubButtonBehaviour(
+            self._g('subreddit'), {'subreddit': 'PM'})
+        self.bind(data)
+
+    def bind(self, data):
+        '''
+        Show a different message in this row, so that the row can be recycled
+        '''
+        self.get_style_context().remove_class('read')
+        self.data = data['data']
+
+        is_comment_reply = self.data.get('subreddit') is not None
+
         read = not self.data.get('new', True)
+        self._g('unread').props.visible = not read
         if read:
             self.read()
 
-        # Keep a reference so the GC doesn't collect them
-        self._abb = AuthorButtonBehaviour(self._g('author'), self.data)
-        self._tbb = TimeButtonBehaviour(self._g('time'), self.data)
-        if is_comment_reply:
-            self._srbb = SubButtonBehaviour(self._g('subreddit'), self.data)
-        else:
-            self._g('subreddit').props.sensitive = False
-            self._g('subreddit').props.label = 'PM'
+        self._abb.bind(self.data)
+        self._tbb.bind(self.data)
+        self._g('subreddit').props.sensitive = is_comment_reply
+        self._srbb.bind(self.data if is_comment_reply
+                        else {'subreddit': 'PM'})
 
         self._g('nsfw').props.visible = self.data.get('over_18')
         self._g('saved').props.visible = self.data.get('saved')
 
         self._g('title').props.label = (self.data.get('link_title') or
                                         self.data['subject'])
-        content = newmarkdown.make_markdown_widget(self.data['body'])
-        self._g('grid').attach(content, 0, 2, 3, 1)
-
-        if is_comment_reply:
-            self._g('type-private-message').props.visible = False
-        else:
-            self._g('type-comment-reply').props.visible = False
+        # The body is the only part that is made again
+        if self._content is not None:
+            self._content.destroy()
+        self._content = newmarkdown.make_markdown_widget(self.data['body'])
+        self._g('grid').attach(self._content, 0, 2, 3, 1)
+
+        self._g('type-comment-reply').props.visible = is_comment_reply
+        self._g('type-private-message').props.visible = not is_comment_reply
 
     def do_event(self, event):
         shortcuts = {
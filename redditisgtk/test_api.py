@@ -38,6 +38,7 @@ def build_fake_api(responses=None, is_anonymous=True):
     token = MagicMock()
     token.wrap_path = lambda p: 'https://example.com' + p
     token.is_anonymous = is_anonymous
+    token.needs_refresh.return_value = False
     return api.RedditAPI(session, token), session, token
 
 def test_create_api():
@@ -132,6 +133,29 @@ def test_bubble_error():
     assert msg == 'Reddit Error: 403'
 
 
+def test_background_errors_are_quiet():
+    api, session, token = build_fake_api({
+        '/test?raw_json=1': {'error': 403},
+    })
+
+    done_cb = MagicMock()
+    api.request_failed = MagicMock()
+    api.send_request('GET', '/test', done_cb, background=True)
+    assert done_cb.call_count == 0
+    assert not api.request_failed.emit.called
+
+
+def test_background_list_errors_are_quiet():
+    api, session, token = build_fake_api({
+        '/r/linux?after=a&raw_json=1': {'error': 403},
+    })
+
+    done_cb = MagicMock()
+    api.request_failed = MagicMock()
+    api.get_list('/r/linux?after=a', done_cb, background=True)
+    assert not api.request_failed.emit.called
+
+
 def test_callback_user_data():
     api, session, token = build_fake_api({
         '/test?raw_json=1': {'win': True},
@@ -224,6 +248,17 @@ def test_token_oauth_set_username():
     assert tm.serialize()['username'] == 'me'
     assert tm.value_changed.emit.called
 
+def test_token_oauth_cache_id():
+    # The user name is not known until whoami returns, but the cache needs
+    # to tell accounts apart straight away
+    tm = api.OAuthTokenManager(None, account_id='abc')
+    tm.value_changed = MagicMock()
+    assert tm.cache_id == 'abc'
+    tm.set_user_name('me')
+    assert tm.cache_id == 'abc'
+    other, another = api.OAuthTokenManager(None), api.OAuthTokenManager(None)
+    assert other.cache_id != another.cache_id
+
 def test_token_oauth_add_message_headers():
     msg = MagicMock()
     tm = api.OAuthTokenManager(None, token={'access_token': 1})
@@ -240,3 +275,315 @@ def test_api_factory():
     api1b = factory.get_for_token(token1)
     assert api1 is api1b
     assert api1 is not api2
+
+def test_cache_fresh_get():
+    api, session, token = build_fake_api({
+        '/test?raw_json=1': [{'win': 1}],
+    })
+
+    done_cb = MagicMock()
+    api.send_request('GET', '/test', done_cb)
+    # The 2nd request would fail if it went to the network, as the
+    # list of responses is now empty
+    ticket = api.send_request('GET', '/test', done_cb)
+    assert ticket is not None
+    assert done_cb.call_count == 2
+    (data,), _ = done_cb.call_args
+    assert data == {'win': 1}
+
+
+def test_cache_skipped():
+    api, session, token = build_fake_api({
+        '/test?raw_json=1': [{'win': 1}, {'win': 2}],
+    })
+
+    done_cb = MagicMock()
+    api.send_request('GET', '/test', done_cb)
+    api.send_request('GET', '/test', done_cb, cache=False)
+    (data,), _ = done_cb.call_args
+    assert data == {'win': 2}
+
+
+def test_cache_not_for_post():
+    api, session, token = build_fake_api({
+        '/test?raw_json=1': [{'win': 1}, {'win': 2}],
+    })
+
+    done_cb = MagicMock()
+    api.send_request('POST', '/test', done_cb)
+    api.send_request('POST', '/test', done_cb)
+    (data,), _ = done_cb.call_args
+    assert data == {'win': 2}
+
+
+def age_cache(api, seconds):
+    for key, entry in api._cache._lru.items():
+        entry.time -= seconds
+
+
+def test_cache_revalidate_stale():
+    api, session, token = build_fake_api({
+        '/r/linux?raw_json=1': [{'win': 1}, {'win': 2}, {'win': 2}],
+    })
+    api.get_list('/r/linux', MagicMock())
+    age_cache(api, 1000)
+
+    done_cb = MagicMock()
+    api.get_list('/r/linux', done_cb, revalidate=True)
+    # Once for the stale data, once for the new data
+    assert done_cb.call_count == 2
+    assert done_cb.call_args_list[0][0] == ({'win': 1},)
+    assert done_cb.call_args_list[1][0] == ({'win': 2},)
+
+    age_cache(api, 1000)
+    done_cb = MagicMock()
+    api.get_list('/r/linux', done_cb, revalidate=True)
+    # Data did not change, so no need to call it again
+    assert done_cb.call_count == 1
+
+
+def test_cache_restored_body():
+    api, session, token = build_fake_api({
+        '/r/linux?raw_json=1': [{'win': 1}, {'win': 2}],
+    })
+    api.get_list('/r/linux', MagicMock())
+    body = api.get_cached_body('/r/linux')
+    assert json.loads(str(body, 'utf8')) == {'win': 1}
+    assert api.get_cached_body('/r/gnome') is None
+
+    # Like starting the app again, days later
+    api, session, token = build_fake_api({
+        '/r/linux?raw_json=1': [{'win': 2}],
+    })
+    api.restore_cached_body('/r/linux', body)
+    done_cb = MagicMock()
+    api.get_list('/r/linux', done_cb, revalidate=True)
+    assert done_cb.call_args_list[0][0] == ({'win': 1},)
+    assert done_cb.call_args_list[1][0] == ({'win': 2},)
+
+
+def test_cache_invalidated_by_vote():
+    api, session, token = build_fake_api({
+        '/r/linux?raw_json=1': [{'name': 't3_a', 'v': 1},
+                                {'name': 't3_a', 'v': 2}],
+        '/api/vote?raw_json=1': {},
+    })
+
+    done_cb = MagicMock()
+    api.get_list('/r/linux', done_cb)
+    api.vote('t3_a', +1)
+    api.get_list('/r/linux', done_cb)
+    (data,), _ = done_cb.call_args
+    assert data['v'] == 2
+
+
+def build_slow_fake_api(responses):
+    '''
+    Like build_fake_api, but requests only get a response once you call the
+    returned flush function
+    '''
+    api, session, token = build_fake_api(responses)
+    queued = []
+    respond = session.queue_message
+    session.queue_message = lambda *args: queued.append(args)
+
+    def flush():
+        while queued:
+            respond(*queued.pop(0))
+    return api, session, queued, flush
+
+
+def test_duplicate_gets_share_request():
+    api, session, queued, flush = build_slow_fake_api({
+        '/r/x/about?raw_json=1': [{'win': 1}],
+    })
+
+    cb1 = MagicMock()
+    cb2 = MagicMock()
+    ticket1 = api.send_request('GET', '/r/x/about', cb1)
+    ticket2 = api.send_request('GET', '/r/x/about', cb2)
+    assert len(queued) == 1
+
+    flush()
+    (data1,), _ = cb1.call_args
+    (data2,), _ = cb2.call_args
+    assert data1 == data2 == {'win': 1}
+    # They must not share the same object, as views mutate the data
+    assert data1 is not data2
+    assert ticket1.body_size == ticket2.body_size == len('{"win": 1}')
+
+
+def test_duplicate_posts_not_shared():
+    api, session, queued, flush = build_slow_fake_api({
+        '/api/vote?raw_json=1': {},
+    })
+    api.vote('t3_a', 1)
+    api.vote('t3_a', 1)
+    assert len(queued) == 2
+
+
+def test_cancel_shared_request():
+    api, session, queued, flush = build_slow_fake_api({
+        '/r/x/about?raw_json=1': [{'win': 1}],
+    })
+
+    cb1 = MagicMock()
+    cb2 = MagicMock()
+    ticket1 = api.send_request('GET', '/r/x/about', cb1)
+    ticket2 = api.send_request('GET', '/r/x/about', cb2)
+
+    api.cancel(ticket1)
+    assert not session.cancel_message.called
+
+    flush()
+    assert not cb1.called
+    assert cb2.called
+
+
+def test_cancel_all_cancels_message():
+    api, session, queued, flush = build_slow_fake_api({})
+
+    ticket1 = api.send_request('GET', '/r/x/about', MagicMock())
+    ticket2 = api.send_request('GET', '/r/x/about', MagicMock())
+    api.cancel(ticket1)
+    api.cancel(ticket2)
+    assert session.cancel_message.called
+    (msg, status), _ = session.cancel_message.call_args
+    assert msg is queued[0][0]
+
+    # A new request should not join the cancelled one
+    api.send_request('GET', '/r/x/about', MagicMock())
+    assert len(queued) == 2
+
+
+def build_slow_fake_soup_session(responses):
+    session = build_fake_soup_session(responses)
+    queued = []
+    respond = session.queue_message
+    session.queue_message = lambda *args: queued.append(args)
+
+    def flush():
+        while queued:
+            respond(*queued.pop(0))
+    return session, queued, flush
+
+
+def test_token_oauth_single_flight_refresh():
+    session, queued, flush = build_slow_fake_soup_session({
+        '/api/v1/access_token': {'access_token': 'new'},
+    })
+    tm = api.OAuthTokenManager(session, token={'refresh_token': 'yes'})
+    cb1 = MagicMock()
+    cb2 = MagicMock()
+    tm.refresh(cb1)
+    tm.refresh(cb2)
+    assert len(queued) == 1
+
+    flush()
+    assert cb1.called
+    assert cb2.called
+    assert tm.serialize()['access_token'] == 'new'
+
+
+def test_token_oauth_needs_refresh():
+    now = [1000]
+    tm = api.OAuthTokenManager(
+        None,
+        token={'refresh_token': 'yes', 'time': 1000, 'expires_in': 3600},
+        time_func=lambda: now[0])
+    assert not tm.needs_refresh()
+    now[0] += 3600 - api.TOKEN_REFRESH_MARGIN
+    assert tm.needs_refresh()
+
+
+def test_token_oauth_schedules_refresh():
+    session = build_fake_soup_session({
+        '/api/v1/access_token': [
+            {'access_token': 'a', 'expires_in': 3600},
+            {'access_token': 'b', 'expires_in': 3600},
+        ],
+    })
+    timers = []
+    tm = api.OAuthTokenManager(
+        session, token={'refresh_token': 'yes'},
+        time_func=lambda: 1000,
+        timeout_add_seconds=lambda *args: timers.append(args))
+    tm.refresh(None)
+    assert tm.serialize()['access_token'] == 'a'
+    assert len(timers) == 1
+    seconds, callback, *args = timers[0]
+    assert seconds == 3600 - api.TOKEN_REFRESH_MARGIN
+
+    callback(*args)
+    assert tm.serialize()['access_token'] == 'b'
+
+
+def test_requests_held_for_token_refresh():
+    api, session, queued, flush = build_slow_fake_api({
+        '/r/x/about?raw_json=1': [{'win': 1}],
+    })
+    token = api._token
+    token.needs_refresh.return_value = True
+
+    cb1 = MagicMock()
+    cb2 = MagicMock()
+    api.send_request('GET', '/r/x/about', cb1)
+    api.send_request('GET', '/r/x/about', cb2)
+    assert not queued
+    assert not token.add_message_headers.called
+
+    token.needs_refresh.return_value = False
+    (refreshed_cb,), _ = token.refresh.call_args
+    refreshed_cb()
+    assert len(queued) == 1
+    assert token.add_message_headers.called
+
+    flush()
+    assert cb1.called
+    assert cb2.called
+
+
+def test_held_requests_fail_with_token_refresh():
+    api, session, queued, flush = build_slow_fake_api({
+        '/r/x/about?raw_json=1': [{'win': 1}],
+    })
+    api.request_failed = MagicMock()
+    token = api._token
+    token.needs_refresh.return_value = True
+
+    cb1 = MagicMock()
+    api.send_request('GET', '/r/x/about', cb1)
+    _, kwargs = token.refresh.call_args
+    kwargs['failed_callback']()
+    assert not cb1.called
+    assert api.request_failed.emit.called
+
+    # The failed request must not be joined by the next one
+    token.needs_refresh.return_value = False
+    cb2 = MagicMock()
+    api.send_request('GET', '/r/x/about', cb2)
+    assert len(queued) == 1
+    flush()
+    assert cb2.called
+    assert not cb1.called
+
+
+def test_token_oauth_failed_refresh():
+    session = MagicMock()
+    def queue_message(msg, callback, user_data):
+        msg.props = MagicMock()
+        msg.props.response_body.data = None
+        callback(session, msg, user_data)
+    session.queue_message = queue_message
+
+    tm = api.OAuthTokenManager(session, token={'refresh_token': 'yes'})
+    done = MagicMock()
+    failed = MagicMock()
+    tm.refresh(done, failed_callback=failed)
+    assert not done.called
+    assert failed.called
+
+    # It tries again next time
+    failed.reset_mock()
+    tm.refresh(done, failed_callback=failed)
+    assert failed.called
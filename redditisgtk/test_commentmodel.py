@@ -0,0 +1,203 @@
+import json
+
+from redditisgtk.commentmodel import CommentTree, CollapseRule
+
+
+def comment(name, *replies):
+    return {'kind': 't1', 'data': {
+        'name': name,
+        'replies': {'data': {'children': list(replies)}} if replies else ''}}
+
+
+def more(name):
+    return {'kind': 'more', 'data': {'name': name, 'count': 2}}
+
+
+def build_tree():
+    # a
+    #   b
+    #     c
+    #   d
+    # e
+    #   more
+    # f
+    return CommentTree([
+        comment('a', comment('b', comment('c')), comment('d')),
+        comment('e', more('more')),
+        comment('f'),
+    ])
+
+
+def names(tree, indexes):
+    return [tree[i].data['name'] for i in indexes]
+
+
+def test_flattens_in_preorder():
+    tree = build_tree()
+    assert names(tree, range(len(tree))) == [
+        'a', 'b', 'c', 'd', 'e', 'more', 'f']
+    assert [tree[i].depth for i in range(len(tree))] == [0, 1, 2, 1, 0, 1, 0]
+    assert [tree[i].parent for i in range(len(tree))] == [
+        -1, 0, 1, 0, -1, 4, -1]
+    assert [tree[i].size for i in range(len(tree))] == [3, 1, 0, 0, 1, 0, 0]
+
+
+def test_thread(datadir):
+    with open(datadir / 'comments--thread.json') as f:
+        j = json.load(f)
+    tree = CommentTree(j[1]['data']['children'])
+    assert tree[0].data['author'] == 'puppylust'
+    assert tree[0].size == 4
+    # Sizes add up
+    top_level = [i for i in range(len(tree)) if tree[i].parent == -1]
+    assert sum(tree[i].size + 1 for i in top_level) == len(tree)
+
+
+def test_next_prev():
+    tree = build_tree()
+    assert names(tree, tree.iter_visible()) == [
+        'a', 'b', 'c', 'd', 'e', 'more', 'f']
+    assert tree.get_prev(0) is None
+    assert tree.get_next(6) is None
+    assert tree.get_prev(4) == 3
+
+
+def test_collapse_skips_replies():
+    tree = build_tree()
+    tree.set_collapsed(1, True)
+    assert names(tree, tree.iter_visible()) == [
+        'a', 'b', 'd', 'e', 'more', 'f']
+    assert tree.get_next(1) == 3
+    assert tree.get_prev(3) == 1
+    assert tree.get_shown(2) == 1
+
+    tree.set_collapsed(0, True)
+    assert names(tree, tree.iter_visible()) == ['a', 'e', 'more', 'f']
+    assert tree.get_prev(4) == 0
+    # The highest collapsed parent is the one on screen
+    assert tree.get_shown(2) == 0
+
+    tree.set_collapsed(0, False)
+    tree.set_collapsed(1, False)
+    assert len(list(tree.iter_visible())) == len(tree)
+
+
+def test_siblings():
+    tree = build_tree()
+    assert tree.get_next_sibling(0) == 4
+    assert tree.get_next_sibling(4) == 6
+    assert tree.get_next_sibling(6) is None
+    assert tree.get_next_sibling(1) == 3
+    assert tree.get_next_sibling(3) is None
+
+    assert tree.get_prev_sibling(6) == 4
+    assert tree.get_prev_sibling(4) == 0
+    assert tree.get_prev_sibling(0) is None
+    assert tree.get_prev_sibling(3) == 1
+    assert tree.get_prev_sibling(1) is None
+
+    assert tree.get_parent(2) == 1
+    assert tree.get_parent(0) is None
+    assert tree.get_root(2) == 0
+
+
+def test_replace_more():
+    tree = build_tree()
+    added = tree.replace(5, [comment('g', comment('h')), comment('i')])
+    assert added == 2
+    assert names(tree, range(len(tree))) == [
+        'a', 'b', 'c', 'd', 'e', 'g', 'h', 'i', 'f']
+    assert tree[5].parent == 4
+    assert tree[6].parent == 5
+    assert tree[6].depth == 2
+    assert tree[4].size == 3
+    assert tree.get_next_sibling(4) == 8
+    assert tree.index(tree[7]) == 7
+
+
+def test_replace_more_with_nothing():
+    tree = build_tree()
+    assert tree.replace(5, []) == -1
+    assert names(tree, range(len(tree))) == ['a', 'b', 'c', 'd', 'e', 'f']
+    assert tree[4].size == 0
+
+
+def check_links(tree):
+    '''
+    The links should match walking the tree the slow way
+    '''
+    visible = list(tree.iter_visible())
+    for prev, index in zip(visible, visible[1:]):
+        assert tree.get_prev(index) == prev
+    for index in range(len(tree)):
+        node = tree[index]
+        assert node.index == index
+        siblings = [i for i in range(len(tree))
+                    if tree[i].parent == node.parent]
+        position = siblings.index(index)
+        assert tree.get_prev_sibling(index) == (
+            siblings[position - 1] if position > 0 else None)
+
+
+def test_links_follow_changes(datadir):
+    with open(datadir / 'comments--thread.json') as f:
+        j = json.load(f)
+    tree = CommentTree(j[1]['data']['children'])
+    check_links(tree)
+
+    for index in [1, 6, 7, 5, 30]:
+        tree.set_collapsed(index, True)
+        check_links(tree)
+    for index in [7, 5]:
+        tree.set_collapsed(index, False)
+        check_links(tree)
+
+    stubs = [tree[i] for i in range(len(tree)) if tree[i].kind == 'more']
+    assert len(stubs) >= 2
+    tree.replace(tree.index(stubs[0]),
+                 [comment('x', comment('y')), comment('z')])
+    check_links(tree)
+    tree.replace(tree.index(stubs[-1]), [])
+    check_links(tree)
+
+
+def test_collapse_rule_is_lazy():
+    tree = CommentTree([
+        comment('a', comment('b', comment('c')), comment('d')),
+        comment('e', more('more')),
+    ], collapse=CollapseRule(depth=2))
+    # The replies to b are too deep, so they are not in the tree yet
+    assert names(tree, range(len(tree))) == ['a', 'b', 'd', 'e', 'more']
+    assert tree[1].collapsed
+    assert tree[1].size == 0
+    assert tree[1].has_replies
+    assert not tree[2].has_replies
+    check_links(tree)
+
+    assert tree.set_collapsed(1, False) == 1
+    assert names(tree, range(len(tree))) == ['a', 'b', 'c', 'd', 'e', 'more']
+    assert tree[2].depth == 2
+    assert tree[2].parent == 1
+    assert tree[0].size == 3
+    assert tree[5].parent == 4
+    check_links(tree)
+
+    # Now it is in the tree, collapsing just hides it
+    assert tree.set_collapsed(1, True) == 0
+    assert len(tree) == 6
+    check_links(tree)
+
+
+def test_collapse_rule_score():
+    low = comment('low', comment('reply'))
+    low['data']['score'] = -10
+    hidden = comment('hidden', comment('reply'))
+    hidden['data']['collapsed'] = True
+    tree = CommentTree([low, hidden, comment('fine', comment('reply'))],
+                       collapse=CollapseRule(score=-5))
+    assert names(tree, tree.iter_visible()) == [
+        'low', 'hidden', 'fine', 'reply']
+    assert tree.set_collapsed(0, False) == 1
+    assert names(tree, tree.iter_visible()) == [
+        'low', 'reply', 'hidden', 'fine', 'reply']
+    check_links(tree)
@@ -4,6 +4,8 @@ from unittest.mock import MagicMock
 from gi.repository import Gtk
 
 from redditisgtk import comments
+from redditisgtk import newmarkdown
+from redditisgtk.commentmodel import CollapseRule
 from redditisgtk.gtktestutil import (with_test_mainloop, find_widget, wait_for,
                                      get_focused, fake_event)
 
@@ -24,7 +26,214 @@ def test_load_selftext(datadir):
     with open(datadir / 'comments--thread.json') as f:
         cb(json.load(f))
 
+    # The rows are made once the list is drawn
+    wait_for(lambda: find_widget(
+        root, label='This happened today.', many=True))
     # Title:
     assert find_widget(root, label='You need a doctor’s note? You got it!')
     # Body:
     assert find_widget(root, label='This happened today.')
+
+
+def test_prepare_thread(datadir):
+    with open(datadir / 'comments--thread.json') as f:
+        j = json.load(f)
+    comments.prepare_thread(j)
+    stats = newmarkdown.get_cache_stats()
+    body = j[1]['data']['children'][0]['data']['body_html']
+    newmarkdown.make_html_widget(body)
+    assert newmarkdown.get_cache_stats()['hits'] == stats['hits'] + 1
+
+    # Errors are not threads
+    comments.prepare_thread({'error': 404})
+
+
+def build_thread(datadir, collapse=None):
+    api = MagicMock()
+    with open(datadir / 'comments--thread.json') as f:
+        j = json.load(f)
+    root = comments.CommentsView(api, comments=j, permalink=PERMALINK,
+                                 collapse=collapse)
+
+    window = Gtk.OffscreenWindow()
+    window.set_size_request(500, 800)
+    window.add(root)
+    window.show_all()
+    wait_for(lambda: find_widget(
+        root, label='puppylust', kind=Gtk.Button, many=True))
+    return root
+
+
+def has_author(root, author):
+    return bool(find_widget(root, label=author, kind=Gtk.Button, many=True))
+
+
+@with_test_mainloop
+def test_collapse(datadir):
+    root = build_thread(datadir)
+    assert has_author(root, 'SulkySkunkPomPoms')
+
+    button = find_widget(root, label='puppylust', kind=Gtk.Button)
+    row = button.get_ancestor(comments.NormalCommentRow)
+    # Only the comment rows on the screen are made
+    assert row.depth == 0
+    assert not has_author(root, 'ClearBrightLight')
+
+    row.toggle_collapsed()
+    wait_for(lambda: not has_author(root, 'SulkySkunkPomPoms'))
+    assert has_author(root, 'Raine342')
+
+    row.toggle_collapsed()
+    wait_for(lambda: has_author(root, 'SulkySkunkPomPoms'))
+
+
+@with_test_mainloop
+def test_rebind_keeps_top_bar(datadir):
+    root = build_thread(datadir)
+    row = find_widget(root, label='puppylust', kind=Gtk.Button) \
+        .get_ancestor(comments.NormalCommentRow)
+    other = find_widget(root, label='SulkySkunkPomPoms', kind=Gtk.Button) \
+        .get_ancestor(comments.NormalCommentRow)
+    top = row._top
+
+    row.bind(other.node)
+    assert row._top is top
+    assert not has_author(root, 'puppylust')
+    assert len(find_widget(root, label='SulkySkunkPomPoms', kind=Gtk.Button,
+                           many=True)) == 2
+
+
+@with_test_mainloop
+def test_collapse_rule_expands_lazily(datadir):
+    root = build_thread(datadir, collapse=CollapseRule(depth=1))
+    assert not has_author(root, 'SulkySkunkPomPoms')
+    assert has_author(root, 'Raine342')
+
+    button = find_widget(root, label='puppylust', kind=Gtk.Button)
+    row = button.get_ancestor(comments.NormalCommentRow)
+    row.toggle_collapsed()
+    wait_for(lambda: has_author(root, 'SulkySkunkPomPoms'))
+
+
+@with_test_mainloop
+def test_keyboard_navigation(datadir):
+    root = build_thread(datadir)
+
+    root.do_event(fake_event('j'))
+    root.do_event(fake_event('j'))
+    focused = get_focused(root).get_ancestor(comments.CommentRow)
+    assert focused.data['author'] == 'puppylust'
+
+    # Next top level comment
+    root.do_event(fake_event('l'))
+    focused = get_focused(root).get_ancestor(comments.CommentRow)
+    assert focused.data['author'] == 'Raine342'
+
+    root.do_event(fake_event('j'))
+    focused = get_focused(root).get_ancestor(comments.CommentRow)
+    assert focused.data['author'] == 'psychic_mudkip'
+    assert focused.depth == 1
+
+
+@with_test_mainloop
+def test_thread_cached_before_ticket_keeps_place(datadir):
+    with open(datadir / 'comments--thread.json') as f:
+        j = json.load(f)
+    ticket = MagicMock(got_response=False)
+
+    def send_request(method, path, callback, **kwargs):
+        # Small cached bodies are decoded straight away
+        callback(json.loads(json.dumps(j)))
+        return ticket
+
+    api = MagicMock()
+    api.send_request.side_effect = send_request
+    root = comments.CommentsView(api, permalink=PERMALINK)
+    window = Gtk.OffscreenWindow()
+    window.set_size_request(500, 800)
+    window.add(root)
+    window.show_all()
+    (_, _, cb), _ = api.send_request.call_args
+    n_items = root._model.get_n_items()
+    root.scroll_to_position(5)
+    wait_for(lambda: root.get_position() == 5)
+
+    ticket.got_response = True
+    j[1]['data']['children'] = j[1]['data']['children'][:1]
+    cb(j)
+    assert root._model.get_n_items() == n_items
+    assert root.get_position() == 5
+
+
+@with_test_mainloop
+def test_empty_thread(datadir):
+    api = MagicMock()
+    with open(datadir / 'comments--thread.json') as f:
+        j = json.load(f)
+    j[1]['data']['children'] = []
+    root = comments.CommentsView(api, comments=j, permalink=PERMALINK)
+    window = Gtk.OffscreenWindow()
+    window.set_size_request(500, 800)
+    window.add(root)
+    window.show_all()
+
+    wait_for(lambda: find_widget(root, kind=comments._EmptyRow, many=True))
+    assert not find_widget(root, kind=comments.CommentRow, many=True)
+    root.do_event(fake_event('j'))
+
+
+@with_test_mainloop
+def test_big_thread_added_in_slices(datadir):
+    root = build_thread(datadir)
+    progress = find_widget(root, kind=Gtk.ProgressBar)
+    wait_for(lambda: not progress.props.visible)
+    assert progress.props.fraction == 1
+
+    # The last top level comment can be reached once it is all added
+    for i in range(100):
+        root.do_event(fake_event('l'))
+    focused = get_focused(root).get_ancestor(comments.CommentRow)
+    assert focused.depth == 0
+    assert focused.data['count']
+
+
+@with_test_mainloop
+def test_reply_for_old_permalink_dropped(datadir):
+    api = MagicMock()
+    api.send_request.side_effect = lambda *args, **kwargs: MagicMock()
+    root = comments.CommentsView(api, permalink=PERMALINK)
+    (_, _, old_cb), _ = api.send_request.call_args
+    old_ticket = root._msg
+
+    root.reply_posted('abc')
+    api.cancel.assert_any_call(old_ticket)
+    with open(datadir / 'comments--thread.json') as f:
+        old_cb(json.load(f))
+    assert root._tree is None
+
+
+@with_test_mainloop
+def test_revalidated_thread_keeps_place(datadir):
+    api = MagicMock()
+    api.send_request.return_value.got_response = False
+    root = comments.CommentsView(api, permalink=PERMALINK)
+    window = Gtk.OffscreenWindow()
+    window.set_size_request(500, 800)
+    window.add(root)
+    window.show_all()
+
+    (_, _, cb), _ = api.send_request.call_args
+    with open(datadir / 'comments--thread.json') as f:
+        j = json.load(f)
+    # From the cache
+    cb(json.loads(json.dumps(j)))
+    n_items = root._model.get_n_items()
+    root.scroll_to_position(5)
+    wait_for(lambda: root.get_position() == 5)
+
+    # The network's version, with fewer comments
+    api.send_request.return_value.got_response = True
+    j[1]['data']['children'] = j[1]['data']['children'][:1]
+    cb(j)
+    assert root._model.get_n_items() == n_items
+    assert root.get_position() == 5
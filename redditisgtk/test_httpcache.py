@@ -0,0 +1,205 @@
+from redditisgtk import httpcache
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_by_bytes():
+    lru = httpcache.LRUCache(10)
+    lru.put('a', b'12345')
+    lru.put('b', b'12345')
+    assert lru.total_bytes == 10
+
+    # Touch a, so b is the least recently used
+    assert lru.get('a') == b'12345'
+    lru.put('c', b'123')
+    assert 'a' in lru
+    assert 'b' not in lru
+    assert 'c' in lru
+    assert lru.total_bytes == 8
+
+
+def test_lru_too_big():
+    lru = httpcache.LRUCache(2)
+    lru.put('a', b'1')
+    lru.put('b', b'123')
+    assert 'a' in lru
+    assert 'b' not in lru
+
+
+def test_classify_path():
+    assert httpcache.classify_path('/r/linux?raw_json=1') == 'listing'
+    assert httpcache.classify_path('/') == 'listing'
+    assert httpcache.classify_path('/r/linux/about/?raw_json=1') == 'about'
+    assert httpcache.classify_path('/user/bob/about') == 'about'
+    assert httpcache.classify_path(
+        '/r/rct/comments/4ns96b/new_to_rct/') == 'comments'
+    assert httpcache.classify_path(
+        '/api/morechildren?children=a') == 'comments'
+
+
+def test_response_cache_ttl():
+    clock = FakeClock()
+    cache = httpcache.ResponseCache(
+        ttls={'listing': 10, 'about': 100, 'comments': 1},
+        time_func=clock)
+    cache.store('key', '/r/linux', b'{}')
+
+    entry = cache.lookup('key')
+    assert entry.body == b'{}'
+    assert cache.is_fresh(entry)
+
+    clock.now += 11
+    entry = cache.lookup('key')
+    assert entry.body == b'{}'
+    assert not cache.is_fresh(entry)
+
+    clock.now += httpcache.MAX_STALE
+    assert cache.lookup('key') is None
+
+
+def test_response_cache_invalidate():
+    cache = httpcache.ResponseCache()
+    cache.store('a', '/r/linux', b'{"name": "t3_aaa"}')
+    cache.store('b', '/r/gnome', b'{"name": "t3_bbb"}')
+    cache.store('c', '/user/me/saved', b'{}')
+
+    cache.invalidate_containing('t3_aaa')
+    assert cache.lookup('a') is None
+    assert cache.lookup('b') is not None
+
+    cache.invalidate(lambda entry: '/saved' in entry.path)
+    assert cache.lookup('b') is not None
+    assert cache.lookup('c') is None
+
+
+def test_response_cache_restore():
+    clock = FakeClock()
+    cache = httpcache.ResponseCache(time_func=clock)
+    cache.restore('key', '/r/linux', b'{}')
+    entry = cache.lookup('key')
+    assert entry.body == b'{}'
+    # So it is revalidated
+    assert not cache.is_fresh(entry)
+
+    clock.now += httpcache.MAX_STALE - 1
+    assert cache.lookup('key') is not None
+
+
+def test_disk_cache_persists(tmpdir):
+    disk = httpcache.DiskCache(str(tmpdir / 'cache'))
+    disk.put(('me', 'GET', 'url'), '/r/linux', b'body', 123.0)
+    assert disk.get(('me', 'GET', 'url')) == ('/r/linux', b'body', 123.0)
+    assert disk.get(('you', 'GET', 'url')) is None
+
+    disk = httpcache.DiskCache(str(tmpdir / 'cache'))
+    assert disk.get(('me', 'GET', 'url')) == ('/r/linux', b'body', 123.0)
+
+
+def test_disk_cache_evicts_lru(tmpdir):
+    disk = httpcache.DiskCache(str(tmpdir), max_bytes=10)
+    disk.put(('a',), '/a', b'12345', 1)
+    disk.put(('b',), '/b', b'12345', 1)
+    disk.get(('a',))
+    disk.put(('c',), '/c', b'123', 1)
+    assert disk.get(('a',)) is not None
+    assert disk.get(('b',)) is None
+    assert disk.get(('c',)) is not None
+    assert len(tmpdir.listdir()) == 3  # a, c and the index
+
+
+def test_disk_cache_remove_paths(tmpdir):
+    disk = httpcache.DiskCache(str(tmpdir))
+    disk.put(('a',), '/user/me/saved', b'1', 1)
+    disk.put(('b',), '/r/linux', b'1', 1)
+    disk.remove_paths(lambda path: '/saved' in path)
+    assert disk.get(('a',)) is None
+    assert disk.get(('b',)) is not None
+
+
+def test_disk_cache_without_autosave(tmpdir):
+    disk = httpcache.DiskCache(str(tmpdir), autosave=False)
+    disk.put(('a',), '/a', b'1', 1)
+    disk.put(('b',), '/b', b'1', 1)
+    disk.save_index()
+    disk.put(('c',), '/c', b'1', 1)
+
+    # Like crashing before the index was saved, so c is lost
+    disk = httpcache.DiskCache(str(tmpdir))
+    assert disk.get(('a',)) is not None
+    assert disk.get(('c',)) is None
+    assert len(tmpdir.listdir()) == 3  # a, b and the index
+
+
+def test_response_cache_uses_disk(tmpdir):
+    clock = FakeClock()
+    disk = httpcache.DiskCache(str(tmpdir))
+    cache = httpcache.ResponseCache(time_func=clock, disk=disk)
+    cache.store(('me', 'GET', 'url'), '/r/linux', b'{}')
+    # Abouts are not worth keeping
+    cache.store(('me', 'GET', 'about'), '/r/linux/about', b'{}')
+
+    # Like restarting the app
+    clock.now += 100
+    cache = httpcache.ResponseCache(
+        time_func=clock, disk=httpcache.DiskCache(str(tmpdir)))
+    entry = cache.lookup(('me', 'GET', 'url'))
+    assert entry.body == b'{}'
+    assert not cache.is_fresh(entry)
+    assert cache.lookup(('me', 'GET', 'about')) is None
+
+
+def test_disk_cache_invalidate_containing(tmpdir):
+    clock = FakeClock()
+    cache = httpcache.ResponseCache(
+        time_func=clock, disk=httpcache.DiskCache(str(tmpdir)))
+    cache.store(('me', 'GET', 'a'), '/r/linux', b'{"name": "t3_aaa"}')
+    cache.store(('me', 'GET', 'b'), '/r/gnome', b'{"name": "t3_bbb"}')
+    clock.now += 1
+    cache.invalidate_containing('t3_aaa')
+    clock.now += 1
+    # Stored after the vote, so it is up to date
+    cache.store(('me', 'GET', 'c'), '/r/rct', b'{"name": "t3_aaa"}')
+
+    # Like restarting the app, so the bodies are only on the disk
+    disk = httpcache.DiskCache(str(tmpdir))
+    cache = httpcache.ResponseCache(time_func=clock, disk=disk)
+    assert cache.lookup(('me', 'GET', 'a')) is None
+    assert cache.lookup(('me', 'GET', 'b')) is not None
+    assert cache.lookup(('me', 'GET', 'c')) is not None
+    assert len(tmpdir.listdir()) == 3  # b, c and the index
+
+
+def test_disk_cache_writes_in_background(tmpdir):
+    queued = []
+    disk = httpcache.DiskCache(str(tmpdir), run_in_background=queued.append)
+    disk.put(('a',), '/a', b'1', 1)
+    disk.put(('b',), '/b', b'2', 1)
+    disk.remove(('a',))
+    # Only one writer at a time
+    assert len(queued) == 1
+    assert tmpdir.listdir() == []
+    assert disk.get(('b',)) == ('/b', b'2', 1)
+
+    queued.pop()()
+    # The index was only written once, after a was removed
+    assert sorted(p.basename for p in tmpdir.listdir()) == \
+        sorted([disk._name(('b',)), 'index.json'])
+    disk = httpcache.DiskCache(str(tmpdir))
+    assert disk.get(('a',)) is None
+    assert disk.get(('b',)) == ('/b', b'2', 1)
+
+
+def test_disk_cache_old_index(tmpdir):
+    disk = httpcache.DiskCache(str(tmpdir))
+    disk.put(('a',), '/a', b'1', 1)
+    # From before there were invalidations
+    tmpdir.join('index.json').write(
+        '[["{}", "/a", 1, 1]]'.format(disk._name(('a',))))
+    disk = httpcache.DiskCache(str(tmpdir))
+    assert disk.get(('a',)) == ('/a', b'1', 1)
@@ -0,0 +1,163 @@
+from unittest.mock import MagicMock, patch
+
+from gi.repository import GdkPixbuf
+
+from redditisgtk import imagecache
+from redditisgtk.httpcache import DiskCache
+
+
+def make_png(width=4, height=4) -> bytes:
+    pixbuf = GdkPixbuf.Pixbuf.new(
+        GdkPixbuf.Colorspace.RGB, False, 8, width, height)
+    pixbuf.fill(0xff0000ff)
+    ok, data = pixbuf.save_to_bufferv('png', [], [])
+    return data
+
+
+def run_now(func, args, callback, *callback_args, error_callback=None):
+    try:
+        result = func(*args)
+    except Exception:
+        error_callback()
+    else:
+        callback(result, *callback_args)
+
+
+def build_cache(session, **kwargs):
+    return imagecache.ImageCache(session, run_in_thread=run_now, **kwargs)
+
+
+def build_fake_session(data: bytes):
+    '''
+    Returns a session that gives every message the data, once you call the
+    returned flush function
+    '''
+    session = MagicMock()
+    queued = []
+    session.queue_message = lambda *args: queued.append(args)
+
+    def flush():
+        while queued:
+            msg, callback, user_data = queued.pop(0)
+            msg.props = MagicMock()
+            msg.props.status_code = 200
+            flat = MagicMock()
+            flat.get_data.return_value = data
+            msg.props.response_body.flatten.return_value = flat
+            callback(session, msg, user_data)
+    return session, queued, flush
+
+
+def test_memory_hit():
+    session, queued, flush = build_fake_session(make_png())
+    cache = build_cache(session)
+
+    cb1 = MagicMock()
+    cache.get('https://i.redd.it/a.png', cb1)
+    flush()
+    (pixbuf,), _ = cb1.call_args
+    assert pixbuf.props.width == 4
+
+    cb2 = MagicMock()
+    cache.get('https://i.redd.it/a.png', cb2)
+    assert not queued
+    (pixbuf2,), _ = cb2.call_args
+    assert pixbuf2 is pixbuf
+    assert cache.get_stats()['memory_hits'] == 1
+    assert cache.get_stats()['hit_rate'] == 0.5
+
+
+def test_disk_hit(tmpdir):
+    session, queued, flush = build_fake_session(make_png())
+    cache = build_cache(session, disk=DiskCache(str(tmpdir)))
+    cache.get('https://i.redd.it/a.png', MagicMock())
+    flush()
+
+    # Like restarting the app
+    cache = build_cache(session, disk=DiskCache(str(tmpdir)))
+    callback = MagicMock()
+    cache.get('https://i.redd.it/a.png', callback)
+    assert not queued
+    (pixbuf,), _ = callback.call_args
+    assert pixbuf.props.width == 4
+    assert cache.get_stats()['disk_hits'] == 1
+
+
+def test_concurrent_gets_share_download():
+    session, queued, flush = build_fake_session(make_png())
+    cache = build_cache(session)
+    cb1 = MagicMock()
+    cb2 = MagicMock()
+    cache.get('https://i.redd.it/a.png', cb1)
+    cache.get('https://i.redd.it/a.png', cb2)
+    assert len(queued) == 1
+
+    flush()
+    assert cb1.called
+    assert cb2.called
+    assert cache.get_stats()['joined'] == 1
+
+
+def test_cancel():
+    session, queued, flush = build_fake_session(make_png())
+    cache = build_cache(session)
+    cb1 = MagicMock()
+    cb2 = MagicMock()
+    ticket1 = cache.get('https://i.redd.it/a.png', cb1)
+    ticket2 = cache.get('https://i.redd.it/a.png', cb2)
+    cache.cancel(ticket1)
+    assert not session.cancel_message.called
+
+    flush()
+    assert not cb1.called
+    assert cb2.called
+
+
+def test_broken_image_not_cached():
+    session, queued, flush = build_fake_session(b'not an image')
+    cache = build_cache(session)
+    callback = MagicMock()
+    cache.get('https://i.redd.it/a.png', callback)
+    flush()
+    callback.assert_called_once_with(None)
+
+    cache.get('https://i.redd.it/a.png', callback)
+    assert len(queued) == 1
+
+
+@patch('redditisgtk.imagecache.decode_pixbuf', side_effect=ValueError)
+def test_decoder_error(decode_pixbuf):
+    session, queued, flush = build_fake_session(b'\x89PNG truncated')
+    cache = build_cache(session)
+    callback = MagicMock()
+    cache.get('https://i.redd.it/a.png', callback)
+    flush()
+    callback.assert_called_once_with(None)
+
+    # Not stuck waiting for the decode, so it is tried again
+    joined = MagicMock()
+    cache.get('https://i.redd.it/a.png', joined)
+    assert len(queued) == 1
+    flush()
+    joined.assert_called_once_with(None)
+
+
+def test_decodes_at_size():
+    session, queued, flush = build_fake_session(make_png(400, 200))
+    cache = build_cache(session)
+    small = MagicMock()
+    full = MagicMock()
+    cache.get('https://i.redd.it/a.png', small, max_width=100, max_height=100)
+    cache.get('https://i.redd.it/a.png', full)
+    assert len(queued) == 1
+
+    flush()
+    (pixbuf,), _ = small.call_args
+    assert (pixbuf.props.width, pixbuf.props.height) == (100, 50)
+    (pixbuf,), _ = full.call_args
+    assert (pixbuf.props.width, pixbuf.props.height) == (400, 200)
+
+
+def test_decode_pixbuf_does_not_scale_up():
+    pixbuf = imagecache.decode_pixbuf(make_png(), 100, 100)
+    assert pixbuf.props.width == 4
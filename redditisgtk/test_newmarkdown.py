@@ -1,3 +1,5 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock
 
 from redditisgtk import newmarkdown
@@ -107,3 +109,85 @@ def test_error():
     # https://www.reddit.com/r/reddit.com/comments/6ewgt/reddit_markdown_primer_or_how_do_you_do_all_that/c03nmy1/
     w = newmarkdown.make_html_widget('<p>Issue &trade;</p>')
     assert_matches_snapshot('newmarkdown--error-handler', snapshot_widget(w))
+
+
+def test_simple_html_is_one_label():
+    w = newmarkdown.make_html_widget(
+        '<div class="md"><p>Hello <strong>there</strong></p>\n'
+        '<p>&quot;<a href="/u/x">me</a>&quot;<br/>:)</p>\n</div>')
+    assert isinstance(w, newmarkdown.AlignedLabel)
+    assert w.props.label == (
+        'Hello <b>there</b>\n\n&quot;<a href="/u/x">me</a>&quot;\n:)')
+
+
+def test_simple_html_matches_slow_path(datadir):
+    with open(datadir / 'comments--thread.json') as f:
+        j = json.load(f)
+    for child in j[1]['data']['children']:
+        if child['kind'] != 't1':
+            continue
+        body = child['data']['body_html']
+        fast = newmarkdown.parse_html(body)
+        slow = newmarkdown.parse_html(body, fast_path=False)
+        assert fast.kind == 'markup'
+        # <div> then <div class="md"> then the paragraphs
+        paragraphs = slow.children[0].children
+        assert fast.text == '\n\n'.join(p.text for p in paragraphs)
+
+
+def test_cache():
+    cache = newmarkdown.BlockCache()
+    parse = MagicMock(side_effect=newmarkdown.parse_html)
+
+    block = cache.get('html', '<p>hello</p>', parse)
+    assert block.text == 'hello'
+    assert cache.get('html', '<p>hello</p>', parse) is block
+    assert parse.call_count == 1
+    # Same text, but it means something else
+    cache.get('markdown', '<p>hello</p>', parse)
+    assert parse.call_count == 2
+
+    stats = cache.get_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert stats['entries'] == 2
+
+
+def test_cached_widgets_match():
+    text = 'cached **text** at /r/linux'
+    first = newmarkdown.make_markdown_widget(text)
+    hits = newmarkdown.get_cache_stats()['hits']
+    second = newmarkdown.make_markdown_widget(text)
+    assert newmarkdown.get_cache_stats()['hits'] == hits + 1
+    assert snapshot_widget(first) == snapshot_widget(second)
+
+
+def test_cache_prepare():
+    cache = newmarkdown.BlockCache()
+    cache.prepare('html', ['<p>a</p>', '<p>b</p>'], newmarkdown.parse_html)
+    parse = MagicMock(side_effect=newmarkdown.parse_html)
+    assert cache.get('html', '<p>a</p>', parse).text == 'a'
+    assert not parse.called
+    # Already there, so not parsed again
+    cache.prepare('html', ['<p>b</p>', '<p>c</p>'], parse)
+    assert parse.call_count == 1
+
+    stats = cache.get_stats()
+    assert stats['prepared'] == 3
+    assert stats['hits'] == 1
+    assert stats['misses'] == 0
+
+
+def test_markdown_is_reset():
+    html = newmarkdown.markdown_to_html('[a][1]\n\n[1]: http://a.com')
+    assert 'href="http://a.com"' in html
+    # The reference is forgotten once that text is done
+    assert 'href' not in newmarkdown.markdown_to_html('[a][1]')
+
+
+def test_markdown_in_threads():
+    texts = ['**{}** ^super ~~s~~ /r/linux'.format(i) for i in range(50)]
+    expected = [newmarkdown.markdown_to_html(t) for t in texts]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(newmarkdown.markdown_to_html,
+                                 texts)) == expected
@@ -88,3 +88,27 @@ def test_reply_palette(datadir):
 
     cb({'json': {'data': {'things': [{'data': {'id': 'MYID'}}]}}})
     assert poproot.props.visible == False
+
+
+@with_test_mainloop
+def test_bind(datadir):
+    api = MagicMock()
+    toplevel_cv = MagicMock()
+    with open(datadir / 'posttopbar--comment.json') as f:
+        comment = json.load(f)
+    with open(datadir / 'posttopbar--post.json') as f:
+        post = json.load(f)
+
+    bar = posttopbar.PostTopBar(api, comment, toplevel_cv)
+    child = bar.get_child()
+    post['saved'] = not comment.get('saved')
+    bar.bind(post)
+    assert bar.get_child() is child
+    assert find_widget(bar, label='sandragen', kind=Gtk.Button)
+    assert not find_widget(bar, label='andnbspsc', many=True)
+    # Showing if it is saved doesn't save it
+    assert not api.set_saved.called
+
+    bar.get_toplevel = lambda: api
+    bar.do_event(fake_event('u'))
+    assert api.vote.call_args[0] == (post['name'], +1)
@@ -18,11 +18,17 @@ def test_get_data_file_path_no_create(isdir, makedirs):
     assert not makedirs.called
 
 
+def read_names(path):
+    with open(path) as f:
+        return sorted(line.split()[0] for line in f)
+
+
 def test_readcontroller_load(tmpdir):
     path = tmpdir / 'read'
     with open(path, 'w') as f:
         f.write('a1\na2')
-    ctrl = readcontroller.ReadController(data_path=path)
+    ctrl = readcontroller.ReadController(data_path=path,
+                                         run_in_thread=MagicMock())
     assert ctrl.is_read('a1')
     assert ctrl.is_read('a2')
     assert not ctrl.is_read('b1')
@@ -31,5 +37,160 @@ def test_readcontroller_load(tmpdir):
     assert ctrl.is_read('b1')
 
     ctrl.save()
+    assert read_names(path) == ['a1', 'a2', 'b1']
+
+
+def test_read_appends_in_batches(tmpdir):
+    path = tmpdir / 'read'
+    with open(path, 'w') as f:
+        f.write('a1\n')
+    timeout_add = MagicMock()
+    ctrl = readcontroller.ReadController(data_path=path,
+                                         timeout_add=timeout_add,
+                                         time_func=lambda: 1000.5)
+    ctrl.read('b1')
+    ctrl.read('b2')
+    ctrl.read('a1')
+    # One write for the batch
+    assert timeout_add.call_count == 1
     with open(path) as f:
-        assert sorted(f.read().splitlines()) == ['a1', 'a2', 'b1']
+        assert f.read() == 'a1\n'
+
+    (delay, flush_cb), _ = timeout_add.call_args
+    assert flush_cb() is False
+    with open(path) as f:
+        assert f.read() == 'a1\nb1 1000\nb2 1000\n'
+
+
+@patch('redditisgtk.readcontroller.COMPACT_MIN_LINES', 4)
+def test_compacts_journal(tmpdir):
+    path = tmpdir / 'read'
+    with open(path, 'w') as f:
+        f.write('a\na\na\nb\na\n')
+    calls = []
+    ctrl = readcontroller.ReadController(
+        data_path=path, timeout_add=MagicMock(),
+        run_in_thread=lambda *args, **kwargs: calls.append(args))
+
+    # Started compacting on load, as it is 5 lines for 2 names
+    (func, args, callback), = calls
+    ctrl.read('c')
+    ctrl.save()
+    callback(func(*args))
+    assert read_names(path) == ['a', 'b', 'c']
+
+    ctrl.read('d')
+    ctrl.save()
+    assert read_names(path) == ['a', 'b', 'c', 'd']
+
+
+def test_read_set():
+    read = readcontroller.ReadSet()
+    read.update([('t3_abc', 86400), ('t1_abc', 86400), ('odd', 86400)])
+    for i in range(readcontroller.MERGE_SIZE + 10):
+        read.add('t3_{}'.format(i), 2 * 86400)
+
+    assert 't3_abc' in read
+    assert 't1_abc' in read
+    assert 'odd' in read
+    assert 't4_abc' not in read
+    assert 't3_abd' not in read
+    assert 't3_zzzzzzzz' not in read
+    assert len(read) == 3 + readcontroller.MERGE_SIZE + 10
+
+    # The latest read wins
+    read.add('t3_abc', 3 * 86400)
+    items = dict(read.items())
+    assert items['t3_abc'] == 3 * 86400
+    assert items['t1_abc'] == 86400
+    assert items['odd'] == 86400
+    assert items['t3_0'] == 2 * 86400
+
+    read.expire(2 * 86400)
+    assert 't3_abc' in read
+    assert 't3_0' in read
+    assert 't1_abc' not in read
+    assert 'odd' not in read
+
+
+def test_expires_old_reads(tmpdir):
+    path = tmpdir / 'read'
+    day = 86400
+    with open(path, 'w') as f:
+        f.write('t3_old {}\nt3_new {}\nt3_older\n'.format(day, 10 * day))
+    calls = []
+    ctrl = readcontroller.ReadController(
+        data_path=path, max_age=5 * day, time_func=lambda: 12 * day,
+        timeout_add=MagicMock(),
+        run_in_thread=lambda *args, **kwargs: calls.append(args))
+    assert not ctrl.is_read('t3_old')
+    assert ctrl.is_read('t3_new')
+    # No time, so we don't know how old it is
+    assert ctrl.is_read('t3_older')
+
+    # Rewritten straight away, so t3_old is gone and t3_older has a time
+    (func, args, callback), = calls
+    callback(func(*args))
+    with open(path) as f:
+        assert f.read() == 't3_new {}\nt3_older {}\n'.format(
+            10 * day, 12 * day)
+
+    # So the next time, t3_older expires like anything else
+    ctrl = readcontroller.ReadController(
+        data_path=path, max_age=5 * day, time_func=lambda: 16 * day,
+        timeout_add=MagicMock(), run_in_thread=MagicMock())
+    assert ctrl.is_read('t3_older')
+    ctrl = readcontroller.ReadController(
+        data_path=path, max_age=5 * day, time_func=lambda: 30 * day,
+        timeout_add=MagicMock(), run_in_thread=MagicMock())
+    assert not ctrl.is_read('t3_older')
+
+
+def test_timed_journal_not_rewritten(tmpdir):
+    path = tmpdir / 'read'
+    day = 86400
+    with open(path, 'w') as f:
+        f.write('t3_new {}\n'.format(10 * day))
+    run_in_thread = MagicMock()
+    readcontroller.ReadController(
+        data_path=path, max_age=5 * day, time_func=lambda: 12 * day,
+        timeout_add=MagicMock(), run_in_thread=run_in_thread)
+    assert not run_in_thread.called
+
+
+def test_failed_compaction(tmpdir):
+    path = tmpdir / 'read'
+    with open(path, 'w') as f:
+        f.write('a\n')
+    calls = []
+    ctrl = readcontroller.ReadController(
+        data_path=path, timeout_add=MagicMock(),
+        run_in_thread=lambda *args, **kwargs: calls.append(kwargs))
+
+    (kwargs,) = calls
+    kwargs['error_callback']()
+    ctrl.read('b')
+    ctrl.save()
+    assert read_names(path) == ['a', 'b']
+    # Not stuck compacting, so it can try again
+    ctrl.compact()
+    assert len(calls) == 2
+
+
+def test_parse_journal():
+    day = 86400
+    values, other, untimed = readcontroller.parse_journal(
+        't3_a {}\nt1_b {}\n'.format(day, 2 * day), 0)
+    assert other == []
+    assert untimed == 0
+    read = readcontroller.ReadSet()
+    read.update_packed(values)
+    assert dict(read.items()) == {'t3_a': day, 't1_b': 2 * day}
+
+    values, other, untimed = readcontroller.parse_journal(
+        't3_a {}\nodd {}\n t1_b\n\n'.format(day, day), 5 * day)
+    assert other == [('odd', day)]
+    assert untimed == 1
+    read = readcontroller.ReadSet()
+    read.update_packed(values)
+    assert dict(read.items()) == {'t3_a': day, 't1_b': 5 * day}
@@ -0,0 +1,179 @@
+from unittest.mock import MagicMock
+
+from gi.repository import Soup
+
+from redditisgtk.scheduler import RequestScheduler
+
+
+class FakeEnvironment():
+    def __init__(self):
+        self.now = 1000.0
+        self.timers = []
+        self.sent = []
+        self.session = MagicMock()
+        self.session.queue_message = \
+            lambda msg, cb, job: self.sent.append((msg, cb, job))
+
+    def time(self):
+        return self.now
+
+    def timeout_add(self, ms, callback):
+        self.timers.append((ms, callback))
+        return len(self.timers)
+
+    def make_scheduler(self, **kwargs):
+        return RequestScheduler(self.session, time_func=self.time,
+                                timeout_add=self.timeout_add, **kwargs)
+
+    def respond(self, index=0, status=200, remaining=None, reset=None):
+        msg, cb, job = self.sent.pop(index)
+        headers = {}
+        if remaining is not None:
+            headers['X-Ratelimit-Remaining'] = str(remaining)
+            headers['X-Ratelimit-Reset'] = str(reset)
+        msg.props.status_code = status
+        msg.props.response_headers.get_one = headers.get
+        cb(self.session, msg, job)
+
+
+def test_sends_straight_away():
+    env = FakeEnvironment()
+    scheduler = env.make_scheduler()
+    cb = MagicMock()
+    msg = MagicMock()
+    scheduler.queue(msg, cb, 'ud')
+    assert len(env.sent) == 1
+
+    env.respond()
+    cb.assert_called_once_with(env.session, msg, 'ud')
+
+
+def test_priority_order():
+    env = FakeEnvironment()
+    scheduler = env.make_scheduler(max_in_flight=1)
+    order = []
+    blocker = MagicMock()
+    scheduler.queue(blocker, MagicMock())
+
+    for name, priority in [('thumb', Soup.MessagePriority.LOW),
+                           ('listing', Soup.MessagePriority.HIGH),
+                           ('vote', Soup.MessagePriority.NORMAL)]:
+        scheduler.queue(MagicMock(), lambda s, m, ud: order.append(ud),
+                        name, priority=priority)
+    assert scheduler.get_stats()['queue_depth'] == 3
+
+    while env.sent:
+        env.respond()
+    assert order == ['listing', 'vote', 'thumb']
+
+
+def test_raise_priority():
+    env = FakeEnvironment()
+    scheduler = env.make_scheduler(max_in_flight=1)
+    order = []
+    scheduler.queue(MagicMock(), MagicMock())
+
+    msgs = {}
+    for name, priority in [('prefetch', Soup.MessagePriority.VERY_LOW),
+                           ('vote', Soup.MessagePriority.NORMAL)]:
+        msgs[name] = MagicMock()
+        scheduler.queue(msgs[name], lambda s, m, ud: order.append(ud),
+                        name, priority=priority)
+    scheduler.raise_priority(msgs['prefetch'], Soup.MessagePriority.HIGH)
+    # Never lowered
+    scheduler.raise_priority(msgs['prefetch'], Soup.MessagePriority.LOW)
+    assert scheduler.get_stats()['queue_depth'] == 2
+
+    while env.sent:
+        env.respond()
+    assert order == ['prefetch', 'vote']
+
+
+def test_waits_when_budget_is_used():
+    env = FakeEnvironment()
+    scheduler = env.make_scheduler(burst=0)
+    scheduler.queue(MagicMock(), MagicMock())
+    env.respond(remaining=0, reset=10)
+
+    cb = MagicMock()
+    scheduler.queue(MagicMock(), cb)
+    assert env.sent == []
+    assert scheduler.get_stats()['queue_depth'] == 1
+    (ms, timer_cb), = env.timers
+    assert 10000 <= ms <= 10100
+
+    env.now += 10
+    timer_cb()
+    assert len(env.sent) == 1
+    assert scheduler.get_stats()['max_wait'] == 10
+
+
+def test_unbudgeted_ignore_limit():
+    env = FakeEnvironment()
+    scheduler = env.make_scheduler(burst=0)
+    scheduler.queue(MagicMock(), MagicMock())
+    env.respond(remaining=0, reset=10)
+
+    scheduler.queue(MagicMock(), MagicMock(), budgeted=False)
+    assert len(env.sent) == 1
+
+
+def test_spreads_out_requests():
+    env = FakeEnvironment()
+    scheduler = env.make_scheduler(burst=5)
+    scheduler.queue(MagicMock(), MagicMock())
+    env.respond(remaining=4, reset=8)
+
+    scheduler.queue(MagicMock(), MagicMock())
+    scheduler.queue(MagicMock(), MagicMock())
+    # 4 left over 8 seconds, so 1 every 2 seconds
+    assert env.sent == []
+    (ms, timer_cb), = env.timers
+    assert 2000 <= ms <= 2100
+
+    env.now += 2
+    timer_cb()
+    assert len(env.sent) == 1
+    assert len(env.timers) == 2
+
+
+def test_retry_after_429():
+    env = FakeEnvironment()
+    scheduler = env.make_scheduler()
+    cb = MagicMock()
+    msg = MagicMock()
+    scheduler.queue(msg, cb)
+    env.respond(status=429, remaining=0, reset=5)
+
+    assert not cb.called
+    assert env.sent == []
+    (ms, timer_cb), = env.timers
+    env.now += 5
+    timer_cb()
+    env.respond()
+    assert cb.called
+
+
+def test_cancel_queued():
+    env = FakeEnvironment()
+    scheduler = env.make_scheduler(max_in_flight=1)
+    scheduler.queue(MagicMock(), MagicMock())
+    msg = MagicMock()
+    cb = MagicMock()
+    scheduler.queue(msg, cb)
+
+    scheduler.cancel(msg)
+    assert not env.session.cancel_message.called
+    env.respond()
+    assert env.sent == []
+    assert not cb.called
+
+
+def test_cancel_sent():
+    env = FakeEnvironment()
+    scheduler = env.make_scheduler()
+    msg = MagicMock()
+    scheduler.queue(msg, MagicMock())
+    scheduler.cancel(msg)
+    env.session.cancel_message.assert_called_once_with(
+        msg, Soup.Status.CANCELLED)
@@ -0,0 +1,31 @@
+from redditisgtk.session import Session, load_session, save_session
+
+
+def test_round_trip(tmpdir):
+    path = tmpdir / 'session.json'
+    save_session(path, Session(
+        user='sam', sub='/r/linux', sub_position=12,
+        thread='/r/linux/comments/a/b/', thread_position=3,
+        pane_position=400, sub_body='{"kind": "Listing"}'))
+
+    session = load_session(path)
+    assert session.user == 'sam'
+    assert session.sub == '/r/linux'
+    assert session.sub_position == 12
+    assert session.thread == '/r/linux/comments/a/b/'
+    assert session.thread_position == 3
+    assert session.link is None
+    assert session.pane_position == 400
+    assert session.sub_body == '{"kind": "Listing"}'
+    assert session.thread_body is None
+
+
+def test_unusable_sessions(tmpdir):
+    path = tmpdir / 'session.json'
+    assert load_session(path) is None
+
+    for text in ['{"sub": ', '[]', '{"version": 1, "what": 2}',
+                 '{"version": 1000, "sub": "/r/linux"}']:
+        with open(path, 'w') as f:
+            f.write(text)
+        assert load_session(path) is None
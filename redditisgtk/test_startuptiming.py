@@ -0,0 +1,59 @@
+import sys
+import builtins
+
+import pytest
+
+from redditisgtk import startuptiming
+
+
+@pytest.fixture
+def timing(monkeypatch):
+    # Put the real import back after the test
+    monkeypatch.setattr(builtins, '__import__', builtins.__import__)
+    monkeypatch.setattr(startuptiming, 'ENABLED', True)
+    monkeypatch.setattr(startuptiming, '_start', None)
+    monkeypatch.setattr(startuptiming, '_reported', False)
+    monkeypatch.setattr(startuptiming, '_imports', {})
+    monkeypatch.setattr(startuptiming, '_marks', [])
+    startuptiming.install()
+    return startuptiming
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(builtins, '__import__', builtins.__import__)
+    monkeypatch.setattr(startuptiming, 'ENABLED', False)
+    monkeypatch.setattr(startuptiming, '_start', None)
+    real_import = builtins.__import__
+    startuptiming.install()
+    assert builtins.__import__ is real_import
+
+
+def test_times_new_imports(timing, monkeypatch):
+    monkeypatch.delitem(sys.modules, 'colorsys', raising=False)
+    import colorsys
+    import os
+    assert 'colorsys' in timing._imports
+    # Already loaded, so it took no time
+    assert 'os' not in timing._imports
+    total, self_time = timing._imports['colorsys']
+    assert 0 <= self_time <= total
+
+
+def test_fromlist_modules(timing, monkeypatch):
+    monkeypatch.delitem(sys.modules, 'json.tool', raising=False)
+    from json import tool
+    assert 'json.tool' in timing._imports
+
+
+def test_report(timing, capsys):
+    timing.mark('window shown')
+    timing.report()
+    err = capsys.readouterr().err
+    assert 'Slowest imports' in err
+    assert 'window shown' in err
+
+    # Startup is over, so later steps are not counted
+    timing.mark('later')
+    timing.report()
+    assert capsys.readouterr().err == ''
+    assert [name for name, _ in timing._marks] == ['window shown']
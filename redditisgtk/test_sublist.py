@@ -2,8 +2,10 @@ import json
 from unittest.mock import MagicMock, patch
 
 from gi.repository import Gtk
+from gi.repository import Soup
 
 from redditisgtk import sublist
+from redditisgtk import sublistrows
 from redditisgtk.gtktestutil import (with_test_mainloop, find_widget, wait_for,
                                      fake_event)
 
@@ -63,3 +65,187 @@ def test_sublist_create(get_about_row):
     assert find_widget(root, kind=FixtureMessageRow)
     assert find_widget(root, kind=FixtureLinkRow)
     assert find_widget(root, kind=FixtureMoreItemsRow)
+
+
+@with_test_mainloop
+@patch('redditisgtk.aboutrow.get_about_row',
+       return_value=Gtk.Label(label='about row'))
+def test_sublist_virtual(get_about_row):
+    api = MagicMock()
+    root = sublist.SubList(api, '/r/linux', virtual=True)
+
+    (sub, cb), _ = api.get_list.call_args
+    data = {
+        'data': {
+            'children': [{'kind': 'xx', 'win': i} for i in range(100)],
+            'after': 'next',
+        },
+    }
+    cb(data)
+    assert find_widget(root, label='about row', kind=Gtk.Label)
+    wait_for(lambda: find_widget(root, kind=Gtk.ListBoxRow, many=True))
+    assert len(find_widget(root, kind=Gtk.ListBoxRow, many=True)) < 100
+
+
+def page(after, n=3):
+    return {
+        'data': {
+            'children': [{'kind': 'xx', 'win': i} for i in range(n)],
+            'after': after,
+        },
+    }
+
+
+@with_test_mainloop
+@patch('redditisgtk.aboutrow.get_about_row', return_value=None)
+def test_sublist_prefetches_next_page(get_about_row):
+    api = MagicMock()
+    root = sublist.SubList(api, '/r/linux')
+    window = Gtk.OffscreenWindow()
+    window.set_size_request(300, 500)
+    window.add(root)
+    window.show_all()
+
+    (_, cb), _ = api.get_list.call_args
+    cb(page('next'))
+    # The whole page fits on the screen, so the next one is wanted soon
+    wait_for(lambda: api.get_list.call_count == 2)
+    (sub, prefetched_cb), kwargs = api.get_list.call_args
+    assert sub == '/r/linux?after=next'
+    assert kwargs['priority'] == Soup.MessagePriority.LOW
+    # The user didn't ask for it, so they aren't told if it fails
+    assert kwargs['background']
+    prefetched_cb(page('next2'))
+
+    more_row = find_widget(root, kind=sublistrows.MoreItemsRow)
+    more_row.activate()
+    # Loaded without going to the network again
+    assert len(find_widget(root, kind=sublistrows.MoreItemsRow,
+                           many=True)) == 1
+    assert api.get_list.call_count == 2
+    # Then it gets the one after that ready
+    wait_for(lambda: api.get_list.call_count == 3)
+    assert api.get_list.call_args[0][0] == '/r/linux?after=next2'
+
+
+@with_test_mainloop
+@patch('redditisgtk.aboutrow.get_about_row', return_value=None)
+def test_sublist_waits_for_prefetch(get_about_row):
+    api = MagicMock()
+    root = sublist.SubList(api, '/r/linux', virtual=True)
+    window = Gtk.OffscreenWindow()
+    window.set_size_request(300, 500)
+    window.add(root)
+    window.show_all()
+
+    (_, cb), _ = api.get_list.call_args
+    cb(page('next'))
+    wait_for(lambda: api.get_list.call_count == 2)
+    (sub, prefetched_cb), _ = api.get_list.call_args
+    assert sub == '/r/linux?after=next'
+
+    # The end of the list is already on screen, so it is wanted now; asking
+    # again joins the prefetch's request, at a higher priority
+    wait_for(lambda: root._msg is not None)
+    assert api.get_list.call_count == 3
+    (sub, cb), kwargs = api.get_list.call_args
+    assert sub == '/r/linux?after=next'
+    assert kwargs['priority'] == Soup.MessagePriority.HIGH
+    assert not kwargs.get('background')
+    assert api.cancel.called
+    assert root._prefetch_after is None
+
+    cb(page('next2'))
+    assert root._msg is None
+    assert root._model.get_n_items() == 6
+
+
+@with_test_mainloop
+@patch('redditisgtk.aboutrow.get_about_row', return_value=None)
+def test_sublist_goto_drops_prefetch(get_about_row):
+    api = MagicMock()
+    root = sublist.SubList(api, '/r/linux', virtual=True)
+    window = Gtk.OffscreenWindow()
+    window.add(root)
+    window.show_all()
+
+    (_, cb), _ = api.get_list.call_args
+    cb(page('next'))
+    wait_for(lambda: api.get_list.call_count == 2)
+    prefetch = api.get_list.return_value
+    root.goto('/r/gnome')
+    api.cancel.assert_any_call(prefetch)
+    assert root._prefetch_after is None
+
+
+@with_test_mainloop
+@patch('redditisgtk.sublist.get_read_controller')
+@patch('redditisgtk.sublist.CommentsView')
+def test_sublist_opens_prefetched_thread(CommentsView, get_read_controller):
+    api = MagicMock()
+    root = sublist.SubList(api, '/r/linux')
+    root._threads = MagicMock()
+    root._threads.take.return_value = ['prefetched thread']
+
+    root._handle_activate({'name': 't3_a', 'is_self': True,
+                           'permalink': '/r/linux/comments/a/'})
+    root._threads.take.assert_called_once_with('/r/linux/comments/a/')
+    _, kwargs = CommentsView.call_args
+    assert kwargs['comments'] == ['prefetched thread']
+
+
+@with_test_mainloop
+@patch('redditisgtk.aboutrow.get_about_row', return_value=None)
+def test_sublist_restores_position(get_about_row):
+    api = MagicMock()
+    root = sublist.SubList(api, '/r/linux', virtual=True)
+    window = Gtk.OffscreenWindow()
+    window.set_size_request(300, 500)
+    window.add(root)
+    window.show_all()
+
+    root.scroll_to_position(50)
+    (_, cb), _ = api.get_list.call_args
+    cb(page('next', n=100))
+    wait_for(lambda: root.get_position() == 50)
+
+
+@with_test_mainloop
+@patch('redditisgtk.aboutrow.get_about_row', return_value=None)
+def test_sublist_revalidated_listing(get_about_row):
+    api = MagicMock()
+    root = sublist.SubList(api, '/r/linux', virtual=True)
+    window = Gtk.OffscreenWindow()
+    window.set_size_request(300, 500)
+    window.add(root)
+    window.show_all()
+
+    (_, cb), _ = api.get_list.call_args
+    # The cached version, then the network's
+    cb(page('cached', n=100))
+    cb(page('new', n=100))
+    assert root._after == 'new'
+
+    # Once the user has scrolled, the network's version waits for later
+    root.scroll_to_position(50)
+    wait_for(lambda: root.get_position() == 50)
+    cb(page('newer', n=3))
+    assert root._model.get_n_items() == 100
+    assert root.get_position() == 50
+
+
+@with_test_mainloop
+@patch('redditisgtk.aboutrow.get_about_row', return_value=None)
+def test_sublist_goto_cancels_revalidation(get_about_row):
+    api = MagicMock()
+    api.get_list.side_effect = lambda *args, **kwargs: MagicMock()
+    root = sublist.SubList(api, '/r/linux')
+    (_, cb), _ = api.get_list.call_args
+    cb(page('cached'))
+    list_ticket = root._list_msg
+
+    root.goto('/r/gnome')
+    api.cancel.assert_any_call(list_ticket)
+    # A late reply for /r/linux doesn't replace the /r/gnome spinner
+    cb(page('late'))
+    assert find_widget(root, kind=Gtk.Spinner)
@@ -39,3 +39,51 @@ def test_message_row_pm_shortcuts(json_loader):
 
     row.do_event(fake_event('a'))
     toplevel.goto_sublist.assert_called_once_with('/u/bambambazooka')
+
+
+@with_test_mainloop
+def test_link_row_bind_keeps_widgets(json_loader):
+    api = MagicMock()
+    data = json_loader('sublistrows--thumb-from-previews')
+    row = sublistrows.LinkRow(api, data)
+    child = row.get_child()
+
+    other = json.loads(json.dumps(data))
+    other['data']['title'] = 'Another post'
+    other['data']['name'] = 't3_another'
+    row.bind(other)
+    assert row.get_child() is child
+    assert find_widget(row, label='Another post')
+    assert not find_widget(row, label=data['data']['title'], many=True)
+    # The old thumbnail is not wanted any more
+    assert api.cancel.called
+
+
+@with_test_mainloop
+def test_message_row_bind_keeps_widgets(json_loader):
+    api = MagicMock()
+    data = json_loader('sublistrows--pm')
+    row = sublistrows.MessageRow(api, data)
+    child = row.get_child()
+
+    other = json.loads(json.dumps(data))
+    other['data']['body'] = 'another message'
+    other['data']['subreddit'] = 'linux'
+    row.bind(other)
+    assert row.get_child() is child
+    assert find_widget(row, label='another message')
+    assert not find_widget(row, label='thanks a lot!', many=True)
+    assert find_widget(row, label='linux', kind=Gtk.Button)
+
+
+def test_prepare_listing(json_loader):
+    message = json_loader('sublistrows--pm')
+    link = json_loader('sublistrows--thumb-from-previews')
+    with patch('redditisgtk.newmarkdown.prepare_markdown') as prepare:
+        sublistrows.prepare_listing(
+            {'kind': 'Listing', 'data': {'children': [message, link]}})
+        (bodies,), _ = prepare.call_args
+        assert list(bodies) == [message['data']['body']]
+
+        # Errors are not listings
+        sublistrows.prepare_listing({'error': 404})
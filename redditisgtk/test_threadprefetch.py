@@ -0,0 +1,110 @@
+from unittest.mock import MagicMock
+
+from gi.repository import Soup
+
+from redditisgtk.threadprefetch import ThreadPrefetcher
+
+
+class FakeEnvironment():
+    def __init__(self):
+        self.now = 1000.0
+        self.idle = []
+        self.api = MagicMock()
+        # permalink -> (callback, ticket)
+        self.requests = {}
+
+        def send_request(method, path, callback, user_data=None, **kwargs):
+            ticket = MagicMock(body_size=None)
+            self.requests[path] = (callback, ticket, kwargs)
+            return ticket
+        self.api.send_request = send_request
+
+    def idle_add(self, func, *args, priority=None):
+        self.idle.append((func, args))
+
+    def run_idle(self):
+        idle, self.idle = self.idle, []
+        for func, args in idle:
+            func(*args)
+
+    def respond(self, permalink, size=100):
+        callback, ticket, _ = self.requests.pop(permalink)
+        ticket.body_size = size
+        callback([{'post': permalink}, {'comments': []}], permalink)
+
+    def make_prefetcher(self, **kwargs):
+        return ThreadPrefetcher(self.api, idle_add=self.idle_add,
+                                time_func=lambda: self.now, **kwargs)
+
+
+def posts(*permalinks):
+    return [{'permalink': p} for p in permalinks]
+
+
+def test_prefetches_when_idle():
+    env = FakeEnvironment()
+    prefetcher = env.make_prefetcher(max_threads=2)
+    prefetcher.want(posts('/a', '/b', '/c'))
+    assert env.requests == {}
+
+    env.run_idle()
+    assert sorted(env.requests) == ['/a', '/b']
+    _, _, kwargs = env.requests['/a']
+    assert kwargs['priority'] == Soup.MessagePriority.VERY_LOW
+    assert kwargs['background']
+
+    env.respond('/a')
+    assert prefetcher.take('/a') == [{'post': '/a'}, {'comments': []}]
+    # Only given out once
+    assert prefetcher.take('/a') is None
+    assert prefetcher.take('/c') is None
+
+
+def test_take_while_loading():
+    env = FakeEnvironment()
+    prefetcher = env.make_prefetcher()
+    prefetcher.want(posts('/a'))
+    env.run_idle()
+    _, ticket, _ = env.requests['/a']
+
+    assert prefetcher.take('/a') is None
+    # The comments view gets to share the request before we cancel ours
+    assert not env.api.cancel.called
+    env.run_idle()
+    env.api.cancel.assert_called_once_with(ticket)
+
+
+def test_bounded_by_bytes_and_age():
+    env = FakeEnvironment()
+    prefetcher = env.make_prefetcher(max_threads=3, max_bytes=250,
+                                     max_age=60)
+    prefetcher.want(posts('/a', '/b', '/c'))
+    env.run_idle()
+    env.respond('/a')
+    env.respond('/b')
+    # Too many bytes, so the oldest is forgotten
+    env.respond('/c')
+    assert prefetcher.take('/a') is None
+    assert prefetcher.take('/b') is not None
+
+    env.now += 61
+    assert prefetcher.take('/c') is None
+
+
+def test_unwanted_make_room():
+    env = FakeEnvironment()
+    prefetcher = env.make_prefetcher(max_threads=2)
+    prefetcher.want(posts('/a', '/b'))
+    env.run_idle()
+    env.respond('/a')
+    _, loading, _ = env.requests['/b']
+
+    prefetcher.want(posts('/c', '/a'))
+    env.run_idle()
+    # /b was still loading, but isn't wanted any more
+    env.api.cancel.assert_called_once_with(loading)
+    assert '/c' in env.requests
+    assert prefetcher.take('/a') is not None
+
+    prefetcher.clear()
+    assert env.api.cancel.call_count == 2
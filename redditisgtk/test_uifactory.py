@@ -0,0 +1,94 @@
+import pytest
+from unittest.mock import MagicMock
+
+from gi.repository import Gtk
+from gi.repository import Pango
+
+from redditisgtk.uifactory import UIFactory, get_factory
+from redditisgtk.gtktestutil import with_test_mainloop, snapshot_widget
+
+
+UI = '''
+<interface>
+  <requires lib="gtk+" version="3.0"/>
+  <object class="GtkBox" id="box">
+    <property name="orientation">vertical</property>
+    <child>
+      <object class="GtkLabel" id="label">
+        <property name="label" translatable="yes">Hello</property>
+        <property name="wrap_mode">word-char</property>
+        <property name="xalign">0</property>
+        <attributes>
+          <attribute name="style" value="italic"/>
+        </attributes>
+        <style>
+          <class name="flat"/>
+        </style>
+      </object>
+      <packing>
+        <property name="expand">True</property>
+        <property name="pack_type">end</property>
+      </packing>
+    </child>
+    <child>
+      <object class="GtkButton" id="button">
+        <property name="relief">none</property>
+        <signal name="clicked" handler="clicked_cb" swapped="no"/>
+      </object>
+    </child>
+  </object>
+</interface>
+'''
+
+
+def test_build():
+    ui = UIFactory(UI).build()
+    box = ui.get_object('box')
+    label = ui.get_object('label')
+    assert box.props.orientation == Gtk.Orientation.VERTICAL
+    assert box.get_children() == [label, ui.get_object('button')]
+
+    assert label.props.label == 'Hello'
+    assert label.props.wrap_mode == Pango.WrapMode.WORD_CHAR
+    assert label.props.xalign == 0
+    assert label.get_style_context().has_class('flat')
+    assert label.props.attributes is not None
+    assert box.child_get_property(label, 'expand')
+    assert box.child_get_property(label, 'pack_type') == Gtk.PackType.END
+
+    assert ui.get_object('button').props.relief == Gtk.ReliefStyle.NONE
+    assert ui.get_object('nope') is None
+
+
+def test_builds_new_objects():
+    factory = UIFactory(UI)
+    assert factory.build().get_object('box') is not \
+        factory.build().get_object('box')
+
+
+def test_connect_signals():
+    ui = UIFactory(UI).build()
+    handlers = MagicMock()
+    ui.connect_signals(handlers)
+    ui.get_object('button').clicked()
+    handlers.clicked_cb.assert_called_once_with(ui.get_object('button'))
+
+
+def test_unsupported():
+    with pytest.raises(ValueError):
+        UIFactory('<interface><menu/></interface>')
+    with pytest.raises(ValueError):
+        UIFactory('''
+            <interface><object class="GtkLabel">
+              <property name="not_a_property">1</property>
+            </object></interface>''')
+
+
+@with_test_mainloop
+@pytest.mark.parametrize('name', ['row-link', 'row-comment', 'post-top-bar'])
+def test_matches_builder(name):
+    path = '/today/sam/reddit-is-gtk/{}.ui'.format(name)
+    builder = Gtk.Builder.new_from_resource(path)
+    ui = get_factory(path).build()
+    assert snapshot_widget(ui.get_object('box')) == \
+        snapshot_widget(builder.get_object('box'))
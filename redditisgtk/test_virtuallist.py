@@ -0,0 +1,174 @@
+from unittest.mock import MagicMock
+
+from gi.repository import Gtk
+from gi.repository import Gio
+
+from redditisgtk.virtuallist import VirtualList, ListItem, ListOrder
+from redditisgtk.gtktestutil import with_test_mainloop, wait_for
+
+
+class FixtureRow(Gtk.ListBoxRow):
+    created = 0
+
+    def __init__(self, item):
+        Gtk.ListBoxRow.__init__(self)
+        FixtureRow.created += 1
+        self.label = Gtk.Label()
+        self.label.set_size_request(-1, 50)
+        self.add(self.label)
+        self.label.show()
+        self.bind(item)
+
+    def bind(self, item):
+        self.item = item
+        self.label.props.label = str(item.data['i'])
+
+
+class EvenOrder(ListOrder):
+    '''
+    Hides the odd items
+    '''
+
+    def get_next(self, index):
+        return super().get_next(index + 1 - index % 2)
+
+    def get_prev(self, index):
+        return index - 2 if index >= 2 else None
+
+    def get_shown(self, index):
+        return index - index % 2
+
+
+def build_list(n_items, order=None, **kwargs):
+    FixtureRow.created = 0
+    model = Gio.ListStore.new(ListItem)
+    model.splice(0, 0, [ListItem({'kind': 't3', 'i': i})
+                        for i in range(n_items)])
+    virtual = VirtualList(model, FixtureRow, lambda row, item: row.bind(item),
+                          order=order and order(model), **kwargs)
+
+    window = Gtk.OffscreenWindow()
+    window.set_size_request(300, 500)
+    window.add(virtual)
+    window.show_all()
+    wait_for(lambda: len(virtual.get_rows()) > 1)
+    return virtual, model
+
+
+def shown(virtual):
+    return [row.item.data['i'] for row in virtual.get_rows()]
+
+
+@with_test_mainloop
+def test_only_makes_visible_rows():
+    virtual, model = build_list(1000)
+    # About 500px / 50px rows, plus one that is partly on the screen
+    assert 5 < len(shown(virtual)) <= 11
+    assert shown(virtual) == list(range(len(shown(virtual))))
+    assert FixtureRow.created == len(shown(virtual))
+
+
+@with_test_mainloop
+def test_recycles_rows():
+    virtual, model = build_list(1000)
+    for i in range(1, 500):
+        virtual.scroll_to(i)
+        wait_for(lambda: shown(virtual)[0] == i)
+
+    n_shown = len(shown(virtual))
+    assert shown(virtual) == list(range(499, 499 + n_shown))
+    # The first scroll makes a new row before the old one goes in the pool
+    assert FixtureRow.created == n_shown + 1
+
+
+@with_test_mainloop
+def test_move_scrolls():
+    virtual, model = build_list(100)
+    assert virtual.move(+1)
+    assert virtual.get_selected_index() == 0
+    for i in range(20):
+        virtual.move(+1)
+    assert virtual.get_selected_index() == 20
+    assert 20 in shown(virtual)
+    assert shown(virtual)[-1] != 20
+
+    assert virtual.select_index(0)
+    assert shown(virtual)[0] == 0
+    assert not virtual.select_index(100)
+
+
+@with_test_mainloop
+def test_end_reached():
+    virtual, model = build_list(100)
+    end_reached = MagicMock()
+    virtual.connect('end-reached', end_reached)
+    virtual.scroll_to(95)
+    wait_for(lambda: end_reached.called)
+
+    model.splice(100, 0, [ListItem({'kind': 't3', 'i': 100})])
+    virtual.scroll_to(100)
+    wait_for(lambda: 100 in shown(virtual))
+    assert end_reached.call_count == 2
+
+
+@with_test_mainloop
+def test_rows_changed():
+    virtual, model = build_list(100)
+    rows_changed = MagicMock()
+    virtual.connect('rows-changed', rows_changed)
+    virtual.scroll_to(50)
+    wait_for(lambda: rows_changed.called)
+    assert shown(virtual)[0] == 50
+
+
+@with_test_mainloop
+def test_near_end():
+    virtual, model = build_list(100, near_end=20)
+    near_end = MagicMock()
+    end_reached = MagicMock()
+    virtual.connect('near-end', near_end)
+    virtual.connect('end-reached', end_reached)
+    assert not near_end.called
+
+    virtual.scroll_to(75)
+    wait_for(lambda: near_end.called)
+    assert not end_reached.called
+    virtual.scroll_to(76)
+    wait_for(lambda: 76 in shown(virtual))
+    assert near_end.call_count == 1
+
+
+@with_test_mainloop
+def test_scroll_by_pixels():
+    virtual, model = build_list(100)
+    height = virtual.get_rows()[0].get_allocated_height()
+    virtual.scroll_by(height * 2.5)
+    wait_for(lambda: shown(virtual)[0] == 2)
+    virtual.scroll_by(-height)
+    wait_for(lambda: shown(virtual)[0] == 1)
+    virtual.scroll_by(-height * 10)
+    wait_for(lambda: shown(virtual)[0] == 0)
+
+
+@with_test_mainloop
+def test_order_hides_items():
+    virtual, model = build_list(100, order=EvenOrder)
+    assert all(i % 2 == 0 for i in shown(virtual))
+    assert virtual.move(+1)
+    assert virtual.move(+1)
+    assert virtual.get_selected_index() == 2
+    assert virtual.move(-1)
+    assert virtual.get_selected_index() == 0
+
+    virtual.scroll_to(11)
+    wait_for(lambda: shown(virtual)[0] == 10)
+
+
+@with_test_mainloop
+def test_rows_move_with_items():
+    virtual, model = build_list(100)
+    row = virtual.get_row_at_index(3)
+    model.splice(1, 1, [ListItem({'kind': 't3', 'i': 'a'}),
+                        ListItem({'kind': 't3', 'i': 'b'})])
+    assert virtual.get_row_at_index(4) is row
+    wait_for(lambda: shown(virtual)[:4] == [0, 'a', 'b', 2])
@@ -0,0 +1,111 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from redditisgtk import workers
+from redditisgtk.gtktestutil import with_test_mainloop, wait_for
+
+
+def test_decode_json_matches_stdlib(datadir):
+    with open(datadir / 'comments--thread.json', 'rb') as f:
+        data = f.read()
+
+    assert workers.decode_json(data) == json.loads(str(data, 'utf8'))
+
+
+@patch('redditisgtk.workers.DECODE_CHUNK_CHARS', 100)
+def test_decode_json_in_chunks(datadir):
+    with open(datadir / 'comments--thread.json', 'rb') as f:
+        data = f.read()
+    assert workers.decode_json(data) == json.loads(str(data, 'utf8'))
+
+    for bad in [b'{"a": [1, 2', b'[' * 200, b'{"a": ' + b'1' * 200 + b'x}']:
+        with pytest.raises(ValueError):
+            workers.decode_json(bad)
+
+
+def test_decode_small_inline():
+    callback = MagicMock()
+    workers.decode_json_async(b'{"a": 1}', callback, 'user')
+    callback.assert_called_once_with({'a': 1}, 'user')
+
+
+@with_test_mainloop
+def test_decode_big_in_thread():
+    data = bytes(json.dumps({'body': 'x' * workers.DECODE_IN_THREAD_BYTES}),
+                 'utf8')
+    callback = MagicMock()
+    workers.decode_json_async(data, callback, 'user')
+    # It must not be called until we get back to the main loop
+    assert not callback.called
+
+    wait_for(lambda: callback.called)
+    (j, user), _ = callback.call_args
+    assert user == 'user'
+    assert len(j['body']) == workers.DECODE_IN_THREAD_BYTES
+
+
+@with_test_mainloop
+def test_decode_prepares_in_thread():
+    small = b'{"a": 1}'
+    big = bytes(json.dumps({'a': 'x' * workers.DECODE_IN_THREAD_BYTES}),
+                'utf8')
+    for data in [small, big]:
+        prepare = MagicMock()
+        callback = MagicMock()
+        workers.decode_json_async(data, callback, prepare=prepare)
+        wait_for(lambda: callback.called and prepare.called)
+        (prepared,), _ = prepare.call_args
+        (j,), _ = callback.call_args
+        assert prepared is j
+
+
+@with_test_mainloop
+def test_run_in_thread_error():
+    def fail():
+        raise ValueError()
+    callback = MagicMock()
+    error_callback = MagicMock()
+    workers.run_in_thread(fail, (), callback, error_callback=error_callback)
+    wait_for(lambda: error_callback.called)
+    assert not callback.called
+
+
+def test_sliced_job_keeps_to_budget():
+    now = 0
+    ran = []
+
+    def steps():
+        nonlocal now
+        for i in range(10):
+            now += 0.001
+            ran.append(i)
+            yield (i + 1) / 10
+
+    idle = []
+    progress = MagicMock()
+    job = workers.SlicedJob(steps(), progress, budget=0.004,
+                            time_func=lambda: now, idle_add=idle.append)
+    # Nothing runs until the main loop is idle
+    assert ran == []
+    idle_cb, = idle
+
+    assert idle_cb()
+    assert ran == [0, 1, 2, 3]
+    progress.assert_called_once_with(0.4)
+
+    assert idle_cb()
+    assert len(ran) == 8
+    assert not idle_cb()
+    assert job.done
+    progress.assert_called_with(1)
+
+
+def test_sliced_job_cancel():
+    idle = []
+    steps = MagicMock()
+    job = workers.SlicedJob(steps, idle_add=idle.append)
+    job.cancel()
+    assert not idle[0]()
+    assert not steps.__next__.called
@@ -0,0 +1,174 @@
+# Copyright 2018 Sam Parkinson <sam@sam.today>
+#
+# This file is part of Something for Reddit.
+#
+# Something for Reddit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Something for Reddit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Loads the comments of posts before they are opened
+'''
+
+import time
+import typing
+from collections import OrderedDict
+
+from gi.repository import GLib
+from gi.repository import Soup
+
+from redditisgtk.api import RedditAPI
+from redditisgtk.comments import prepare_thread
+
+
+class _Entry():
+    def __init__(self):
+        # While it is loading
+        self.ticket = None
+        # Once it has loaded
+        self.json = None
+        self.size = 0
+        self.loaded_at = None
+
+
+class ThreadPrefetcher():
+    '''
+    Loads the comments pages of the posts that the user is likely to open
+    next (eg. the unread ones on the screen), so opening one doesn't have
+    to wait for the network.  Give what `take` returns to the
+    `CommentsView` as its comments.
+
+    The requests are sent when the main loop is idle, at the lowest
+    priority, so they wait behind everything else in the scheduler.
+
+    Args:
+        api (RedditAPI):  dependency
+        max_threads (int):  number of threads to keep (or be loading)
+        max_bytes (int):  forget the oldest threads once the json of the
+            ones we keep adds up to more than this
+        max_age (float):  seconds that a thread is fresh enough to show
+        idle_add, time_func:  dependencies, for testing
+    '''
+
+    def __init__(self, api: RedditAPI, max_threads: int = 4,
+                 max_bytes: int = 2 * 1024 * 1024, max_age: float = 300,
+                 idle_add=GLib.idle_add,
+                 time_func: typing.Callable[[], float] = time.time):
+        self._api = api
+        self._max_threads = max_threads
+        self._max_bytes = max_bytes
+        self._max_age = max_age
+        self._idle_add = idle_add
+        self._time = time_func
+
+        # permalink -> _Entry, oldest first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Permalinks, most wanted first
+        self._wanted = []
+        self._idle_id = None
+
+    def want(self, posts: typing.List[dict]):
+        '''
+        Prefetch the comments of the posts (their data dicts), most
+        important first.  Replaces the posts from the last call.
+        '''
+        self._wanted = [post['permalink'] for post in posts
+                        if 'permalink' in post][:self._max_threads]
+        if self._idle_id is None:
+            self._idle_id = self._idle_add(
+                self.__idle_cb, priority=GLib.PRIORITY_LOW)
+
+    def __idle_cb(self):
+        self._idle_id = None
+        now = self._time()
+        for permalink in self._wanted:
+            entry = self._entries.get(permalink)
+            if entry is not None:
+                if entry.json is None or now - entry.loaded_at < self._max_age:
+                    continue
+                self._forget(permalink)
+            if len(self._entries) >= self._max_threads \
+                    and not self._evict_unwanted():
+                break
+
+            entry = self._entries[permalink] = _Entry()
+            entry.ticket = self._api.send_request(
+                'GET', permalink, self.__loaded_cb, user_data=permalink,
+                priority=Soup.MessagePriority.VERY_LOW,
+                prepare=prepare_thread, background=True)
+        return False
+
+    def __loaded_cb(self, j, permalink):
+        entry = self._entries.get(permalink)
+        if entry is None or entry.ticket is None:
+            return
+        if not isinstance(j, list):
+            # An error, not a thread
+            self._forget(permalink)
+            return
+
+        entry.size = entry.ticket.body_size or 0
+        entry.ticket = None
+        entry.json = j
+        entry.loaded_at = self._time()
+        self._bytes += entry.size
+        for permalink in list(self._entries):
+            if self._bytes <= self._max_bytes:
+                break
+            if self._entries[permalink].json is not None:
+                self._forget(permalink)
+
+    def take(self, permalink: str) -> typing.Optional[list]:
+        '''
+        Returns the comments page for the permalink, if it has been
+        prefetched (and is still fresh).  It is only given out once.
+        '''
+        entry = self._entries.pop(permalink, None)
+        if entry is None:
+            return None
+        if entry.json is None:
+            # Still loading.  The comments view will ask for the same
+            # permalink, and share our request.  So only stop waiting for
+            # it once the view has had the chance to ask
+            self._idle_add(self._api.cancel, entry.ticket)
+            return None
+
+        self._bytes -= entry.size
+        if self._time() - entry.loaded_at >= self._max_age:
+            return None
+        return entry.json
+
+    def clear(self):
+        '''
+        Forget everything, eg. when the listing changes
+        '''
+        self._wanted = []
+        for permalink in list(self._entries):
+            self._forget(permalink)
+
+    def _evict_unwanted(self) -> bool:
+        '''
+        Forget the oldest thread that isn't wanted any more.  Returns
+        False if they are all wanted
+        '''
+        for permalink in self._entries:
+            if permalink not in self._wanted:
+                self._forget(permalink)
+                return True
+        return False
+
+    def _forget(self, permalink: str):
+        entry = self._entries.pop(permalink)
+        if entry.ticket is not None:
+            self._api.cancel(entry.ticket)
+        self._bytes -= entry.size
@@ -0,0 +1,316 @@
+# Copyright 2018 Sam Parkinson <sam@sam.today>
+#
+# This file is part of Something for Reddit.
+#
+# Something for Reddit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Something for Reddit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Build the widgets from a .ui file without parsing it every time.
+
+Gtk.Builder (and composite templates, which use it) parse the XML for every
+instance.  That is fine for windows, but the rows are made hundreds of
+times.  So we parse each file once, into a list of objects to make and
+properties to set, and then build the widgets straight from that.
+
+Only the parts of the Gtk.Builder format that our row .ui files use are
+supported; anything else raises a ValueError when the file is compiled.
+'''
+
+import typing
+import xml.etree.ElementTree as ET
+
+from gi.repository import Gtk
+from gi.repository import Gio
+from gi.repository import GObject
+from gi.repository import Pango
+
+
+_INT_TYPES = [
+    GObject.TYPE_INT, GObject.TYPE_UINT, GObject.TYPE_LONG,
+    GObject.TYPE_ULONG, GObject.TYPE_INT64, GObject.TYPE_UINT64,
+    GObject.TYPE_CHAR, GObject.TYPE_UCHAR,
+]
+
+# GtkContainer doesn't let us look up the type of child properties from
+# python, so these are all the ones we support
+_PACKING_TYPES = {
+    'expand': bool,
+    'fill': bool,
+    'padding': int,
+    'position': int,
+    'pack_type': Gtk.PackType,
+    'left_attach': int,
+    'top_attach': int,
+    'width': int,
+    'height': int,
+}
+
+_PANGO_ATTRIBUTES = {
+    'style': (Pango.attr_style_new, Pango.Style),
+    'weight': (Pango.attr_weight_new, Pango.Weight),
+}
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() in ('true', 'yes', 't', 'y', '1')
+
+
+def _parse_enum(enum_type, value: str):
+    '''
+    Parse an enum like Gtk.Builder does; by nick, name or number
+    '''
+    try:
+        return enum_type(int(value))
+    except ValueError:
+        pass
+
+    wanted = value.replace('_', '-').lower()
+    for member in enum_type.__enum_values__.values():
+        if wanted in (member.value_nick, member.value_name.lower()):
+            return member
+    raise ValueError('{} is not a {}'.format(value, enum_type))
+
+
+def _parse_flags(flags_type, value: str):
+    result = flags_type(0)
+    for part in value.split('|'):
+        wanted = part.strip().replace('_', '-').lower()
+        for member in flags_type.__flags_values__.values():
+            if wanted in (member.value_nicks[0],
+                          member.value_names[0].lower()):
+                result |= member
+                break
+        else:
+            raise ValueError('{} is not a {}'.format(part, flags_type))
+    return result
+
+
+class _Reference():
+    '''
+    A property value that is another object in the file
+    '''
+
+    def __init__(self, id: str):
+        self.id = id
+
+
+def _parse_property(cls, name: str, value: str):
+    pspec = getattr(cls.props, name.replace('-', '_'), None)
+    if pspec is None:
+        raise ValueError('{} has no property {}'.format(cls, name))
+
+    value_type = pspec.value_type
+    fundamental = value_type.fundamental
+    if fundamental == GObject.TYPE_BOOLEAN:
+        return _parse_bool(value)
+    if fundamental in _INT_TYPES:
+        return int(value)
+    if fundamental in (GObject.TYPE_FLOAT, GObject.TYPE_DOUBLE):
+        return float(value)
+    if fundamental == GObject.TYPE_STRING:
+        return value
+    if fundamental == GObject.TYPE_ENUM:
+        return _parse_enum(value_type.pytype, value)
+    if fundamental == GObject.TYPE_FLAGS:
+        return _parse_flags(value_type.pytype, value)
+    if fundamental == GObject.TYPE_OBJECT:
+        return _Reference(value)
+    raise ValueError('Can not parse {}.{} of type {}'.format(
+        cls, name, value_type))
+
+
+def _get_class(class_name: str):
+    if not class_name.startswith('Gtk'):
+        raise ValueError('Only Gtk classes are supported, not {}'.format(
+            class_name))
+    return getattr(Gtk, class_name[len('Gtk'):])
+
+
+class _ObjectSpec():
+    '''
+    Everything needed to make one object from the file
+    '''
+
+    def __init__(self, element: ET.Element):
+        self.cls = _get_class(element.get('class'))
+        self.id = element.get('id')
+        self.props = []
+        self.references = []
+        self.style_classes = []
+        self.attributes = []
+        self.signals = []
+        # list of (_ObjectSpec, [(name, value)])
+        self.children = []
+
+        for child in element:
+            if child.tag == 'property':
+                value = _parse_property(
+                    self.cls, child.get('name'), child.text or '')
+                if isinstance(value, _Reference):
+                    self.references.append((child.get('name'), value.id))
+                else:
+                    self.props.append((child.get('name'), value))
+            elif child.tag == 'style':
+                self.style_classes.extend(
+                    c.get('name') for c in child if c.tag == 'class')
+            elif child.tag == 'attributes':
+                for attribute in child:
+                    self._add_attribute(
+                        attribute.get('name'), attribute.get('value'))
+            elif child.tag == 'signal':
+                if _parse_bool(child.get('swapped', 'no')):
+                    raise ValueError('Swapped signals are not supported')
+                self.signals.append((
+                    child.get('name'), child.get('handler'),
+                    _parse_bool(child.get('after', 'no'))))
+            elif child.tag == 'child':
+                self._add_child(child)
+            else:
+                raise ValueError('Unsupported tag <{}> in {}'.format(
+                    child.tag, self.cls))
+
+        # Faster to let GObject set them all as it constructs the object
+        self.props = dict(
+            (name.replace('-', '_'), value) for name, value in self.props)
+
+    def _add_attribute(self, name: str, value: str):
+        if name not in _PANGO_ATTRIBUTES:
+            raise ValueError('Unsupported pango attribute {}'.format(name))
+        func, enum_type = _PANGO_ATTRIBUTES[name]
+        self.attributes.append((func, _parse_enum(enum_type, value)))
+
+    def _add_child(self, element: ET.Element):
+        if element.get('type') is not None:
+            raise ValueError('Typed children are not supported')
+
+        spec = None
+        packing = []
+        for child in element:
+            if child.tag == 'object':
+                spec = _ObjectSpec(child)
+            elif child.tag == 'packing':
+                for prop in child:
+                    name = prop.get('name').replace('-', '_')
+                    if name not in _PACKING_TYPES:
+                        raise ValueError(
+                            'Unsupported packing property {}'.format(name))
+                    value_type = _PACKING_TYPES[name]
+                    if value_type is bool:
+                        value = _parse_bool(prop.text)
+                    elif value_type is int:
+                        value = int(prop.text)
+                    else:
+                        value = _parse_enum(value_type, prop.text)
+                    packing.append((name, value))
+            elif child.tag == 'placeholder':
+                pass
+            else:
+                raise ValueError('Unsupported tag <{}> in <child>'.format(
+                    child.tag))
+        if spec is not None:
+            self.children.append((spec, packing))
+
+    def build(self, objects: dict, signals: list,
+              references: list) -> GObject.Object:
+        obj = self.cls(**self.props)
+        if self.id is not None:
+            objects[self.id] = obj
+        for name, id in self.references:
+            references.append((obj, name, id))
+        for name, handler_name, after in self.signals:
+            signals.append((obj, name, handler_name, after))
+
+        if self.style_classes:
+            ctx = obj.get_style_context()
+            for name in self.style_classes:
+                ctx.add_class(name)
+        if self.attributes:
+            attributes = Pango.AttrList()
+            for func, value in self.attributes:
+                attributes.insert(func(value))
+            obj.props.attributes = attributes
+
+        for spec, packing in self.children:
+            child = spec.build(objects, signals, references)
+            obj.add(child)
+            for name, value in packing:
+                obj.child_set_property(child, name, value)
+        return obj
+
+
+class BuiltUI():
+    '''
+    The objects made by `UIFactory.build`; works like a Gtk.Builder
+    '''
+
+    def __init__(self, objects: dict, signals: list):
+        self._objects = objects
+        self._signals = signals
+
+    def get_object(self, id: str) -> typing.Optional[GObject.Object]:
+        return self._objects.get(id)
+
+    def connect_signals(self, handlers: object):
+        '''
+        Connect the signals to the methods of the same name on the object
+        '''
+        for obj, name, handler_name, after in self._signals:
+            handler = getattr(handlers, handler_name)
+            if after:
+                obj.connect_after(name, handler)
+            else:
+                obj.connect(name, handler)
+
+
+class UIFactory():
+    '''
+    Compiles a .ui file once, then builds new copies of its objects
+
+    Args:
+        xml (str):  contents of the .ui file
+    '''
+
+    def __init__(self, xml: str):
+        root = ET.fromstring(xml)
+        self._specs = []
+        for element in root:
+            if element.tag == 'object':
+                self._specs.append(_ObjectSpec(element))
+            elif element.tag != 'requires':
+                raise ValueError('Unsupported tag <{}>'.format(element.tag))
+
+    def build(self) -> BuiltUI:
+        objects = {}
+        signals = []
+        references = []
+        for spec in self._specs:
+            spec.build(objects, signals, references)
+        for obj, name, id in references:
+            obj.set_property(name, objects[id])
+        return BuiltUI(objects, signals)
+
+
+_factories = {}
+
+
+def get_factory(resource_path: str) -> UIFactory:
+    '''
+    Get the factory for a .ui file in our resources, compiling it the 1st
+    time it is used
+    '''
+    if resource_path not in _factories:
+        data = Gio.resources_lookup_data(
+            resource_path, Gio.ResourceLookupFlags.NONE)
+        _factories[resource_path] = UIFactory(str(data.get_data(), 'utf8'))
+    return _factories[resource_path]
@@ -0,0 +1,585 @@
+# Copyright 2018 Sam Parkinson <sam@sam.today>
+#
+# This file is part of Something for Reddit.
+#
+# Something for Reddit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Something for Reddit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+A list that only has row widgets for the items that are on screen
+'''
+
+import typing
+
+from gi.repository import Gtk
+from gi.repository import Gdk
+from gi.repository import Gio
+from gi.repository import GLib
+from gi.repository import GObject
+
+from redditisgtk.workers import SlicedJob
+
+
+class ListItem(GObject.Object):
+    '''
+    Wraps a reddit thing (eg. a post dict) so it can go in a Gio.ListStore
+
+    Args:
+        data:  the thing
+        kind (str):  which kind of row shows it, defaults to `data['kind']`
+    '''
+
+    def __init__(self, data, kind: str = None):
+        super().__init__()
+        self.data = data
+        self._kind = kind
+
+    @property
+    def kind(self) -> str:
+        return self._kind or self.data['kind']
+
+
+class ListOrder():
+    '''
+    Which of the model's items a `VirtualList` shows.  This one shows all
+    of them.  Pass something with the same methods to hide runs of items
+    without changing the model (eg. the replies to a collapsed comment).
+    '''
+
+    def __init__(self, model: Gio.ListStore):
+        self._model = model
+
+    def get_next(self, index: int) -> typing.Optional[int]:
+        '''
+        Returns the item shown after the (shown) item at the index
+        '''
+        index += 1
+        return index if index < self._model.get_n_items() else None
+
+    def get_prev(self, index: int) -> typing.Optional[int]:
+        '''
+        Returns the item shown before the (shown) item at the index
+        '''
+        return index - 1 if index > 0 else None
+
+    def get_shown(self, index: int) -> int:
+        '''
+        Returns the item that is shown in place of the item at the index;
+        itself unless it is hidden
+        '''
+        return index
+
+
+class VirtualList(Gtk.Box):
+    '''
+    Shows the items in the model, but only makes row widgets for the items
+    that fit on the screen.  When the user scrolls, rows that go off the
+    screen are put in a pool, then bound to the items that come on to it.
+    So the number of widgets stays the same however long the list gets.
+
+    The scrollbar is in items (so we never need to know the height of the
+    whole list), but scrolling is by pixels.
+
+    Args:
+        model (Gio.ListStore):  of `ListItem`
+        create_row (function):  takes an item, returns a new Gtk.ListBoxRow
+        bind_row (function):  takes a row and an item, and makes the row
+            show that item.  Only called for rows made for the same kind of
+            item.
+        order (ListOrder):  which items to show, defaults to all of them
+        build_ahead (bool):  when the main loop is idle, make the rows for
+            the screenful of items below the screen, so scrolling down
+            doesn't have to wait for them to be made
+        near_end (int):  emit near-end when an item this close to the end
+            comes on to the screen, 0 to never emit it
+    '''
+
+    row_selected = GObject.Signal('row-selected', arg_types=[object])
+    '''
+    Emitted when the user selects a row (with the mouse or keyboard)
+
+    Args:
+        row (Gtk.ListBoxRow):  the row, which is showing the selected item
+    '''
+
+    end_reached = GObject.Signal('end-reached')
+    '''
+    Emitted when the last item in the model comes on to the screen
+    '''
+
+    rows_changed = GObject.Signal('rows-changed')
+    '''
+    Emitted when different items come on to (or go off) the screen, see
+    `get_rows`
+    '''
+
+    near_end = GObject.Signal('near-end')
+    '''
+    Emitted when one of the last few items comes on to the screen (see
+    the near_end arg), so more items can be fetched before they are needed
+    '''
+
+    # Number of spare rows to keep around for each kind of item
+    POOL_SIZE = 4
+
+    def __init__(self, model: Gio.ListStore,
+                 create_row: typing.Callable[[ListItem], Gtk.ListBoxRow],
+                 bind_row: typing.Callable[[Gtk.ListBoxRow, ListItem], None],
+                 order: ListOrder = None, build_ahead: bool = False,
+                 near_end: int = 0):
+        Gtk.Box.__init__(self, orientation=Gtk.Orientation.HORIZONTAL)
+        self._model = model
+        self._create_row = create_row
+        self._bind_row = bind_row
+        self._order = order or ListOrder(model)
+
+        self._first = 0
+        # Pixels of the first row that are scrolled off the top
+        self._offset = 0
+        self._selected = None
+        # index -> row, for the rows on the screen
+        self._rows = {}
+        # index -> natural height, for the rows on the screen
+        self._heights = {}
+        # kind -> [row], rows that are not on the screen
+        self._pool = {}
+        # index -> row, rows made for items just below the screen
+        self._ahead = {}
+        self._build_ahead = build_ahead
+        self._ahead_job = None
+        self._refill_id = None
+        self._end_reached_at = None
+        self._near_end = near_end
+        self._near_end_at = None
+        self._focus_after_refill = False
+
+        # The listbox is in an EXTERNAL scrolled window, so that it can be
+        # taller than us without making us taller
+        self._window = Gtk.ScrolledWindow(
+            hscrollbar_policy=Gtk.PolicyType.NEVER,
+            vscrollbar_policy=Gtk.PolicyType.EXTERNAL,
+            hexpand=True, vexpand=True)
+        self._window.connect('scroll-event', self.__scroll_event_cb)
+        self._window.connect('size-allocate', self.__size_allocate_cb)
+        self.add(self._window)
+
+        self.listbox = Gtk.ListBox()
+        self.listbox.props.selection_mode = Gtk.SelectionMode.BROWSE
+        self.listbox.set_sort_func(self.__sort_func)
+        self._selected_handler = self.listbox.connect(
+            'row-selected', self.__row_selected_cb)
+        self.listbox.connect('row-activated', self.__row_selected_cb)
+        self.listbox.connect('size-allocate', self.__listbox_allocate_cb)
+        self._window.add(self.listbox)
+
+        self._adjustment = Gtk.Adjustment(
+            value=0, lower=0, upper=0, step_increment=1, page_increment=1,
+            page_size=1)
+        self._value_changed_handler = self._adjustment.connect(
+            'value-changed', self.__value_changed_cb)
+        self._scrollbar = Gtk.Scrollbar(
+            orientation=Gtk.Orientation.VERTICAL,
+            adjustment=self._adjustment)
+        self.add(self._scrollbar)
+        self.show_all()
+
+        self._model.connect('items-changed', self.__items_changed_cb)
+        self._queue_refill()
+
+    def get_rows(self) -> typing.List[Gtk.ListBoxRow]:
+        '''
+        The rows that are currently on screen, in order
+        '''
+        return [self._rows[i] for i in sorted(self._rows)]
+
+    def get_selected_index(self) -> typing.Optional[int]:
+        return self._selected
+
+    def get_first_index(self) -> int:
+        '''
+        The index of the item at the top of the screen, see `scroll_to`
+        '''
+        return self._first
+
+    def get_row_at_index(self, index: int) -> typing.Optional[Gtk.ListBoxRow]:
+        return self._rows.get(index)
+
+    def scroll_to(self, index: int):
+        '''
+        Make the item at the index the first one on the screen
+        '''
+        n_items = self._model.get_n_items()
+        if n_items == 0:
+            return
+        self._first = self._order.get_shown(max(0, min(index, n_items - 1)))
+        self._offset = 0
+        self._queue_refill()
+
+    def scroll_by(self, pixels: float):
+        '''
+        Scroll down by a number of pixels, or up if negative
+        '''
+        if self._model.get_n_items() == 0:
+            return
+        first = self._order.get_shown(self._first)
+        offset = self._offset + pixels
+
+        while offset < 0:
+            prev = self._order.get_prev(first)
+            if prev is None:
+                offset = 0
+                break
+            first = prev
+            offset += self._measure(first)
+
+        while True:
+            height = self._measure(first)
+            next = self._order.get_next(first)
+            if next is None:
+                # Let the last item scroll up until its end is on screen
+                window_height = self._window.get_allocated_height()
+                offset = min(offset, max(0, height - window_height))
+                break
+            if offset < height:
+                break
+            offset -= height
+            first = next
+
+        self._first = first
+        self._offset = int(offset)
+        self._queue_refill()
+
+    def order_changed(self):
+        '''
+        Call after the `ListOrder` starts showing or hiding items
+        '''
+        if self._selected is not None \
+                and self._order.get_shown(self._selected) != self._selected:
+            self._selected = None
+        self._queue_refill()
+
+    def move(self, direction: int) -> bool:
+        '''
+        Select the item after (or before, if negative) the selected item,
+        scrolling to it if needed.  Returns False if there is no such item.
+        '''
+        if self._selected is None:
+            return self.select_index(self._first)
+
+        index = self._selected
+        step = self._order.get_next if direction > 0 else self._order.get_prev
+        for _ in range(abs(direction)):
+            index = step(index)
+            if index is None:
+                return False
+        return self.select_index(index)
+
+    def select_index(self, index: int) -> bool:
+        '''
+        Select the item at the index, scrolling so all of it is on the
+        screen if needed.  Returns False if there is no such item.
+        '''
+        if not 0 <= index < self._model.get_n_items():
+            return False
+
+        window_height = self._window.get_allocated_height()
+        top = self._get_row_top(index)
+        if top is None:
+            below = index > self._first
+            self._first, self._offset = index, 0
+            if below:
+                # Coming from below, so put it at the bottom of the screen
+                self.scroll_by(-max(0, window_height - self._measure(index)))
+        else:
+            bottom = top + self._measure(index)
+            if top < 0:
+                self.scroll_by(top)
+            elif bottom > window_height:
+                self.scroll_by(min(top, bottom - window_height))
+        self._selected = index
+        self._refill()
+
+        row = self._rows.get(index)
+        if row is not None:
+            self.listbox.select_row(row)
+            row.grab_focus()
+        return True
+
+    def focus_row(self):
+        '''
+        Focus the selected row, or the first one on the screen
+        '''
+        row = self._rows.get(self._selected, self._rows.get(self._first))
+        if row is not None:
+            row.grab_focus()
+        else:
+            # Wait until we have some rows
+            self._focus_after_refill = True
+
+    def _get_row_top(self, index: int) -> typing.Optional[int]:
+        '''
+        Returns the y of the row relative to the top of the screen, or None
+        if it is not on the screen
+        '''
+        if index < self._first:
+            return None
+        height = self._window.get_allocated_height()
+        y = -self._offset
+        i = self._first
+        while i is not None and y < height:
+            if i == index:
+                return y
+            y += self._measure(i)
+            i = self._order.get_next(i)
+        return None
+
+    def _measure(self, index: int) -> int:
+        '''
+        Returns the height of the item's row, making the row if needed
+        '''
+        if index not in self._heights:
+            row = self._rows.get(index)
+            if row is None:
+                row = self._get_row(self._model.get_item(index), index)
+                self._rows[index] = row
+            width = self._window.get_allocated_width()
+            _, natural = row.get_preferred_height_for_width(max(width, 1))
+            self._heights[index] = natural
+        return self._heights[index]
+
+    def _queue_refill(self):
+        # We can't change the children during size allocation, so wait
+        if self._refill_id is None:
+            self._refill_id = GLib.idle_add(self.__refill_idle_cb)
+
+    def __refill_idle_cb(self):
+        self._refill_id = None
+        self._refill()
+        return False
+
+    def _refill(self):
+        n_items = self._model.get_n_items()
+        if n_items == 0:
+            for row in self._rows.values():
+                self._release_row(row)
+            self._rows = {}
+            self._heights = {}
+            self._first = self._offset = 0
+            self._configure_adjustment(0, 0)
+            return
+
+        first = self._order.get_shown(max(0, min(self._first, n_items - 1)))
+        if first != self._first:
+            self._first, self._offset = first, 0
+        height = self._window.get_allocated_height()
+        width = self._window.get_allocated_width()
+
+        shown_before = set(self._rows)
+        # Put the rows that we know we don't want in the pool first, so
+        # they can be used for the new items
+        for index in list(self._rows):
+            if index < self._first or self._order.get_shown(index) != index:
+                self._release_row(self._rows.pop(index))
+
+        # Work out which items fit, making or binding rows as we go
+        wanted = {}
+        heights = {}
+        used = -self._offset
+        index = self._first
+        while index is not None and (used <= height or not wanted):
+            row = self._rows.pop(index, None)
+            if row is None:
+                row = self._get_row(self._model.get_item(index), index)
+            wanted[index] = row
+            _, natural = row.get_preferred_height_for_width(max(width, 1))
+            heights[index] = natural
+            used += natural
+            index = self._order.get_next(index)
+
+        for row in self._rows.values():
+            self._release_row(row)
+        rows_changed = wanted.keys() != shown_before
+        self._rows = wanted
+        self._heights = heights
+
+        last = max(wanted)
+        for index in list(self._ahead):
+            if index <= last or index > last + 2 * len(wanted) \
+                    or self._order.get_shown(index) != index:
+                self._release_row(self._ahead.pop(index))
+        if self._build_ahead and (self._ahead_job is None
+                                  or self._ahead_job.done):
+            self._ahead_job = SlicedJob(self._build_ahead_steps())
+        self._offset = min(self._offset, max(0, heights[self._first] - 1))
+
+        self._configure_adjustment(n_items, len(wanted))
+        self.listbox.invalidate_sort()
+        self._window.props.vadjustment.props.value = self._offset
+
+        self._sync_selection()
+        if self._focus_after_refill and self._rows:
+            self._focus_after_refill = False
+            self.focus_row()
+        if rows_changed:
+            self.rows_changed.emit()
+        if self._near_end and last >= n_items - 1 - self._near_end \
+                and self._near_end_at != n_items:
+            self._near_end_at = n_items
+            self.near_end.emit()
+        if (n_items - 1) in self._rows and self._end_reached_at != n_items:
+            self._end_reached_at = n_items
+            self.end_reached.emit()
+
+    def _configure_adjustment(self, n_items: int, n_rows: int):
+        value = self._first
+        if self._heights.get(self._first):
+            value += self._offset / self._heights[self._first]
+        page = max(1, n_rows - 1)
+        with self._adjustment.handler_block(self._value_changed_handler):
+            self._adjustment.configure(value, 0, n_items, 1, page, page)
+
+    def _get_row(self, item: ListItem, index: int) -> Gtk.ListBoxRow:
+        row = self._ahead.pop(index, None)
+        if row is None:
+            row = self._make_row(item, index)
+        self.listbox.add(row)
+        row.show()
+        return row
+
+    def _make_row(self, item: ListItem, index: int) -> Gtk.ListBoxRow:
+        pool = self._pool.get(item.kind, [])
+        if pool:
+            row = pool.pop()
+            self._bind_row(row, item)
+        else:
+            row = self._create_row(item)
+            row.virtual_kind = item.kind
+        row.virtual_index = index
+        return row
+
+    def _build_ahead_steps(self) -> typing.Iterator[float]:
+        '''
+        Make the rows for the items below the screen, one per step
+        '''
+        while self._rows:
+            index = self._order.get_next(max(self._rows))
+            for _ in range(len(self._rows)):
+                if index is None or index not in self._ahead:
+                    break
+                index = self._order.get_next(index)
+            else:
+                return
+            if index is None:
+                return
+
+            self._ahead[index] = self._make_row(
+                self._model.get_item(index), index)
+            yield 0
+
+    def _release_row(self, row: Gtk.ListBoxRow):
+        if row.get_parent() is self.listbox:
+            self.listbox.remove(row)
+        pool = self._pool.setdefault(row.virtual_kind, [])
+        if len(pool) < self.POOL_SIZE:
+            pool.append(row)
+        else:
+            row.destroy()
+
+    def _move_rows(self, rows: dict, position: int, removed: int,
+                   added: int) -> dict:
+        '''
+        Returns the rows at their new indexes after the model changed,
+        putting the rows for removed items in the pool
+        '''
+        delta = added - removed
+        moved = {}
+        for index, row in rows.items():
+            if index < position:
+                moved[index] = row
+            elif index < position + removed:
+                self._release_row(row)
+            else:
+                row.virtual_index = index + delta
+                moved[index + delta] = row
+        return moved
+
+    def _sync_selection(self):
+        with self.listbox.handler_block(self._selected_handler):
+            row = self._rows.get(self._selected)
+            if row is None:
+                self.listbox.unselect_all()
+            else:
+                self.listbox.select_row(row)
+
+    def __sort_func(self, row1, row2):
+        return row1.virtual_index - row2.virtual_index
+
+    def __size_allocate_cb(self, window, allocation):
+        self._queue_refill()
+
+    def __listbox_allocate_cb(self, listbox, allocation):
+        # The scrolled window clamps the value to the old height of the
+        # listbox, so set it again now that the listbox has its new height
+        self._window.props.vadjustment.props.value = self._offset
+
+    def __value_changed_cb(self, adjustment):
+        value = adjustment.props.value
+        n_items = self._model.get_n_items()
+        if n_items == 0:
+            return
+        first = self._order.get_shown(min(int(value), n_items - 1))
+        offset = 0
+        if first == int(value):
+            offset = int((value - first) * self._measure(first))
+        if (first, offset) != (self._first, self._offset):
+            self._first, self._offset = first, offset
+            self._queue_refill()
+
+    def __scroll_event_cb(self, window, event):
+        # Same as the scrolled window, so it feels the same
+        step = self._window.get_allocated_height() ** (2 / 3)
+        if event.direction == Gdk.ScrollDirection.UP:
+            self.scroll_by(-step)
+        elif event.direction == Gdk.ScrollDirection.DOWN:
+            self.scroll_by(step)
+        elif event.direction == Gdk.ScrollDirection.SMOOTH:
+            self.scroll_by(event.delta_y * step)
+        else:
+            return False
+        # Don't let the scrolled window scroll by itself
+        return True
+
+    def __items_changed_cb(self, model, position, removed, added):
+        delta = added - removed
+        self._rows = self._move_rows(self._rows, position, removed, added)
+        self._ahead = self._move_rows(self._ahead, position, removed, added)
+        self._heights = {}
+
+        if self._selected is not None and self._selected >= position:
+            if self._selected < position + removed:
+                self._selected = None
+            else:
+                self._selected += delta
+        if self._first >= position + removed:
+            self._first += delta
+        elif self._first >= position:
+            self._first, self._offset = position, 0
+        if removed:
+            self._end_reached_at = self._near_end_at = None
+        self._queue_refill()
+
+    def __row_selected_cb(self, listbox, row):
+        if row is None:
+            return
+        self._selected = row.virtual_index
+        self.row_selected.emit(row)
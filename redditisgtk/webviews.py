@@ -16,16 +16,10 @@
 # along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import subprocess
 from gi.repository import Gtk
 from gi.repository import WebKit2
 
-
-def open_uri_external(uri: str):
-    '''
-    Open the given uri in an external browser
-    '''
-    subprocess.call(['xdg-open', uri])
+from redditisgtk.gtkutil import open_uri_external
 
 
 class FullscreenableWebview(WebKit2.WebView):
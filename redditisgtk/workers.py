@@ -0,0 +1,227 @@
+# Copyright 2018 Sam Parkinson <sam@sam.today>
+#
+# This file is part of Something for Reddit.
+#
+# Something for Reddit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Something for Reddit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Something for Reddit.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Run work on a background thread, and get the result back on the GTK
+main loop.  Or run it on the main loop in small slices, for work that
+does touch GTK.
+
+Only give the threads work that does not touch GTK.
+'''
+
+import json
+import json.decoder
+import json.scanner
+import time
+import traceback
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from gi.repository import GLib
+
+
+# Bodies bigger than this are decoded on a worker thread, in bytes
+DECODE_IN_THREAD_BYTES = 128 * 1024
+# Objects and lists up to this long (in characters) are decoded in one go
+# by the C scanner on the worker thread; see `decode_json`
+DECODE_CHUNK_CHARS = 64 * 1024
+# How long a SlicedJob can block the main loop for, in seconds.  Leaves
+# plenty of a 16ms frame for GTK to draw in
+SLICE_BUDGET = 0.004
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix='reddit-is-gtk-worker')
+    return _executor
+
+
+def run_in_thread(func: typing.Callable, args: tuple,
+                  callback: typing.Callable, *callback_args,
+                  error_callback: typing.Callable[[], typing.Any] = None):
+    '''
+    Call `func(*args)` on a worker thread, then call
+    `callback(result, *callback_args)` on the main loop.
+
+    If func raises, the traceback is printed and the callback is not called;
+    `error_callback()` is called on the main loop instead, if given.
+    '''
+    future = get_executor().submit(func, *args)
+
+    def done_cb(future):
+        # GLib.idle_add is safe to call from any thread
+        GLib.idle_add(_finish, future, callback, callback_args,
+                      error_callback)
+    future.add_done_callback(done_cb)
+
+
+def run_in_background(func: typing.Callable, *args):
+    '''
+    Call `func(*args)` on a worker thread, for work that nobody waits on
+    (eg. warming a cache).  If func raises, the traceback is printed.
+    '''
+    get_executor().submit(func, *args).add_done_callback(_print_exception)
+
+
+def _print_exception(future):
+    error = future.exception()
+    if error is not None:
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+
+def _finish(future, callback, callback_args, error_callback=None):
+    try:
+        result = future.result()
+    except Exception:
+        traceback.print_exc()
+        if error_callback is not None:
+            error_callback()
+    else:
+        callback(result, *callback_args)
+    return False
+
+
+def decode_json(data: bytes):
+    '''
+    Decode a json response body; safe to call from a worker thread.
+
+    The C json scanner holds the GIL until it has parsed the whole document,
+    which would block the main loop for just as long as decoding it there.
+    The python scanner lets the main loop run, but is about 8 times slower.
+    So we use python for the big objects and lists, and give the C scanner
+    anything that fits in `DECODE_CHUNK_CHARS`.  The main loop can then run
+    between the chunks.
+    '''
+    decoder = json.JSONDecoder()
+    c_scan_once = json.scanner.c_make_scanner(decoder)
+    memo = {}
+
+    def scan_once(string, idx):
+        try:
+            nextchar = string[idx]
+        except IndexError:
+            raise StopIteration(idx) from None
+
+        if nextchar != '{' and nextchar != '[':
+            return c_scan_once(string, idx)
+
+        # An object or list only decodes from the slice if it ends in it
+        try:
+            value, end = c_scan_once(
+                string[idx:idx + DECODE_CHUNK_CHARS], 0)
+            return value, idx + end
+        except (StopIteration, ValueError):
+            pass
+        if nextchar == '{':
+            return json.decoder.JSONObject(
+                (string, idx + 1), decoder.strict, scan_once,
+                decoder.object_hook, decoder.object_pairs_hook, memo)
+        return json.decoder.JSONArray((string, idx + 1), scan_once)
+
+    decoder.scan_once = scan_once
+    return decoder.decode(str(data, 'utf8'))
+
+
+def decode_json_async(data: bytes, callback: typing.Callable,
+                      *callback_args, prepare: typing.Callable = None):
+    '''
+    Decode the json, then call `callback(json, *callback_args)`.
+
+    Small bodies are decoded straight away, big ones on a worker thread.
+    Either way, the callback is called on the main thread.
+
+    If given, `prepare(json)` is run on a worker thread as soon as the json
+    is decoded, at the same time as the callback.  It must only read the
+    json, and not touch GTK.
+    '''
+    if len(data) < DECODE_IN_THREAD_BYTES:
+        j = json.loads(str(data, 'utf8'))
+        if prepare is not None:
+            run_in_background(prepare, j)
+        callback(j, *callback_args)
+    else:
+        run_in_thread(_decode_and_prepare, (data, prepare),
+                      callback, *callback_args)
+
+
+def _decode_and_prepare(data: bytes, prepare: typing.Callable):
+    j = decode_json(data)
+    if prepare is not None:
+        run_in_background(prepare, j)
+    return j
+
+
+class SlicedJob():
+    '''
+    Runs a generator on the main loop, as many steps as fit in the budget
+    each time the main loop is idle.  So GTK gets to draw (and handle
+    input) between the slices, however long the job is.
+
+    Args:
+        steps (iterator):  each step yields the fraction of the job that is
+            done, from 0 to 1
+        progress_callback (function):  called with the fraction after each
+            slice, and with 1 once the job is done
+        budget (float):  seconds per slice
+        time_func, idle_add:  dependencies, for testing
+    '''
+
+    def __init__(self, steps: typing.Iterator[float],
+                 progress_callback: typing.Callable[[float], None] = None,
+                 budget: float = SLICE_BUDGET,
+                 time_func: typing.Callable[[], float] = time.monotonic,
+                 idle_add=GLib.idle_add):
+        self._steps = steps
+        self._progress_callback = progress_callback
+        self._budget = budget
+        self._time = time_func
+        self.done = False
+        self.cancelled = False
+        idle_add(self.__idle_cb)
+
+    def cancel(self):
+        '''
+        Don't run any more steps
+        '''
+        self.cancelled = True
+
+    def __idle_cb(self):
+        if self.cancelled:
+            return False
+
+        deadline = self._time() + self._budget
+        progress = 0
+        while True:
+            try:
+                progress = next(self._steps)
+            except StopIteration:
+                self.done = True
+                if self._progress_callback is not None:
+                    self._progress_callback(1)
+                return False
+            if self.cancelled:
+                return False
+            if self._time() >= deadline:
+                break
+
+        if self._progress_callback is not None:
+            self._progress_callback(progress)
+        return True